@@ -0,0 +1,322 @@
+"""
+Load test of the AccountLinker refresh against the stand-in API (`benchmarks.fake_ow_api`) and a fake guild.
+
+For every size, the bot runs in a fresh temporary folder (copy of `config/default`, empty `data/`)
+with that many linked members, and the refresh loop runs two passes over all of them:
+the first one with an empty cache, then a repeat one after the cache expired, like the daily refreshes.
+Discord isnt called, the fake members count what would have been sent instead.
+The rate limits are lifted unless given, so this measures the bot and not the limits.
+
+Run from the bot folder: python -m benchmarks.account_linker_load
+or for one size with options: python -m benchmarks.account_linker_load --accounts 10000 --latency-ms 150
+"""
+
+import argparse
+import asyncio
+import collections
+import datetime
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import TYPE_CHECKING, Counter, Dict, List, Optional
+
+import nextcord
+from aiohttp import web
+from aiohttp.test_utils import unused_port
+
+from benchmarks.fake_ow_api import FakeApiOptions, make_app
+from internal_tools.concurrency import TokenBucket
+from internal_tools.config_snapshots import SNAPSHOTS
+from internal_tools.http import HttpClient
+
+if TYPE_CHECKING:
+    from cogs.account_linker import AccountLinker
+
+SIZES = [1_000, 10_000, 100_000]
+GUILD_ID = 1
+FIRST_USER_ID = 100000000000000000
+
+
+class FakeRole:
+    __slots__ = ("id",)
+
+    def __init__(self, id: int):
+        self.id = id
+
+    def is_default(self) -> bool:
+        # Like in Discord, @everyone has the id of the guild
+        return self.id == GUILD_ID
+
+
+class FakeMember:
+    __slots__ = ("id", "guild", "roles")
+
+    def __init__(self, id: int, guild: "FakeGuild"):
+        self.id = id
+        self.guild = guild
+        self.roles = [guild.default_role]
+
+    async def edit(self, *, roles: List[nextcord.abc.Snowflake]):
+        await self.guild.discord_call("member.edit")
+        self.roles = [self.guild.default_role] + [
+            self.guild.roles[role.id] for role in roles
+        ]
+
+    async def send(self, content: str):
+        await self.guild.discord_call("member.send")
+
+
+class FakeGuild:
+    """
+    Just enough of a `nextcord.Guild` for the refresh, every call that would go to Discord is counted in `calls`.
+    """
+
+    def __init__(self, role_ids: List[int], discord_latency_ms: float):
+        self.id = GUILD_ID
+        self.default_role = FakeRole(GUILD_ID)
+        self.roles = {role_id: FakeRole(role_id) for role_id in role_ids}
+        self.members: Dict[int, FakeMember] = {}
+        self.calls: Counter[str] = collections.Counter()
+        self.discord_latency_ms = discord_latency_ms
+
+    async def discord_call(self, name: str):
+        self.calls[name] += 1
+        if self.discord_latency_ms:
+            await asyncio.sleep(self.discord_latency_ms / 1000)
+
+    def get_role(self, id: int) -> Optional[FakeRole]:
+        return self.roles.get(id)
+
+    def get_member(self, id: int) -> Optional[FakeMember]:
+        return self.members.get(id)
+
+    async def fetch_member(self, id: int) -> FakeMember:
+        await self.discord_call("guild.fetch_member")
+        raise LookupError(id)
+
+
+class FakeBot:
+    def __init__(self, guild: FakeGuild):
+        self.guild = guild
+
+    def get_guild(self, id: int) -> FakeGuild:
+        return self.guild
+
+
+def fake_overwatch_roles() -> dict:
+    heroes = SNAPSHOTS.account_linker.heroes
+    classes = sorted({hero.hero_class for hero in heroes})
+
+    return {
+        "MAIN_ROLE_IDS": {hero.name: 1000 + i for i, hero in enumerate(heroes)},
+        "HERO_ROLE_IDS": {hero.name: 2000 + i for i, hero in enumerate(heroes)},
+        "CLASS_ROLE_IDS": {
+            hero_class: 3000 + i for i, hero_class in enumerate(classes)
+        },
+        "TOP_3_SEPERATOR_ROLE_ID": 4000,
+        "OTHER_SEPERATOR_ROLE_ID": 4001,
+    }
+
+
+def percentile_ms(timings: List[float], percentile: int) -> float:
+    if len(timings) < 2:
+        return timings[0] * 1000 if timings else 0.0
+
+    return statistics.quantiles(timings, n=100)[percentile - 1] * 1000
+
+
+def make_all_due(cog: "AccountLinker", user_ids):
+    moment = datetime.datetime.utcnow() - datetime.timedelta(minutes=1)
+    for user_id in user_ids:
+        cog.refresh_scheduler.next_due[user_id] = moment
+    cog.refresh_schedule.save()
+
+
+async def run_pass(cog: "AccountLinker", guild: FakeGuild, label: str, app) -> None:
+    results: Counter[str] = collections.Counter()
+    timings: List[float] = []
+    refresh_account = cog.refresh_account
+
+    async def timed(job):
+        started = time.perf_counter()
+        try:
+            result = await refresh_account(job)
+            results[result] += 1
+            return result
+        finally:
+            timings.append(time.perf_counter() - started)
+
+    cog.refresh_engine.handle = timed
+    calls_before = collections.Counter(guild.calls)
+    requests_before = app["requests"] if app is not None else 0
+    not_modified_before = app["not_modified"] if app is not None else 0
+
+    started = time.perf_counter()
+    await cog.update_overwatch_roles()
+    elapsed = time.perf_counter() - started
+
+    calls = guild.calls - calls_before
+    processed = sum(results.values())
+    print(
+        f"  {label}: {elapsed:.1f} s, {processed / elapsed:.0f} accounts/s,"
+        f" p50 {percentile_ms(timings, 50):.1f} ms, p99 {percentile_ms(timings, 99):.1f} ms"
+    )
+    print(f"    results: {dict(sorted(results.items()))}")
+    if app is not None:
+        print(
+            f"    API requests: {app['requests'] - requests_before},"
+            f" {app['not_modified'] - not_modified_before} answered with 304"
+        )
+    print(f"    Discord calls: {sum(calls.values())} {dict(sorted(calls.items()))}")
+
+
+async def run(args: argparse.Namespace):
+    # Only imported in the temporary folder, loading the config of the Cog writes to config/
+    import cogs.account_linker as account_linker
+
+    app = runner = None
+    api_url = args.api_url
+    if api_url is None:
+        app = make_app(
+            FakeApiOptions(
+                latency_ms=args.latency_ms,
+                jitter_ms=args.jitter_ms,
+                error_rate=args.error_rate,
+                private_ratio=args.private_ratio,
+                unknown_hero_ratio=args.unknown_hero_ratio,
+            )
+        )
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        port = unused_port()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        api_url = f"http://127.0.0.1:{port}/v3"
+
+    roles = fake_overwatch_roles()
+    guild = FakeGuild(
+        [
+            *roles["MAIN_ROLE_IDS"].values(),
+            *roles["HERO_ROLE_IDS"].values(),
+            *roles["CLASS_ROLE_IDS"].values(),
+            roles["TOP_3_SEPERATOR_ROLE_ID"],
+            roles["OTHER_SEPERATOR_ROLE_ID"],
+        ],
+        args.discord_latency_ms,
+    )
+
+    # Webhooks count as Discord calls too
+    async def error_webhook_send(txt_or_error):
+        await guild.discord_call("webhook.send")
+
+    account_linker.error_webhook_send = error_webhook_send
+
+    http = HttpClient()
+    http.start()
+    cog = account_linker.AccountLinker(FakeBot(guild), http)  # type: ignore
+    cog.overwatch_api.base_url = api_url
+    cog.overwatch_api.rate_limit = TokenBucket(
+        args.api_requests_per_second, max(int(args.api_requests_per_second), 1)
+    )
+    cog.role_edit_rate_limit = TokenBucket(
+        args.role_edits_per_second, max(int(args.role_edits_per_second), 1)
+    )
+    cog.refresh_engine.worker_count = args.workers
+    cog.overwatch_roles.update(roles)
+
+    accounts = {}
+    for i in range(args.accounts):
+        user_id = FIRST_USER_ID + i
+        guild.members[user_id] = FakeMember(user_id, guild)
+        accounts[user_id] = {"platform": "pc", "account_name": f"Player#{i:05}"}
+    cog.accounts.update(accounts)
+    cog.accounts.save()
+    cog.refresh_scheduler.sync(accounts)
+    make_all_due(cog, accounts)
+
+    print(f"{args.accounts} accounts, {args.workers} workers, API at {api_url}")
+    try:
+        await run_pass(cog, guild, "first pass", app)
+
+        # Everything due again, with an expired cache, so every profile gets revalidated
+        cog.overwatch_api.ttl_seconds = 0
+        cog.overwatch_api.stale_seconds = 0
+        cog.overwatch_api.private_ttl_seconds = 0
+        make_all_due(cog, accounts)
+
+        await run_pass(cog, guild, "repeat pass", app)
+    finally:
+        cog.cog_unload()
+        await http.close()
+        if runner is not None:
+            await runner.cleanup()
+
+    peak_mib = peak_memory_mib()
+    if peak_mib is not None:
+        print(f"  peak memory: {peak_mib:.0f} MiB")
+
+
+def peak_memory_mib() -> Optional[float]:
+    """
+    The most memory this process had at once, None on Windows, which doesnt have `resource`.
+    Not tracemalloc, that would slow down the passes that get timed.
+    """
+    if sys.platform != "win32":
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Bytes on macOS, KiB everywhere else
+        return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load test of the AccountLinker refresh against the stand-in API and a fake guild."
+    )
+    parser.add_argument("--accounts", type=int, help="Only this size, in this process")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--api-url", help="Use this API instead of starting one")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--private-ratio", type=float, default=0.1)
+    parser.add_argument("--unknown-hero-ratio", type=float, default=0.0)
+    parser.add_argument("--discord-latency-ms", type=float, default=0.0)
+    parser.add_argument("--api-requests-per-second", type=float, default=1_000_000)
+    parser.add_argument("--role-edits-per-second", type=float, default=1_000_000)
+    args = parser.parse_args()
+
+    if args.accounts is None:
+        # Every size in its own process, so the peak memory is its own
+        for size in SIZES:
+            subprocess.run(
+                [sys.executable, "-m", "benchmarks.account_linker_load"]
+                + ["--accounts", str(size)]
+                + sys.argv[1:],
+                check=True,
+            )
+        return
+
+    bot_folder = os.getcwd()
+    work_folder = tempfile.mkdtemp(prefix="account_linker_load_")
+    try:
+        shutil.copytree(
+            os.path.join(bot_folder, "config", "default"),
+            os.path.join(work_folder, "config", "default"),
+        )
+        os.makedirs(os.path.join(work_folder, "data"))
+        os.chdir(work_folder)
+
+        asyncio.run(run(args))
+    finally:
+        os.chdir(bot_folder)
+        shutil.rmtree(work_folder, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
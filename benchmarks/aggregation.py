@@ -0,0 +1,180 @@
+"""
+Playtime aggregation of Career Profiles: the old inline code vs. `aggregate_playtime` + `pick_roles`.
+
+Uses the profiles recorded in the Career Profile cache (`data/profile_cache.sqlite3`) if there are any,
+otherwise generated profiles shaped like ow-api.com answers.
+
+Run from the bot folder: python -m benchmarks.aggregation
+"""
+
+import datetime
+import os
+import random
+import sqlite3
+import statistics
+import time
+from typing import Dict, List
+
+import orjson
+
+from internal_tools.config_snapshots import SNAPSHOTS
+from internal_tools.configuration import CONFIG
+from internal_tools.playtime import GAMEMODES, aggregate_playtime, pick_roles
+
+GENERATED_PROFILES = 2_000
+RUNS = 5
+
+
+def legacy_aggregate(data: dict):
+    """
+    The aggregation like `assign_overwatch_roles` did it before.
+    """
+    played_amounts: Dict[str, datetime.timedelta] = {}
+    class_amounts: Dict[str, datetime.timedelta] = {}
+    for gamemode_stats in GAMEMODES:
+        for api_hero, stats in data[gamemode_stats]["careerStats"].items():
+            if api_hero == "allHeroes":
+                continue
+
+            if api_hero not in [
+                x["API_NAME"] for x in CONFIG["ACCOUNT_LINKER"]["HEROES"].values()
+            ]:
+                continue
+
+            hero_name = None
+            hero_class = None
+            for hero, vals in CONFIG["ACCOUNT_LINKER"]["HEROES"].items():
+                if api_hero == vals["API_NAME"]:
+                    hero_name = hero
+                    hero_class = vals["CLASS"]
+                    break
+
+            raw_time: str = stats["game"]["timePlayed"]
+            if raw_time.count(":") == 1:
+                hours = "0"
+                minutes, seconds = raw_time.split(":")
+            elif raw_time.count(":") == 2:
+                hours, minutes, seconds = raw_time.split(":")
+            else:
+                return None
+
+            time_amount = datetime.timedelta(
+                hours=int(hours), minutes=int(minutes), seconds=int(seconds)
+            )
+
+            if hero_name not in played_amounts:
+                played_amounts[hero_name] = datetime.timedelta()  # type: ignore
+            played_amounts[hero_name] += time_amount  # type: ignore
+
+            if hero_class not in class_amounts:
+                class_amounts[hero_class] = datetime.timedelta()  # type: ignore
+            class_amounts[hero_class] += time_amount  # type: ignore
+
+    if len(played_amounts) == 0 or len(class_amounts) == 0:
+        return None
+
+    main_hero = max(played_amounts, key=played_amounts.get)  # type: ignore
+    del played_amounts[main_hero]
+
+    top_3_heroes = []
+    for _ in range(3):
+        if len(played_amounts) == 0:
+            break
+
+        key = max(played_amounts, key=played_amounts.get)  # type: ignore
+        top_3_heroes.append(key)
+
+        del played_amounts[key]
+
+    most_played_class = max(class_amounts, key=class_amounts.get)  # type: ignore
+
+    return main_hero, tuple(top_3_heroes), most_played_class
+
+
+def current_aggregate(data: dict):
+    playtime = aggregate_playtime(data, SNAPSHOTS.account_linker.heroes_by_api_name)
+    if playtime is None:
+        return None
+
+    outcome = pick_roles(playtime)
+    if outcome is None:
+        return None
+
+    return outcome.main_hero, outcome.top_3_heroes, outcome.most_played_class
+
+
+def recorded_profiles() -> List[dict]:
+    if not os.path.exists("data/profile_cache.sqlite3"):
+        return []
+
+    connection = sqlite3.connect("data/profile_cache.sqlite3")
+    try:
+        profiles = [
+            orjson.loads(row[0])
+            for row in connection.execute("SELECT body FROM responses")
+        ]
+    finally:
+        connection.close()
+
+    return [
+        profile
+        for profile in profiles
+        if not profile.get("private") and all([g in profile for g in GAMEMODES])
+    ]
+
+
+def generated_profiles() -> List[dict]:
+    rng = random.Random(8527)
+    api_names = [hero.api_name for hero in SNAPSHOTS.account_linker.heroes]
+
+    def time_played():
+        seconds = rng.randint(1, 300 * 3600)
+        if seconds < 3600:
+            return f"{seconds // 60:02}:{seconds % 60:02}"
+        return f"{seconds // 3600}:{seconds // 60 % 60:02}:{seconds % 60:02}"
+
+    def career_stats():
+        heroes = rng.sample(api_names, rng.randint(5, len(api_names)))
+        stats = {"allHeroes": {"game": {"timePlayed": "999:00:00"}}}
+        for api_name in heroes:
+            stats[api_name] = {"game": {"timePlayed": time_played()}}
+
+        return {"careerStats": stats}
+
+    return [
+        {"private": False, **{gamemode: career_stats() for gamemode in GAMEMODES}}
+        for _ in range(GENERATED_PROFILES)
+    ]
+
+
+def median_ms(func, profiles: List[dict]):
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        for profile in profiles:
+            func(profile)
+        timings.append(time.perf_counter() - start)
+
+    return statistics.median(timings) * 1000
+
+
+def main():
+    profiles = recorded_profiles()
+    source = "recorded"
+    if not profiles:
+        profiles = generated_profiles()
+        source = "generated"
+
+    for profile in profiles:
+        assert legacy_aggregate(profile) == current_aggregate(profile)
+
+    legacy = median_ms(legacy_aggregate, profiles)
+    current = median_ms(current_aggregate, profiles)
+
+    print(f"{len(profiles)} {source} profiles, median of {RUNS} runs:")
+    print(f"  old inline aggregation: {legacy:8.1f} ms")
+    print(f"  aggregate_playtime:     {current:8.1f} ms ({legacy / current:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Stand-in for ow-api.com, serving made up Career Profiles for load tests.
+
+Every account name always gets the same profile, so repeated passes look like players whose stats didnt change.
+Answers have an ETag and 304 conditional requests like the real API.
+
+Run from the bot folder: python -m benchmarks.fake_ow_api --port 8080 --latency-ms 150 --error-rate 0.01
+and set ACCOUNT_LINKER.API_BASE_URL to http://127.0.0.1:8080/v3 to point the bot at it.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import random
+from dataclasses import dataclass
+from typing import List
+
+import orjson
+from aiohttp import web
+
+from internal_tools.config_snapshots import SNAPSHOTS
+from internal_tools.playtime import GAMEMODES
+
+UNKNOWN_API_HEROES = ["futureHero", "anotherFutureHero"]
+
+
+@dataclass
+class FakeApiOptions:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    private_ratio: float = 0.1
+    unknown_hero_ratio: float = 0.0
+    seed: int = 8527
+
+
+def _time_played(rng: random.Random) -> str:
+    seconds = rng.randint(1, 300 * 3600)
+    if seconds < 3600:
+        return f"{seconds // 60:02}:{seconds % 60:02}"
+    return f"{seconds // 3600}:{seconds // 60 % 60:02}:{seconds % 60:02}"
+
+
+def _career_stats(rng: random.Random, api_names: List[str]) -> dict:
+    heroes = rng.sample(api_names, rng.randint(5, len(api_names)))
+    stats = {"allHeroes": {"game": {"timePlayed": "999:00:00"}}}
+    for api_name in heroes:
+        stats[api_name] = {"game": {"timePlayed": _time_played(rng)}}
+
+    return {"careerStats": stats}
+
+
+def make_profile(options: FakeApiOptions, name: str, document: str) -> dict:
+    """
+    The made up answer for `name`, the same every time for the same options.
+    """
+    rng = random.Random(f"{options.seed}:{name}")
+    private = rng.random() < options.private_ratio
+
+    profile = {
+        "name": name.replace("-", "#"),
+        "level": rng.randint(1, 500),
+        "endorsement": rng.randint(1, 5),
+        "private": private,
+    }
+    if document == "profile" or private:
+        return profile
+
+    api_names = [hero.api_name for hero in SNAPSHOTS.account_linker.heroes]
+    if rng.random() < options.unknown_hero_ratio:
+        api_names += UNKNOWN_API_HEROES
+
+    for gamemode in GAMEMODES:
+        profile[gamemode] = _career_stats(rng, api_names)
+
+    return profile
+
+
+def make_app(options: FakeApiOptions) -> web.Application:
+    """
+    `app["requests"]` counts the requests, `app["not_modified"]` the ones answered with a 304.
+    """
+    app = web.Application()
+    app["requests"] = 0
+    app["not_modified"] = 0
+    errors = random.Random(options.seed)
+
+    async def stats(request: web.Request):
+        app["requests"] += 1
+
+        if options.latency_ms or options.jitter_ms:
+            jitter = errors.uniform(-options.jitter_ms, options.jitter_ms)
+            await asyncio.sleep(max(options.latency_ms + jitter, 0) / 1000)
+
+        if errors.random() < options.error_rate:
+            return web.json_response(
+                {"error": "Fake upstream error"}, status=errors.choice([500, 503])
+            )
+
+        document = request.match_info["document"]
+        if document not in ("complete", "profile"):
+            return web.json_response({"error": "Not found"}, status=404)
+
+        body = orjson.dumps(make_profile(options, request.match_info["name"], document))
+        etag = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+        if request.headers.get("If-None-Match") == etag:
+            app["not_modified"] += 1
+            return web.Response(status=304, headers={"ETag": etag})
+
+        return web.Response(
+            body=body, content_type="application/json", headers={"ETag": etag}
+        )
+
+    app.router.add_get("/v3/stats/{platform}/{name}/{document}", stats)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Stand-in for ow-api.com, serving made up Career Profiles for load tests."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--private-ratio", type=float, default=0.1)
+    parser.add_argument("--unknown-hero-ratio", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=8527)
+    args = parser.parse_args()
+
+    options = FakeApiOptions(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        private_ratio=args.private_ratio,
+        unknown_hero_ratio=args.unknown_hero_ratio,
+        seed=args.seed,
+    )
+    web.run_app(make_app(options), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
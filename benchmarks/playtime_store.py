@@ -0,0 +1,166 @@
+"""
+`PlaytimeStore` with 100k users: memory, writing rows, the server-wide queries and the snapshots,
+with the sums it keeps checked against going over all users.
+
+Run from the bot folder: python -m benchmarks.playtime_store
+"""
+
+import datetime
+import os
+import random
+import shutil
+import statistics
+import time
+import tracemalloc
+
+from internal_tools.config_snapshots import SNAPSHOTS
+from internal_tools.playtime_store import PlaytimeStore, playtime_report
+
+NAME = "benchmark_playtime"
+USERS = 100_000
+RUNS = 5
+
+
+def median_ms(func):
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    return statistics.median(timings) * 1000
+
+
+def remove_files():
+    os.makedirs("data", exist_ok=True)
+    shutil.rmtree(f"data/{NAME}_history", ignore_errors=True)
+    for entry in os.scandir("data"):
+        if entry.name.startswith(f"{NAME}."):
+            os.remove(entry.path)
+
+
+def scan_seconds(store: PlaytimeStore):
+    return {api_name: sum(column) for api_name, column in store.columns.items()}
+
+
+def scan_players(store: PlaytimeStore):
+    return {
+        api_name: len(column) - column.count(0)
+        for api_name, column in store.columns.items()
+    }
+
+
+def make_store() -> PlaytimeStore:
+    account_linker_config = SNAPSHOTS.account_linker
+
+    return PlaytimeStore(
+        NAME,
+        api_names=[hero.api_name for hero in account_linker_config.heroes],
+        snapshot_every=datetime.timedelta(days=7),
+        keep_snapshots=3,
+    )
+
+
+def main():
+    rng = random.Random(8527)
+    api_names = [hero.api_name for hero in SNAPSHOTS.account_linker.heroes]
+    rows = {
+        100000000000000000
+        + i: {
+            api_name: rng.randint(1, 300 * 3600)
+            for api_name in rng.sample(api_names, rng.randint(5, len(api_names)))
+        }
+        for i in range(USERS)
+    }
+
+    remove_files()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    store = make_store()
+    for user_id, row in rows.items():
+        store[user_id] = row
+    store_bytes = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    # Again without tracemalloc, which slows everything down
+    store = make_store()
+    started = time.perf_counter()
+    for user_id, row in rows.items():
+        store[user_id] = row
+    write_seconds = time.perf_counter() - started
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    as_dicts = {user_id: dict(row) for user_id, row in rows.items()}
+    dict_bytes = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    def dict_totals():
+        totals = dict.fromkeys(api_names, 0)
+        for row in as_dicts.values():
+            for api_name, seconds in row.items():
+                totals[api_name] += seconds
+        return totals
+
+    assert store.column_seconds == dict_totals()
+    assert store.get(100000000000000042) == {
+        api_name: rows[100000000000000042][api_name]
+        for api_name in api_names
+        if api_name in rows[100000000000000042]
+    }
+
+    store.save()
+    store.snapshot_if_due()
+    snapshot = store.snapshots()[-1]
+    assert snapshot.column_seconds == store.column_seconds
+
+    # A week later: everyone played a bit more, some left, some are new
+    for user_id in list(rows)[:1000]:
+        store.pop(user_id)
+    for i in range(1000):
+        store[200000000000000000 + i] = {api_names[0]: 1000 * 3600}
+    for user_id in list(rows)[1000:]:
+        store[user_id] = {
+            api_name: seconds + 60 for api_name, seconds in rows[user_id].items()
+        }
+
+    gained = store.gained_since(snapshot)
+    assert sum(gained.values()) == sum(
+        len(row) * 60 for row in list(rows.values())[1000:]
+    )
+    store.save()
+    for checked in [store, make_store()]:
+        assert checked.column_seconds == scan_seconds(checked)
+        assert checked.column_players == scan_players(checked)
+
+    print(f"{USERS} users, {len(store.columns)} heroes, median of {RUNS} runs:")
+    print(
+        f"  memory: dict of dicts {dict_bytes / USERS:5.0f} B/user,"
+        f" PlaytimeStore {store_bytes / USERS:5.0f} B/user"
+    )
+    print(
+        f"  writing all rows: {write_seconds * 1000:.0f} ms ({USERS / write_seconds:.0f} rows/s)"
+    )
+    print(
+        f"  totals per hero: dict of dicts {median_ms(dict_totals):7.1f} ms,"
+        f" scanning the columns {median_ms(lambda: scan_seconds(store)):7.1f} ms"
+    )
+    print(
+        f"  gained since a snapshot (1000 left, 1000 new): {median_ms(lambda: store.gained_since(snapshot)):7.1f} ms"
+    )
+    print(
+        f"  /playtime-stats report:                     {median_ms(lambda: playtime_report(store, SNAPSHOTS.account_linker.heroes_by_api_name, snapshot)):7.1f} ms"
+    )
+
+    print(
+        f"  file {os.path.getsize(store.filename) / 1024 / 1024:.1f} MiB,"
+        f" save {median_ms(lambda: (setattr(store, '_dirty', True), store.flush())):.1f} ms,"
+        f" load {median_ms(lambda: make_store().close()):.1f} ms"
+    )
+
+    store.close()
+    remove_files()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Size and round trip time of the data stores in every on-disk format.
+
+Run from the bot folder: python -m benchmarks.storage_formats
+"""
+
+import datetime
+import os
+import statistics
+import time
+
+from internal_tools.configuration import JsonDictSaver
+from internal_tools.database import SqliteDictSaver
+
+ENTRIES = 100_000
+RUNS = 5
+
+STORES = {
+    "linked_accounts": (
+        {int: {"platform": str, "account_name": str}},
+        {
+            100000000000000000
+            + i: {
+                "platform": "pc",
+                "account_name": f"Player#{i:05}",
+            }
+            for i in range(ENTRIES)
+        },
+    ),
+    "notifications": (
+        {
+            "CAREER_PROFILE_PRIVATE": {int: datetime.datetime},
+            "AUTOMATIC_ROLES": {int: datetime.datetime},
+        },
+        {
+            "CAREER_PROFILE_PRIVATE": {
+                100000000000000000
+                + i: datetime.datetime(2024, 1, 1)
+                + datetime.timedelta(seconds=i)
+                for i in range(ENTRIES // 4)
+            },
+            "AUTOMATIC_ROLES": {
+                200000000000000000
+                + i: datetime.datetime(2024, 1, 1)
+                + datetime.timedelta(seconds=i)
+                for i in range(ENTRIES)
+            },
+        },
+    ),
+}
+
+
+def median_ms(func):
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    return statistics.median(timings) * 1000
+
+
+def remove_files(name: str):
+    for entry in os.scandir("data"):
+        if entry.name.startswith(f"{name}."):
+            os.remove(entry.path)
+
+
+def measure_json_saver(name: str, schema, data, file_format):
+    saver = JsonDictSaver(name, schema=schema, file_format=file_format)
+    saver.update(data)
+    any_key = next(iter(data))
+
+    def save():
+        saver.mark_dirty(any_key)  # Unchanged data would skip the write
+        saver.save()
+
+    save = median_ms(save)
+    load = median_ms(
+        lambda: JsonDictSaver(name, schema=schema, file_format=file_format)
+    )
+    size = os.path.getsize(saver.filename)
+
+    return size, save, load
+
+
+def measure_sqlite_saver(name: str, schema, data):
+    namespaces = [key for key in schema if isinstance(key, str)]
+    saver = SqliteDictSaver(name, namespaces=namespaces, schema=schema)
+
+    start = time.perf_counter()
+    saver.update(data)
+    saver.save()
+    save = (time.perf_counter() - start) * 1000
+
+    saver.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    size = os.path.getsize(saver.filename)
+    saver.close()
+
+    load = median_ms(
+        lambda: SqliteDictSaver(name, namespaces=namespaces, schema=schema).close()
+    )
+
+    return size, save, load
+
+
+def main():
+    for store, (schema, data) in STORES.items():
+        name = f"benchmark_{store}"
+        print(f"{store} ({ENTRIES} entries), median of {RUNS} runs:")
+
+        results = {}
+        for file_format in ["json", "binary"]:
+            results[f"JsonDictSaver {file_format}"] = measure_json_saver(
+                name, schema, data, file_format
+            )
+            remove_files(name)
+
+        results["SqliteDictSaver (full insert, lazy load)"] = measure_sqlite_saver(
+            name, schema, data
+        )
+        remove_files(name)
+
+        for label, (size, save, load) in results.items():
+            print(
+                f"  {label:42} {size / 1024:9.0f} KiB  save {save:7.1f} ms  load {load:7.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
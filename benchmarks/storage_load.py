@@ -0,0 +1,58 @@
+"""
+Load time of a 100k entry `linked_accounts` file, guessing the types vs. using a schema.
+
+Run from the bot folder: python -m benchmarks.storage_load
+"""
+
+import os
+import statistics
+import time
+
+import orjson
+
+from internal_tools.configuration import JsonDictSaver
+
+NAME = "benchmark_linked_accounts"
+ENTRIES = 100_000
+RUNS = 5
+
+LINKED_ACCOUNTS_SCHEMA = {int: {"platform": str, "account_name": str}}
+
+
+def measure(**kwargs):
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        JsonDictSaver(NAME, **kwargs)
+        timings.append(time.perf_counter() - start)
+
+    return statistics.median(timings)
+
+
+def main():
+    data = {
+        100000000000000000 + i: {"platform": "pc", "account_name": f"Player#{i:05}"}
+        for i in range(ENTRIES)
+    }
+    filename = f"data/{NAME}.json"
+    with open(filename, "wb") as f:
+        f.write(
+            orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        )
+
+    try:
+        guessed = measure()
+        with_schema = measure(schema=LINKED_ACCOUNTS_SCHEMA)
+        raw = measure(auto_convert_data=False)
+    finally:
+        os.remove(filename)
+
+    print(f"{ENTRIES} linked accounts, median of {RUNS} loads:")
+    print(f"  guessed types: {guessed * 1000:8.1f} ms")
+    print(f"  schema:        {with_schema * 1000:8.1f} ms")
+    print(f"  no conversion: {raw * 1000:8.1f} ms (just parsing)")
+    print(f"  speedup:       {guessed / with_schema:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
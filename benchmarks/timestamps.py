@@ -0,0 +1,205 @@
+"""
+Notification times (user id -> time) kept as a dict of `datetime`s, in a `SqliteDictSaver` namespace
+and in a `TimestampTable`: memory per entry, "who is due" queries and loading. Also checks that the
+times survive the migration from the JSON file the bot used before.
+
+Run from the bot folder: python -m benchmarks.timestamps
+"""
+
+import datetime
+import heapq
+import os
+import random
+import statistics
+import time
+import tracemalloc
+
+import orjson
+
+from internal_tools.database import SqliteDictSaver
+from internal_tools.timestamps import TimestampStore, TimestampTable, to_epoch
+
+NAME = "benchmark_notifications"
+ENTRIES = 100_000
+RUNS = 5
+LIMIT = 100
+
+
+def median_ms(func):
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    return statistics.median(timings) * 1000
+
+
+def allocated_bytes(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    del kept
+    return after - before
+
+
+def remove_files():
+    os.makedirs("data", exist_ok=True)
+    for entry in os.scandir("data"):
+        if entry.name.startswith(f"{NAME}."):
+            os.remove(entry.path)
+
+
+def check_json_migration(times):
+    # The format from before SQLite: ISO strings keyed by the user id, plus a journal record on top
+    automatic_roles = dict(list(times.items())[:1000])
+    with open(f"data/{NAME}.json", "wb") as f:
+        f.write(
+            orjson.dumps(
+                {
+                    "CAREER_PROFILE_PRIVATE": {},
+                    "AUTOMATIC_ROLES": {
+                        str(user_id): moment.isoformat()
+                        for user_id, moment in automatic_roles.items()
+                    },
+                }
+            )
+        )
+    journaled = datetime.datetime(2024, 3, 1, 12)
+    with open(f"data/{NAME}.journal", "wb") as f:
+        f.write(
+            orjson.dumps(
+                [
+                    "s",
+                    {
+                        "AUTOMATIC_ROLES": {
+                            str(user_id): moment.isoformat()
+                            for user_id, moment in {
+                                **automatic_roles,
+                                42: journaled,
+                            }.items()
+                        }
+                    },
+                ]
+            )
+            + b"\n"
+        )
+
+    tables = ["CAREER_PROFILE_PRIVATE", "AUTOMATIC_ROLES", "REMIND_AT"]
+    for store in [
+        TimestampStore(NAME, tables=tables),
+        TimestampStore(NAME, tables=tables),
+    ]:
+        assert len(store["AUTOMATIC_ROLES"]) == len(automatic_roles) + 1
+        assert store["AUTOMATIC_ROLES"].get(42) == to_epoch(journaled)
+        assert all(
+            store["AUTOMATIC_ROLES"].get(user_id) == to_epoch(moment)
+            for user_id, moment in automatic_roles.items()
+        )
+        assert len(store["CAREER_PROFILE_PRIVATE"]) == 0
+    assert os.path.exists(f"data/{NAME}.json.migrated")
+    assert not os.path.exists(f"data/{NAME}.json")
+    remove_files()
+
+
+def main():
+    rng = random.Random(8527)
+    start = datetime.datetime(2024, 1, 1)
+    times = {
+        100000000000000000
+        + i: start
+        + datetime.timedelta(seconds=rng.randint(0, 60 * 24 * 3600))
+        for i in range(ENTRIES)
+    }
+    epochs = {user_id: to_epoch(moment) for user_id, moment in times.items()}
+    moment = start + datetime.timedelta(days=30)
+    moment_epoch = to_epoch(moment)
+
+    def build_dict():
+        return {
+            user_id: datetime.datetime.fromtimestamp(
+                epoch, datetime.timezone.utc
+            ).replace(tzinfo=None)
+            for user_id, epoch in epochs.items()
+        }
+
+    def build_table():
+        table = TimestampTable()
+        table.update_all(epochs)
+        return table
+
+    as_dict = build_dict()
+    table = build_table()
+
+    remove_files()
+    check_json_migration(times)
+    saver = SqliteDictSaver(
+        NAME,
+        namespaces=["REMIND_AT"],
+        schema={"REMIND_AT": {int: datetime.datetime}},
+    )
+    saver["REMIND_AT"].update(times)
+    saver.save()
+
+    def dict_due():
+        return sorted(
+            [user_id for user_id, due in as_dict.items() if due < moment],
+            key=as_dict.__getitem__,
+        )
+
+    assert set(dict_due()) == set(table.keys_before(moment_epoch))
+    assert len(saver["REMIND_AT"].keys_with_time_before(moment)) == len(dict_due())
+
+    print(f"{ENTRIES} entries, median of {RUNS} runs:")
+    print(
+        f"  memory: dict of datetime {allocated_bytes(build_dict) / ENTRIES:5.0f} B/entry,"
+        f" TimestampTable {allocated_bytes(build_table) / ENTRIES:5.1f} B/entry"
+    )
+
+    print("  all due before T (sorted by time):")
+    print(f"    dict of datetime scan       {median_ms(dict_due):7.2f} ms")
+    print(
+        f"    SqliteDictSaver namespace   {median_ms(lambda: saver['REMIND_AT'].keys_with_time_before(moment)):7.2f} ms"
+    )
+    print(
+        f"    TimestampTable              {median_ms(lambda: table.keys_before(moment_epoch)):7.2f} ms"
+    )
+    print(f"  first {LIMIT} due before T:")
+    print(
+        f"    dict of datetime scan       {median_ms(lambda: heapq.nsmallest(LIMIT, (user_id for user_id, due in as_dict.items() if due < moment), key=as_dict.__getitem__)):7.2f} ms"
+    )
+    print(
+        f"    SqliteDictSaver namespace   {median_ms(lambda: saver['REMIND_AT'].keys_with_time_before(moment, LIMIT)):7.2f} ms"
+    )
+    print(
+        f"    TimestampTable              {median_ms(lambda: table.keys_before(moment_epoch, LIMIT)):7.2f} ms"
+    )
+    print("  count due before T:")
+    print(
+        f"    dict of datetime            {median_ms(lambda: sum(due < moment for due in as_dict.values())):7.2f} ms"
+    )
+    print(
+        f"    SqliteDictSaver namespace   {median_ms(lambda: saver['REMIND_AT'].count_with_time_before(moment)):7.2f} ms"
+    )
+    print(
+        f"    TimestampTable              {median_ms(lambda: table.count_before(moment_epoch)):7.2f} ms"
+    )
+    saver.close()
+    remove_files()
+
+    store = TimestampStore(NAME, tables=["REMIND_AT"])
+    store["REMIND_AT"].update_all(epochs)
+    store.save()
+    print(
+        f"  TimestampStore file {os.path.getsize(store.filename) / 1024:.0f} KiB,"
+        f" save {median_ms(lambda: (store.mark_dirty(), store.save())):.1f} ms,"
+        f" load {median_ms(lambda: TimestampStore(NAME, tables=['REMIND_AT'])):.1f} ms"
+    )
+    remove_files()
+
+
+if __name__ == "__main__":
+    main()
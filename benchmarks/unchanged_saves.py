@@ -0,0 +1,124 @@
+"""
+Checks that `save()` on a store whose data didnt change does no file I/O at all,
+for every storage of `JsonDictSaver` and for `SqliteDictSaver`, also after reading nested values.
+
+Run from the bot folder: python -m benchmarks.unchanged_saves
+"""
+
+import builtins
+import os
+from contextlib import contextmanager
+from typing import Any, Dict, List
+from unittest import mock
+
+from internal_tools.configuration import JsonDictSaver, Schema
+from internal_tools.database import SqliteDictSaver
+
+NAME = "benchmark_unchanged_saves"
+SCHEMA: Dict[Any, Schema] = {
+    int: {"platform": str, "account_name": str, "heroes": [str]}
+}
+DATA = {
+    100000000000000000
+    + i: {
+        "platform": "pc",
+        "account_name": f"Player#{i:05}",
+        "heroes": ["ana", "mercy"],
+    }
+    for i in range(1000)
+}
+
+
+def remove_files():
+    os.makedirs("data", exist_ok=True)
+    for entry in os.scandir("data"):
+        if entry.name.startswith(f"{NAME}."):
+            os.remove(entry.path)
+
+
+def file_states() -> dict:
+    return {
+        entry.name: (entry.stat().st_size, entry.stat().st_mtime_ns)
+        for entry in os.scandir("data")
+        if entry.name.startswith(f"{NAME}.")
+    }
+
+
+@contextmanager
+def no_writes():
+    """
+    Fails on every open() for writing and every os.replace() / os.remove() inside.
+    """
+    writes: List[Any] = []
+    real_open = builtins.open
+
+    def checked_open(file, mode="r", *args, **kwargs):
+        if any(flag in mode for flag in "wax+"):
+            writes.append(("open", file, mode))
+        return real_open(file, mode, *args, **kwargs)
+
+    def record(name):
+        return lambda *args, **kwargs: writes.append((name, *args))
+
+    before = file_states()
+    with mock.patch("builtins.open", checked_open), mock.patch(
+        "os.replace", record("os.replace")
+    ), mock.patch("os.remove", record("os.remove")):
+        yield
+
+    assert not writes, writes
+    assert file_states() == before
+
+
+def read_everything(saver):
+    for value in saver.values():
+        value["account_name"]
+        list(value["heroes"])
+
+
+def check(label: str, saver, total_changes=lambda: 0):
+    saver.update(DATA)
+    saver.save()
+    changes_before = total_changes()
+
+    with no_writes():
+        saver.save()
+        read_everything(saver)
+        saver.save()
+
+    assert total_changes() == changes_before
+
+    # And a nested change still gets written, so the patches above did see the writes
+    try:
+        with no_writes():
+            saver[next(iter(DATA))]["heroes"].append("juno")
+            saver.save()
+    except AssertionError:
+        pass
+    else:
+        raise AssertionError(f"{label}: a nested change wasnt written")
+
+    print(f"  {label:28} ok, {saver.skipped_saves} skipped saves")
+
+
+def main():
+    print("Saving unchanged data twice, after writing it once:")
+
+    for label, kwargs in [
+        ("JsonDictSaver json", {}),
+        ("JsonDictSaver journal", {"storage": "journal"}),
+        ("JsonDictSaver binary", {"file_format": "binary"}),
+    ]:
+        remove_files()
+        check(label, JsonDictSaver(NAME, schema=SCHEMA, **kwargs))
+
+    remove_files()
+    saver = SqliteDictSaver(NAME, schema=SCHEMA)
+    check("SqliteDictSaver", saver, lambda: saver.connection.total_changes)
+    saver.close()
+
+    remove_files()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,19 +2,27 @@ import asyncio
 import logging
 import os
 import sys
+import time
 import traceback
-from typing import Union
+from typing import Dict, Union
 
-import aiohttp
 import nextcord
 from nextcord.ext import application_checks, commands, tasks
 
-from internal_tools.configuration import CONFIG
+from internal_tools.configuration import CONFIG, IMPORT_SECONDS, flush_all_savers
+from internal_tools.http import HTTP_CLIENT
+
+IMPORTS_CPU_SECONDS = time.process_time()
 
 
 async def main():
     logging.basicConfig(filename="bot.log", filemode="w+", level=logging.INFO)
 
+    startup_timings: Dict[str, float] = {
+        "Imports (CPU time)": IMPORTS_CPU_SECONDS,
+        "Import of internal_tools.configuration": IMPORT_SECONDS,
+    }
+
     intents = nextcord.Intents.default()
     intents.members = CONFIG["GENERAL"]["MEMBERS_INTENT"]
     intents.presences = CONFIG["GENERAL"]["PRESENCE_INTENT"]
@@ -38,25 +46,53 @@ async def main():
         for x in os.scandir("cogs")
         if not x.name.startswith("_")
     ]:
+        started = time.perf_counter()
         try:
             bot.load_extension(cog)
             print(f"Loaded: {cog}")
         except Exception as e:
             print(f"{e}")
+        startup_timings[f"Loading {cog}"] = time.perf_counter() - started
+
+    def format_startup_timings():
+        timings = startup_timings.copy()
+        for category, seconds in CONFIG.load_timings.items():
+            timings[f"Config category {category}"] = seconds
+
+        return "\n".join(
+            f"{name}: {seconds * 1000:.1f} ms" for name, seconds in timings.items()
+        )
 
     @bot.event
     async def on_ready():
         await bot.change_presence(activity=nextcord.Game("OW 1.5"))
 
+        if "Connecting until ready" not in startup_timings:
+            startup_timings["Connecting until ready"] = (
+                time.perf_counter() - connect_started
+            )
+            logging.info(f"Startup timings:\n{format_startup_timings()}")
+
         print(f"Online and Ready\nLogged in as {bot.user}")
 
+    @bot.slash_command(
+        name="startup-times",
+        description="Shows how long the parts of the startup took",
+        guild_ids=CONFIG["GENERAL"]["OWNER_COG_GUILD_IDS"],
+    )
+    @application_checks.is_owner()
+    async def show_startup_times(interaction: nextcord.Interaction):
+        await interaction.send(f"```\n{format_startup_timings()}\n```", ephemeral=True)
+
     @bot.slash_command(
         name="reload-all",
-        description="Reloads all Cogs",
+        description="Reloads the config and all Cogs",
         guild_ids=CONFIG["GENERAL"]["OWNER_COG_GUILD_IDS"],
     )
     @application_checks.is_owner()
     async def reload_all_cogs(interaction: nextcord.Interaction):
+        CONFIG.reload()
+
         usable_cogs = [
             "cogs." + x.name.replace(".py", "")
             for x in os.scandir("cogs")
@@ -292,15 +328,21 @@ async def main():
                 return
 
         if CONFIG["GENERAL"]["ERROR_WEBHOOK_URL"]:
-            async with aiohttp.ClientSession() as session:
-                webhook = nextcord.Webhook.from_url(
-                    CONFIG["GENERAL"]["ERROR_WEBHOOK_URL"], session=session
-                )
+            webhook = nextcord.Webhook.from_url(
+                CONFIG["GENERAL"]["ERROR_WEBHOOK_URL"], session=HTTP_CLIENT.session
+            )
+
+            text = "".join(traceback.format_exception(type(original_exception), original_exception, original_exception.__traceback__))  # type: ignore
+            await webhook.send(f"Unpredicted Error:\n```\n{text}\n```")
 
-                text = "".join(traceback.format_exception(type(original_exception), original_exception, original_exception.__traceback__))  # type: ignore
-                await webhook.send(f"Unpredicted Error:\n```\n{text}\n```")
+    HTTP_CLIENT.start()
 
-    await bot.start(CONFIG["GENERAL"]["TOKEN"])
+    connect_started = time.perf_counter()
+    try:
+        await bot.start(CONFIG["GENERAL"]["TOKEN"])
+    finally:
+        await flush_all_savers()
+        await HTTP_CLIENT.close()
 
 
 if __name__ == "__main__":
@@ -1,2 +1,2 @@
-rm -f bot.spec bot.log .timetracker source_code.zip windows_installer.exe ./data/*.json
+rm -f bot.spec bot.log .timetracker source_code.zip windows_installer.exe ./data/*.json ./data/*.journal ./data/*.journal.old ./data/*.sqlite3*
 rm -rf dist/ build/ __pycache__/ cogs/__pycache__ internal_tools/__pycache__
\ No newline at end of file
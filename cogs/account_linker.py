@@ -1,15 +1,45 @@
 import asyncio
 import datetime
-from typing import Dict
+import hashlib
+import io
+import time
+from dataclasses import dataclass
+from typing import List, Set, Tuple
 
-import aiohttp
 import nextcord
-from nextcord.ext import commands, tasks
+import orjson
+from nextcord.ext import application_checks, commands, tasks
 from nextcord.interactions import Interaction
 
+from internal_tools.concurrency import (
+    CircuitBreaker,
+    JobQueue,
+    KeyedLocks,
+    RefreshEngine,
+    RefreshResult,
+    TokenBucket,
+)
+from internal_tools.config_snapshots import SNAPSHOTS
 from internal_tools.configuration import CONFIG, JsonDictSaver
+from internal_tools.database import ResponseCache, SqliteDictSaver
 from internal_tools.discord import *
 from internal_tools.general import error_webhook_send
+from internal_tools.http import HTTP_CLIENT, HttpClient
+from internal_tools.overwatch import OverwatchApi
+from internal_tools.playtime import (
+    RoleOutcome,
+    aggregate_playtime,
+    pick_roles,
+    playtime_from_seconds,
+)
+from internal_tools.playtime_store import PlaytimeStore, playtime_report
+from internal_tools.scheduling import (
+    SCHEDULE_NAMESPACES,
+    SCHEDULE_SCHEMA,
+    RefreshScheduler,
+    ReminderSchedule,
+)
+from internal_tools.timestamps import TimestampStore
 
 PLATFORM_ROUTER = {"PC": "pc", "Console": "console"}
 PLATFORM_ROUTER_REVERSE = {v: k for k, v in PLATFORM_ROUTER.items()}
@@ -21,6 +51,37 @@ REGION_ROUTER = {
 }
 REGION_ROUTER_REVERSE = {v: k for k, v in REGION_ROUTER.items()}
 
+DATA_STORE_NAMES = ["linked_accounts", "overwatch_roles", "notifications", "playtime"]
+
+
+def _fingerprint(*parts) -> str:
+    return hashlib.blake2b(
+        orjson.dumps(parts, option=orjson.OPT_NON_STR_KEYS), digest_size=16
+    ).hexdigest()
+
+
+def _link_result_text(
+    entered_name: str, platform: str, success: bool, queued: bool = True
+) -> str:
+    text = f"You are now entered as '{entered_name}' ( Platform: {PLATFORM_ROUTER_REVERSE[platform]} ). "
+    if not queued:
+        text += "\nA lot of people are doing this right now, so your Roles couldnt be added yet.\nPlease try again later."
+    elif success:
+        text += "Adding your Roles was successful."
+    else:
+        text += "\nAdding your Roles was NOT successful, this might be a temporary issue, or you might have entered your name wrong or didnt make your profile public yet.\nRemember that the servers can take up to an hour to notice you setting your profile to public.\nYou DONT have to retry adding your name (if you selected the right one), since the Bot saves it and will automatically retry later."
+
+    return text
+
+
+@dataclass(frozen=True, slots=True)
+class LinkJob:
+    interaction: Interaction
+    user_id: int
+    platform: str
+    account_name: str
+    entered_name: str
+
 
 class HeroClassEnum:
     DPS = "DPS"
@@ -74,23 +135,37 @@ class AccountLinkModal(nextcord.ui.Modal):
             )
             return
 
-        success = await self.cog.add_account(
-            user_id=interaction.user.id,
-            platform=self.platform,
-            account_name=self.account_name_input.value.replace(" ", ""),  # type: ignore
-        )
+        if interaction.user.id in self.cog.pending_links:
+            await interaction.send(
+                "Your Account is still being added, the message from before will show the result in a moment.",
+                ephemeral=True,
+            )
+            return
 
-        text = f"You are now entered as '{self.account_name_input.value}' ( Platform: {PLATFORM_ROUTER_REVERSE[self.platform]} ). "
-        if success:
-            text += "Adding your Roles was successful."
-        else:
-            text += "\nAdding your Roles was NOT successful, this might be a temporary issue, or you might have entered your name wrong or didnt make your profile public yet.\nRemember that the servers can take up to an hour to notice you setting your profile to public.\nYou DONT have to retry adding your name (if you selected the right one), since the Bot saves it and will automatically retry later."
+        account_name = self.account_name_input.value.replace(" ", "")
+        self.cog.add_account(interaction.user.id, self.platform, account_name)
 
+        # Answering first, the roles need the API and can take longer than Discord waits for an answer
         await interaction.send(
-            text,
+            f"You are now entered as '{self.account_name_input.value}' ( Platform: {PLATFORM_ROUTER_REVERSE[self.platform]} ). "
+            "Adding your Roles now, this message will show the result in a moment.",
             ephemeral=True,
         )
 
+        job = LinkJob(
+            interaction=interaction,
+            user_id=interaction.user.id,
+            platform=self.platform,
+            account_name=account_name,
+            entered_name=self.account_name_input.value,
+        )
+        if not self.cog.queue_link(job):
+            await interaction.edit_original_message(
+                content=_link_result_text(
+                    job.entered_name, job.platform, success=False, queued=False
+                )
+            )
+
         self.stop()
 
 
@@ -128,16 +203,133 @@ class AccountLinkMenu(nextcord.ui.View):
 
 
 class AccountLinker(commands.Cog):
-    def __init__(self, bot: commands.Bot):
+    def __init__(self, bot: commands.Bot, http: HttpClient):
         self.bot = bot
+        self.http = http
 
-        self.accounts = JsonDictSaver("linked_accounts")
-        self.overwatch_roles = JsonDictSaver("overwatch_roles")
-        self.notifications = JsonDictSaver(
+        self.accounts = SqliteDictSaver(
+            "linked_accounts",
+            write_behind=CONFIG["GENERAL"]["DATA_WRITE_BEHIND_SECONDS"],
+            schema={int: {"platform": str, "account_name": str}},
+        )
+        self.overwatch_roles = JsonDictSaver(
+            "overwatch_roles",
+            schema={
+                "MAIN_ROLE_IDS": {str: int},
+                "HERO_ROLE_IDS": {str: int},
+                "CLASS_ROLE_IDS": {str: int},
+                "TOP_3_SEPERATOR_ROLE_ID": int,
+                "OTHER_SEPERATOR_ROLE_ID": int,
+            },
+        )
+        self.notifications = TimestampStore(
             "notifications",
-            default={"CAREER_PROFILE_PRIVATE": {}, "AUTOMATIC_ROLES": {}},
+            tables=["CAREER_PROFILE_PRIVATE", "AUTOMATIC_ROLES", "REMIND_AT"],
+            write_behind=CONFIG["GENERAL"]["DATA_WRITE_BEHIND_SECONDS"],
+        )
+        self.role_fingerprints = SqliteDictSaver(
+            "role_fingerprints",
+            write_behind=CONFIG["GENERAL"]["DATA_WRITE_BEHIND_SECONDS"],
+            schema={int: {"payload": str, "outcome": str}},
+        )
+        self.refresh_schedule = SqliteDictSaver(
+            "refresh_schedule",
+            namespaces=SCHEDULE_NAMESPACES,
+            write_behind=CONFIG["GENERAL"]["DATA_WRITE_BEHIND_SECONDS"],
+            schema=SCHEDULE_SCHEMA,
+        )
+
+        account_linker_config = SNAPSHOTS.account_linker
+        self.playtimes = PlaytimeStore(
+            "playtime",
+            api_names=[hero.api_name for hero in account_linker_config.heroes],
+            snapshot_every=account_linker_config.playtime_snapshot_interval,
+            keep_snapshots=account_linker_config.playtime_snapshots_kept,
+            write_behind=CONFIG["GENERAL"]["DATA_WRITE_BEHIND_SECONDS"],
+        )
+        self.overwatch_api = OverwatchApi(
+            http,
+            ResponseCache(
+                "profile_cache",
+                max_bytes=account_linker_config.profile_cache_max_bytes,
+            ),
+            TokenBucket(
+                account_linker_config.api_requests_per_second,
+                account_linker_config.api_request_burst,
+            ),
+            CircuitBreaker(
+                failure_threshold=account_linker_config.api_breaker_failures,
+                error_rate_threshold=account_linker_config.api_breaker_error_rate,
+                window=account_linker_config.api_breaker_window,
+                open_seconds=account_linker_config.api_breaker_open_seconds,
+                max_open_seconds=account_linker_config.api_breaker_max_open_seconds,
+                on_state_change=self.report_api_state_change,
+            ),
+            ttl_seconds=account_linker_config.profile_cache_ttl_seconds,
+            stale_seconds=account_linker_config.profile_cache_stale_seconds,
+            private_ttl_seconds=account_linker_config.private_profile_cache_ttl_seconds,
+            base_url=account_linker_config.api_base_url,
+        )
+        self.role_edit_rate_limit = TokenBucket(
+            account_linker_config.role_edits_per_second,
+            account_linker_config.role_edit_burst,
+        )
+        self.member_locks = KeyedLocks()
+        self.private_prechecks = 0
+        self.private_prechecks_still_private = 0
+        self.refresh_scheduler = RefreshScheduler(
+            self.refresh_schedule,
+            interval=account_linker_config.refresh_interval,
+            max_interval=account_linker_config.refresh_max_interval,
+            backoff_factor=account_linker_config.refresh_backoff_factor,
+            private_backoff_factor=account_linker_config.private_backoff_factor,
+            active_after=account_linker_config.active_player_refresh_after,
+        )
+        self.refresh_engine = RefreshEngine(
+            self.refresh_account,
+            account_linker_config.refresh_workers,
+            on_error=error_webhook_send,
+            gate=self.overwatch_api.breaker,
+        )
+        self.recompute_engine = RefreshEngine(
+            self.recompute_member_roles,
+            account_linker_config.recompute_workers,
+            on_error=error_webhook_send,
+        )
+        self.reminders = ReminderSchedule(
+            self.notifications,
+            remind_every=datetime.timedelta(days=14),
+            retry_after=datetime.timedelta(days=1),
+        )
+        self.reminders_synced = False
+        self.pending_links: Set[int] = set()
+        self.link_queue = JobQueue(
+            self.finish_link,
+            account_linker_config.link_workers,
+            account_linker_config.link_queue_size,
+            on_error=error_webhook_send,
         )
 
+    def cog_unload(self):
+        self.update_overwatch_roles.cancel()
+        self.remind_about_automatic_roles.cancel()
+        self.snapshot_playtime.cancel()
+        self.link_queue.stop()
+        self.accounts.close()
+        self.notifications.close()
+        self.role_fingerprints.close()
+        self.refresh_schedule.close()
+        self.playtimes.close()
+        self.overwatch_api.cache.close()
+
+    def data_stores(self):
+        return {
+            "linked_accounts": self.accounts,
+            "overwatch_roles": self.overwatch_roles,
+            "notifications": self.notifications,
+            "playtime": self.playtimes,
+        }
+
     async def cog_application_command_check(self, interaction: nextcord.Interaction):
         """
         Everyone can use this.
@@ -167,32 +359,24 @@ class AccountLinker(commands.Cog):
 
             if len(self.overwatch_roles) == 0:
                 guild = channel.guild
+                account_linker_config = SNAPSHOTS.account_linker
 
                 # Main Roles
                 self.overwatch_roles["MAIN_ROLE_IDS"] = {}
-                for hero, vals in CONFIG["ACCOUNT_LINKER"]["HEROES"].items():
+                for hero in account_linker_config.heroes:
                     main_role = await guild.create_role(
-                        name=f"{hero} Main",
-                        color=nextcord.Color(int(vals["COLOR"].replace("#", ""), 16)),
+                        name=f"{hero.name} Main",
+                        color=nextcord.Color(hero.color),
                         hoist=True,
                         mentionable=True,
                     )
 
-                    self.overwatch_roles["MAIN_ROLE_IDS"][hero] = main_role.id
+                    self.overwatch_roles["MAIN_ROLE_IDS"][hero.name] = main_role.id
 
                 # Top 3 Seperator role
                 top_3_seperator_role = await guild.create_role(
-                    name=CONFIG["ACCOUNT_LINKER"]["SEPERATOR_ROLE_NAMES"][
-                        "TOP_3_USED_HEROES"
-                    ],
-                    color=nextcord.Color(
-                        int(
-                            CONFIG["ACCOUNT_LINKER"]["SEPERATOR_ROLE_COLOR"].replace(
-                                "#", ""
-                            ),
-                            16,
-                        )
-                    ),
+                    name=account_linker_config.top_3_seperator_role_name,
+                    color=nextcord.Color(account_linker_config.seperator_role_color),
                     hoist=True,
                     mentionable=True,
                 )
@@ -202,27 +386,18 @@ class AccountLinker(commands.Cog):
 
                 # Top 3 Hero roles
                 self.overwatch_roles["HERO_ROLE_IDS"] = {}
-                for hero, vals in CONFIG["ACCOUNT_LINKER"]["HEROES"].items():
+                for hero in account_linker_config.heroes:
                     hero_role = await guild.create_role(
-                        name=f"{hero}",
-                        color=nextcord.Color(int(vals["COLOR"].replace("#", ""), 16)),
+                        name=f"{hero.name}",
+                        color=nextcord.Color(hero.color),
                     )
 
-                    self.overwatch_roles["HERO_ROLE_IDS"][hero] = hero_role.id
+                    self.overwatch_roles["HERO_ROLE_IDS"][hero.name] = hero_role.id
 
                 # Other Seperator role
                 other_seperator_role = await guild.create_role(
-                    name=CONFIG["ACCOUNT_LINKER"]["SEPERATOR_ROLE_NAMES"][
-                        "OTHER_INFOS"
-                    ],
-                    color=nextcord.Color(
-                        int(
-                            CONFIG["ACCOUNT_LINKER"]["SEPERATOR_ROLE_COLOR"].replace(
-                                "#", ""
-                            ),
-                            16,
-                        )
-                    ),
+                    name=account_linker_config.other_seperator_role_name,
+                    color=nextcord.Color(account_linker_config.seperator_role_color),
                     hoist=True,
                     mentionable=True,
                 )
@@ -232,257 +407,504 @@ class AccountLinker(commands.Cog):
 
                 # Main Class roles
                 self.overwatch_roles["CLASS_ROLE_IDS"] = {}
-                for hero_class, color in CONFIG["ACCOUNT_LINKER"][
-                    "CLASS_ROLES"
-                ].items():
+                class_role_colors = account_linker_config.class_role_colors
+                for hero_class, color in class_role_colors.items():
                     class_role = await guild.create_role(
                         name=f"{hero_class}",
-                        color=nextcord.Color(int(color.replace("#", ""), 16)),
+                        color=nextcord.Color(color),
                     )
 
                     self.overwatch_roles["CLASS_ROLE_IDS"][hero_class] = class_role.id
 
                 self.overwatch_roles.save()
 
+        self.refresh_scheduler.sync(self.accounts)
+
         self.update_overwatch_roles.start()
         self.remind_about_automatic_roles.start()
+        self.snapshot_playtime.start()
 
-    async def assign_overwatch_roles(
-        self, member: nextcord.Member, platform: str, account_name: str
+    @commands.Cog.listener()
+    async def on_member_join(self, member: nextcord.Member):
+        if (
+            not member.bot
+            and member.id not in self.accounts
+            and member.guild.id == SNAPSHOTS.general.home_server_id
+        ):
+            # Gives them a day to find the menu on their own first
+            self.reminders.add(
+                member.id,
+                not_before=datetime.datetime.utcnow() + datetime.timedelta(days=1),
+            )
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: nextcord.Member):
+        if member.guild.id == SNAPSHOTS.general.home_server_id:
+            self.reminders.remove(member.id)
+
+            # Their roles are gone, so if they come back the next refresh has to give them again
+            if self.role_fingerprints.pop(member.id, None) is not None:
+                self.role_fingerprints.save()
+
+    @commands.Cog.listener()
+    async def on_message(self, message: nextcord.Message):
+        if message.guild and message.guild.id == SNAPSHOTS.general.home_server_id:
+            self.refresh_scheduler.mark_active(message.author.id)
+
+    @commands.Cog.listener()
+    async def on_voice_state_update(
+        self,
+        member: nextcord.Member,
+        before: nextcord.VoiceState,
+        after: nextcord.VoiceState,
     ):
-        async with aiohttp.ClientSession() as session:
-            try:
-                resp = await session.get(
-                    f"https://ow-api.com/v3/stats/{platform}/{account_name.replace('#', '-')}/complete"
-                )
-            except:
-                return False
+        if (
+            after.channel
+            and before.channel != after.channel
+            and member.guild.id == SNAPSHOTS.general.home_server_id
+        ):
+            self.refresh_scheduler.mark_active(member.id)
 
-            if not resp.ok:
-                return False
+    async def assign_overwatch_roles(
+        self,
+        member: nextcord.Member,
+        platform: str,
+        account_name: str,
+        skip_unchanged: bool = False,
+    ) -> str:
+        """
+        Fetches the Career Profile and gives `member` the matching roles. Returns a `RefreshResult`.
 
-            data = await resp.json()
-            if "error" in data and data["error"] is not None:
-                await error_webhook_send(
-                    f"OVRStat API Error ( https://ow-api.com/v3/stats/{platform}/{account_name.replace('#', '-')}/complete ): {data['error']}"
-                )
-                return False
+        With `skip_unchanged`, nothing is done if the profile or the roles resulting from it
+        are the same as last time, not even looking at the roles `member` has right now.
 
-            if "private" not in data:
-                return False
+        If the profile was private last time, only the summary is fetched first,
+        and the complete profile only if the summary doesnt say it is still private.
+        """
+        if self.refresh_scheduler.seen_private(member.id):
+            self.private_prechecks += 1
+            if await self.overwatch_api.is_private(platform, account_name):
+                self.private_prechecks_still_private += 1
+                await self.notify_private_profile(member)
+                return RefreshResult.PRIVATE
+
+        data = await self.overwatch_api.profile(platform, account_name)
+        if data is None:
+            return RefreshResult.FAILED
+
+        # Counted by the circuit breaker, which reports them all together
+        if "error" in data and data["error"] is not None:
+            return RefreshResult.FAILED
+
+        if "private" not in data:
+            return RefreshResult.FAILED
+
+        if data["private"]:
+            await self.notify_private_profile(member)
+            return RefreshResult.PRIVATE
+
+        # Recreated roles have new ids, so they have to be part of the fingerprint
+        payload_fingerprint = _fingerprint(data, sorted(self.managed_role_ids()))
+        last_fingerprints = self.role_fingerprints.get(member.id)
+        if (
+            skip_unchanged
+            and last_fingerprints is not None
+            and last_fingerprints["payload"] == payload_fingerprint
+            and member.id in self.playtimes
+        ):
+            return RefreshResult.UNCHANGED
+
+        playtime = aggregate_playtime(data, SNAPSHOTS.account_linker.heroes_by_api_name)
+        if playtime is None:
+            return RefreshResult.FAILED
+
+        self.playtimes[member.id] = playtime.api_hero_seconds
+        self.playtimes.save()
+
+        for api_hero in playtime.unknown_api_heroes:
+            await error_webhook_send(f"Unknown Hero `{api_hero}` from API")
+
+        outcome = pick_roles(playtime)
+        if outcome is None:
+            return RefreshResult.FAILED
+
+        outcome_role_ids = self.role_ids_for(outcome, member.guild)
+        fingerprints = {
+            "payload": payload_fingerprint,
+            "outcome": _fingerprint(sorted(outcome_role_ids)),
+        }
+
+        if (
+            skip_unchanged
+            and last_fingerprints is not None
+            and last_fingerprints["outcome"] == fingerprints["outcome"]
+        ):
+            self.role_fingerprints[member.id] = fingerprints
+            self.role_fingerprints.save()
+            return RefreshResult.UNCHANGED
+
+        await self.apply_managed_roles(member, outcome_role_ids)
+
+        self.role_fingerprints[member.id] = fingerprints
+        self.role_fingerprints.save()
 
-            if data["private"]:
-                today = datetime.datetime.utcnow()
-                if (
-                    member.id in self.notifications["CAREER_PROFILE_PRIVATE"]
-                    and today - self.notifications["CAREER_PROFILE_PRIVATE"][member.id]
-                    > datetime.timedelta(days=3)
-                ) or member.id not in self.notifications["CAREER_PROFILE_PRIVATE"]:
-                    try:
-                        await member.send(
-                            "Hello, i tried to fetch your Career Profile to assign you the roles you should have,"
-                            " but your Career Profile is private at the moment.\n"
-                            "Please make it public again,"
-                            " or ask Aki to remove your data from my database so that i wont try to do this again."
-                        )
-                        self.notifications["CAREER_PROFILE_PRIVATE"][member.id] = (
-                            today.isoformat()
-                        )
-                        self.notifications.save()
-                    except:
-                        pass
+        return RefreshResult.DONE
 
+    async def apply_managed_roles(
+        self, member: nextcord.Member, outcome_role_ids: Set[int]
+    ) -> bool:
+        """
+        Makes `outcome_role_ids` the managed roles of `member`, leaving all others alone.
+        Returns if anything had to be changed.
+        """
+        # Overlapping edits for the same member would work with outdated roles
+        async with self.member_locks(member.id):
+            current_role_ids = {
+                role.id for role in member.roles if not role.is_default()
+            }
+            wanted_role_ids = (
+                current_role_ids - self.managed_role_ids()
+            ) | outcome_role_ids
+
+            if wanted_role_ids == current_role_ids:
                 return False
 
-            played_amounts: Dict[str, datetime.timedelta] = {}
-            class_amounts: Dict[str, datetime.timedelta] = {}
-            for gamemode_stats in ["competitiveStats", "quickPlayStats"]:
-                for api_hero, stats in data[gamemode_stats]["careerStats"].items():
-                    if api_hero == "allHeroes":
-                        continue
-
-                    if api_hero not in [
-                        x["API_NAME"]
-                        for x in CONFIG["ACCOUNT_LINKER"]["HEROES"].values()
-                    ]:
-                        await error_webhook_send(f"Unknown Hero `{api_hero}` from API")
-                        continue
-
-                    hero_name = None
-                    hero_class = None
-                    for hero, vals in CONFIG["ACCOUNT_LINKER"]["HEROES"].items():
-                        if api_hero == vals["API_NAME"]:
-                            hero_name = hero
-                            hero_class = vals["CLASS"]
-                            break
-
-                    if not hero_name or not hero_class:
-                        return False
-
-                    raw_time: str = stats["game"]["timePlayed"]
-                    if raw_time.count(":") == 1:
-                        hours = "0"
-                        minutes, seconds = raw_time.split(":")
-                    elif raw_time.count(":") == 2:
-                        hours, minutes, seconds = raw_time.split(":")
-                    else:
-                        return False
-
-                    time_amount = datetime.timedelta(
-                        hours=int(hours), minutes=int(minutes), seconds=int(seconds)
-                    )
+            await self.role_edit_rate_limit.acquire()
+            await member.edit(
+                roles=[nextcord.Object(role_id) for role_id in wanted_role_ids]
+            )
 
-                    if hero_name not in played_amounts:
-                        played_amounts[hero_name] = datetime.timedelta()
-                    played_amounts[hero_name] += time_amount
+        return True
 
-                    if hero_class not in class_amounts:
-                        class_amounts[hero_class] = datetime.timedelta()
-                    class_amounts[hero_class] += time_amount
+    async def recompute_member_roles(self, job: Tuple[nextcord.Guild, int]) -> str:
+        """
+        Gives a member the roles for their saved playtime with the heroes of the current config,
+        without fetching their Career Profile. Returns a `RefreshResult`, DONE if the roles changed.
+        """
+        home_guild, user_id = job
 
-            if len(played_amounts) == 0 or len(class_amounts) == 0:
-                return False
+        api_hero_seconds = self.playtimes.get(user_id)
+        if api_hero_seconds is None or user_id not in self.accounts:
+            return RefreshResult.SKIPPED
 
-            main_hero = max(played_amounts, key=played_amounts.get)  # type: ignore
-            del played_amounts[main_hero]
+        member = await GetOrFetch.member(home_guild, user_id)
+        if not member:
+            return RefreshResult.SKIPPED
 
-            top_3_heroes = []
-            for _ in range(3):
-                if len(played_amounts) == 0:
-                    break
+        outcome = pick_roles(
+            playtime_from_seconds(
+                api_hero_seconds, SNAPSHOTS.account_linker.heroes_by_api_name
+            )
+        )
+        if outcome is None:
+            return RefreshResult.SKIPPED
 
-                key = max(played_amounts, key=played_amounts.get)  # type: ignore
-                top_3_heroes.append(key)
+        outcome_role_ids = self.role_ids_for(outcome, home_guild)
+        changed = await self.apply_managed_roles(member, outcome_role_ids)
 
-                del played_amounts[key]
+        # So the next refresh compares against these roles
+        fingerprints = self.role_fingerprints.get(user_id)
+        if fingerprints is not None:
+            self.role_fingerprints[user_id] = {
+                "payload": fingerprints["payload"],
+                "outcome": _fingerprint(sorted(outcome_role_ids)),
+            }
+            self.role_fingerprints.save()
 
-            most_played_class = max(class_amounts, key=class_amounts.get)  # type: ignore
+        return RefreshResult.DONE if changed else RefreshResult.UNCHANGED
 
-            roles_to_remove = []
-            roles_to_add = []
+    async def notify_private_profile(self, member: nextcord.Member):
+        """
+        Tells `member` that their Career Profile is private, at most every 3 days.
+        """
+        now = int(time.time())
+        last_notified = self.notifications["CAREER_PROFILE_PRIVATE"].get(member.id)
+        if last_notified is None or now - last_notified > 3 * 24 * 60 * 60:
+            try:
+                await member.send(
+                    "Hello, i tried to fetch your Career Profile to assign you the roles you should have,"
+                    " but your Career Profile is private at the moment.\n"
+                    "Please make it public again,"
+                    " or ask Aki to remove your data from my database so that i wont try to do this again."
+                )
+                self.notifications["CAREER_PROFILE_PRIVATE"][member.id] = now
+                self.notifications.save()
+            except:
+                pass
 
-            role = await GetOrFetch.role(
-                member.guild, self.overwatch_roles["TOP_3_SEPERATOR_ROLE_ID"]
-            )
-            if role:
-                if role not in member.roles:
-                    roles_to_add.append(role)
+    def managed_role_ids(self) -> Set[int]:
+        """
+        Every role this Cog gives and takes away.
+        """
+        return {
+            self.overwatch_roles["TOP_3_SEPERATOR_ROLE_ID"],
+            self.overwatch_roles["OTHER_SEPERATOR_ROLE_ID"],
+            *self.overwatch_roles["MAIN_ROLE_IDS"].values(),
+            *self.overwatch_roles["HERO_ROLE_IDS"].values(),
+            *self.overwatch_roles["CLASS_ROLE_IDS"].values(),
+        }
 
-            role = await GetOrFetch.role(
-                member.guild, self.overwatch_roles["OTHER_SEPERATOR_ROLE_ID"]
-            )
-            if role:
-                if role not in member.roles:
-                    roles_to_add.append(role)
-
-            for hero, role_id in self.overwatch_roles["MAIN_ROLE_IDS"].items():
-                role = await GetOrFetch.role(member.guild, role_id)
-                if role:
-                    if main_hero == hero:
-                        if role not in member.roles:
-                            roles_to_add.append(role)
-                    else:
-                        if role in member.roles:
-                            roles_to_remove.append(role)
-
-            for hero, role_id in self.overwatch_roles["HERO_ROLE_IDS"].items():
-                role = await GetOrFetch.role(member.guild, role_id)
-                if role:
-                    if hero in top_3_heroes:
-                        if role not in member.roles:
-                            roles_to_add.append(role)
-                    else:
-                        if role in member.roles:
-                            roles_to_remove.append(role)
-
-            for hero_class, role_id in self.overwatch_roles["CLASS_ROLE_IDS"].items():
-                role = await GetOrFetch.role(member.guild, role_id)
-                if role:
-                    if hero_class == most_played_class:
-                        if role not in member.roles:
-                            roles_to_add.append(role)
-                    else:
-                        if role in member.roles:
-                            roles_to_remove.append(role)
-
-            if len(roles_to_remove) != 0:
-                await member.remove_roles(*roles_to_remove)
-            if len(roles_to_add) != 0:
-                await member.add_roles(*roles_to_add)
-
-            return True
-
-    async def add_account(self, user_id: int, platform: str, account_name: str):
+    def role_ids_for(self, outcome: RoleOutcome, guild: nextcord.Guild) -> Set[int]:
+        """
+        The managed roles someone with this `outcome` should have, if they (still) exist in `guild`.
+        """
+        role_ids = {
+            self.overwatch_roles["TOP_3_SEPERATOR_ROLE_ID"],
+            self.overwatch_roles["OTHER_SEPERATOR_ROLE_ID"],
+            self.overwatch_roles["MAIN_ROLE_IDS"].get(outcome.main_hero),
+            self.overwatch_roles["CLASS_ROLE_IDS"].get(outcome.most_played_class),
+            *[
+                self.overwatch_roles["HERO_ROLE_IDS"].get(hero)
+                for hero in outcome.top_3_heroes
+            ],
+        }
+
+        return {
+            role_id
+            for role_id in role_ids
+            if role_id is not None and guild.get_role(role_id) is not None
+        }
+
+    async def create_missing_roles(self, guild: nextcord.Guild) -> List[str]:
+        """
+        Creates the Main, Hero and Class roles of heroes and classes that were added to the config
+        after the roles were created in `on_ready`. Returns the names of the new roles.
+        """
+        account_linker_config = SNAPSHOTS.account_linker
+        created = []
+
+        for hero in account_linker_config.heroes:
+            if hero.name not in self.overwatch_roles["MAIN_ROLE_IDS"]:
+                main_role = await guild.create_role(
+                    name=f"{hero.name} Main",
+                    color=nextcord.Color(hero.color),
+                    hoist=True,
+                    mentionable=True,
+                )
+
+                self.overwatch_roles["MAIN_ROLE_IDS"][hero.name] = main_role.id
+                created.append(main_role.name)
+
+            if hero.name not in self.overwatch_roles["HERO_ROLE_IDS"]:
+                hero_role = await guild.create_role(
+                    name=f"{hero.name}",
+                    color=nextcord.Color(hero.color),
+                )
+
+                self.overwatch_roles["HERO_ROLE_IDS"][hero.name] = hero_role.id
+                created.append(hero_role.name)
+
+        for hero_class, color in account_linker_config.class_role_colors.items():
+            if hero_class not in self.overwatch_roles["CLASS_ROLE_IDS"]:
+                class_role = await guild.create_role(
+                    name=f"{hero_class}",
+                    color=nextcord.Color(color),
+                )
+
+                self.overwatch_roles["CLASS_ROLE_IDS"][hero_class] = class_role.id
+                created.append(class_role.name)
+
+        if created:
+            self.overwatch_roles.save()
+
+        return created
+
+    def add_account(self, user_id: int, platform: str, account_name: str):
+        """
+        Saves the account and makes it due, the roles are added by `queue_link` or the next refresh.
+        """
         self.accounts[user_id] = {
             "platform": platform,
             "account_name": account_name,
         }
 
         self.accounts.save()
+        self.refresh_scheduler.add(user_id)
+        self.reminders.remove(user_id)
+
+    def queue_link(self, job: LinkJob) -> bool:
+        """
+        Adds the roles for a newly linked account in the background, False if too many are waiting already.
+        The account is due in the refresh schedule either way, so it gets its roles in the end.
+        """
+        if not self.link_queue.submit(job):
+            return False
+
+        self.pending_links.add(job.user_id)
+        return True
+
+    async def finish_link(self, job: LinkJob):
+        success = False
+        try:
+            success = await self.assign_roles_after_link(
+                job.user_id, job.platform, job.account_name
+            )
+        finally:
+            self.pending_links.discard(job.user_id)
+
+            try:
+                await job.interaction.edit_original_message(
+                    content=_link_result_text(job.entered_name, job.platform, success)
+                )
+            except nextcord.HTTPException:  # The interaction expired
+                pass
 
+    async def assign_roles_after_link(
+        self, user_id: int, platform: str, account_name: str
+    ) -> bool:
         home_guild = await GetOrFetch.guild(
             self.bot, CONFIG["GENERAL"]["HOME_SERVER_ID"]
         )
         if home_guild:
             member = await GetOrFetch.member(home_guild, user_id)
             if member:
-                return await self.assign_overwatch_roles(member, platform, account_name)
+                result = await self.assign_overwatch_roles(
+                    member, platform, account_name
+                )
+                # Stays due while the API is down, like in the refresh
+                if result != RefreshResult.FAILED or self.api_available:
+                    self.refresh_scheduler.record(user_id, result)
+
+                return result == RefreshResult.DONE
 
         return False
 
-    @tasks.loop(hours=12)
+    @tasks.loop(minutes=1)
     async def update_overwatch_roles(self):
         home_guild = await GetOrFetch.guild(
             self.bot, CONFIG["GENERAL"]["HOME_SERVER_ID"]
         )
-        if home_guild:
-            for user_id, vals in self.accounts.items():
-                member = await GetOrFetch.member(home_guild, user_id)
-                if member:
-                    await self.assign_overwatch_roles(
-                        member, vals["platform"], vals["account_name"]
-                    )
-                    await asyncio.sleep(60)
+        if not home_guild:
+            return
+
+        batch_size = SNAPSHOTS.account_linker.refresh_batch_size
+        while True:
+            user_ids = self.refresh_scheduler.due(batch_size)
+            if not user_ids:
+                return
+
+            await self.refresh_engine.run(
+                ((home_guild, user_id) for user_id in user_ids), total=len(user_ids)
+            )
+
+            # Whatever is left is tried again once the API works again
+            if len(user_ids) < batch_size or not self.api_available:
+                return
+
+    async def refresh_account(self, job: Tuple[nextcord.Guild, int]) -> str:
+        home_guild, user_id = job
+
+        account = self.accounts.get(user_id)
+        if account is None:  # Not linked anymore
+            self.refresh_scheduler.remove(user_id)
+            self.reminders.add(user_id)
+            if self.playtimes.pop(user_id) is not None:
+                self.playtimes.save()
+            return RefreshResult.SKIPPED
+
+        # Every account gets rescheduled, even on errors, so none can block the queue.
+        # Cancelled ones (restart, shutdown) stay due, so they come first again.
+        try:
+            member = await GetOrFetch.member(home_guild, user_id)
+            if not member:
+                result = RefreshResult.SKIPPED
+            else:
+                result = await self.assign_overwatch_roles(
+                    member,
+                    account["platform"],
+                    account["account_name"],
+                    skip_unchanged=True,
+                )
+        except Exception:
+            self.refresh_scheduler.record(user_id, RefreshResult.FAILED)
+            raise
+
+        # It wasnt this account failing, it stays due until the API works again
+        if result == RefreshResult.FAILED and not self.api_available:
+            return RefreshResult.SKIPPED
+
+        self.refresh_scheduler.record(user_id, result)
+
+        return result
+
+    @property
+    def api_available(self) -> bool:
+        return self.overwatch_api.breaker.state == CircuitBreaker.CLOSED
+
+    async def report_api_state_change(
+        self, old_state: str, new_state: str, summary: str
+    ):
+        await error_webhook_send(
+            f"ow-api.com circuit breaker {old_state} -> {new_state}:\n```\n{summary}\n```"
+        )
 
     @update_overwatch_roles.error
     async def restart_update_overwatch_roles(self, *args):
+        # The schedule is the checkpoint, the restarted loop continues with what is still due
+        await self.refresh_schedule.flush_async()
         await asyncio.sleep(10)
 
         self.update_overwatch_roles.restart()
 
-    @tasks.loop(hours=24)
+    @tasks.loop(hours=1)
     async def remind_about_automatic_roles(self):
         home_guild = await GetOrFetch.guild(
             self.bot, CONFIG["GENERAL"]["HOME_SERVER_ID"]
         )
-        if home_guild:
-            get_roles_channel = await GetOrFetch.channel(
-                home_guild, CONFIG["ACCOUNT_LINKER"]["MENU_CHANNEL_ID"]
+        if not home_guild:
+            return
+
+        get_roles_channel = await GetOrFetch.channel(
+            home_guild, CONFIG["ACCOUNT_LINKER"]["MENU_CHANNEL_ID"]
+        )
+        if not isinstance(get_roles_channel, nextcord.TextChannel):
+            return
+
+        # Catches up on everyone who joined, left or linked while the bot was offline
+        if not self.reminders_synced:
+            self.reminders.sync(
+                m.id
+                for m in home_guild.members
+                if not m.bot and m.id not in self.accounts
             )
-            if isinstance(get_roles_channel, nextcord.TextChannel):
-                today = datetime.datetime.utcnow()
-
-                for m in home_guild.members:
-                    if m.id not in self.accounts and not m.bot:
-                        if (
-                            m.id in self.notifications["AUTOMATIC_ROLES"]
-                            and today - self.notifications["AUTOMATIC_ROLES"][m.id]
-                            > datetime.timedelta(days=14)
-                        ) or m.id not in self.notifications["AUTOMATIC_ROLES"]:
-                            try:
-                                await m.send(
-                                    "Hello dear Human,\n\n"
-                                    "this is just a friendly reminder that you havent setup the automatic roles feature yet.\n"
-                                    "These are the Roles that show your most played Hero, the top 3 played ones after that, and which role you prefer.\n\n"
-                                    "This is not required, but its neat and it would be neat if you can take the time to do this.\n\n"
-                                    f"Go to {get_roles_channel.mention} for more info and a step by step guide. It will only take a few minutes."
-                                )
-                                self.notifications["AUTOMATIC_ROLES"][m.id] = (
-                                    today.isoformat()
-                                )
-                                self.notifications.save()
-                            except:
-                                pass
+            self.reminders_synced = True
+
+        text = (
+            "Hello dear Human,\n\n"
+            "this is just a friendly reminder that you havent setup the automatic roles feature yet.\n"
+            "These are the Roles that show your most played Hero, the top 3 played ones after that, and which role you prefer.\n\n"
+            "This is not required, but its neat and it would be neat if you can take the time to do this.\n\n"
+            f"Go to {get_roles_channel.mention} for more info and a step by step guide. It will only take a few minutes."
+        )
+        account_linker_config = SNAPSHOTS.account_linker
+        dm_slots = asyncio.Semaphore(account_linker_config.reminder_dm_concurrency)
+
+        async def remind(user_id: int):
+            member = home_guild.get_member(user_id)
+            if member is None or member.bot or user_id in self.accounts:
+                self.reminders.remove(user_id, save=False)
+                return
+
+            async with dm_slots:
+                try:
+                    await member.send(text)
+                    sent = True
+                except:
+                    sent = False
+
+            self.reminders.reminded(user_id, sent)
+
+        batch_size = account_linker_config.reminder_batch_size
+        while True:
+            user_ids = self.reminders.due(batch_size)
+            if not user_ids:
+                return
+
+            await asyncio.gather(*[remind(user_id) for user_id in user_ids])
+            self.notifications.save()
+
+            if len(user_ids) < batch_size:
+                return
 
     @remind_about_automatic_roles.error
     async def restart_remind_about_automatic_roles(self, *args):
@@ -490,6 +912,16 @@ class AccountLinker(commands.Cog):
 
         self.remind_about_automatic_roles.restart()
 
+    @tasks.loop(hours=1)
+    async def snapshot_playtime(self):
+        await self.playtimes.snapshot_if_due_async()
+
+    @snapshot_playtime.error
+    async def restart_snapshot_playtime(self, *args):
+        await asyncio.sleep(10)
+
+        self.snapshot_playtime.restart()
+
     async def show_overwatch_profile(
         self, interaction: nextcord.Interaction, member: nextcord.Member
     ):
@@ -536,12 +968,10 @@ class AccountLinker(commands.Cog):
         guild = interaction.guild
 
         if guild:
-            name_list = [hero for hero in CONFIG["ACCOUNT_LINKER"]["HEROES"]]
-            name_list.extend(CONFIG["ACCOUNT_LINKER"]["CLASS_ROLES"])
-            name_list.extend(CONFIG["ACCOUNT_LINKER"]["SEPERATOR_ROLE_NAMES"].values())
+            managed_role_names = SNAPSHOTS.account_linker.managed_role_names
 
             for r in guild.roles:
-                if r.name.replace(" Main", "") in name_list:
+                if r.name.replace(" Main", "") in managed_role_names:
                     await r.delete(reason="Cleaning Overwatch Roles")
 
             self.overwatch_roles.clear()
@@ -549,6 +979,214 @@ class AccountLinker(commands.Cog):
 
         await interaction.send("Done.", ephemeral=True)
 
+    @nextcord.slash_command(
+        "export-data",
+        description="Sends the data of the Account Linker as readable JSON",
+        guild_ids=CONFIG["GENERAL"]["OWNER_COG_GUILD_IDS"],
+    )
+    @application_checks.is_owner()
+    async def export_data(
+        self,
+        interaction: nextcord.Interaction,
+        store: str = nextcord.SlashOption(
+            name="store",
+            description="Which data to export",
+            required=True,
+            choices=DATA_STORE_NAMES,
+        ),
+    ):
+        await interaction.response.defer(ephemeral=True)
+
+        content = self.data_stores()[store].export_json()
+
+        await interaction.send(
+            file=nextcord.File(io.BytesIO(content), filename=f"{store}.json"),
+            ephemeral=True,
+        )
+
+    @nextcord.slash_command(
+        "import-data",
+        description="Replaces data of the Account Linker with a JSON file",
+        guild_ids=CONFIG["GENERAL"]["OWNER_COG_GUILD_IDS"],
+    )
+    @application_checks.is_owner()
+    async def import_data(
+        self,
+        interaction: nextcord.Interaction,
+        store: str = nextcord.SlashOption(
+            name="store",
+            description="Which data to replace",
+            required=True,
+            choices=DATA_STORE_NAMES,
+        ),
+        file: nextcord.Attachment = nextcord.SlashOption(
+            name="file",
+            description="JSON file, like the ones /export-data sends",
+            required=True,
+        ),
+    ):
+        await interaction.response.defer(ephemeral=True)
+
+        self.data_stores()[store].import_json(await file.read())
+        # Who gets reminded depends on both
+        self.reminders_synced = False
+
+        await interaction.send("Done.", ephemeral=True)
+
+    @nextcord.slash_command(
+        "refresh-status",
+        description="Shows the progress of the current or last role refresh",
+        guild_ids=CONFIG["GENERAL"]["OWNER_COG_GUILD_IDS"],
+    )
+    @application_checks.is_owner()
+    async def refresh_status(self, interaction: nextcord.Interaction):
+        progress = self.refresh_engine.progress
+        if progress is None:
+            await interaction.send("No refresh has run yet.", ephemeral=True)
+            return
+
+        state = "Running" if self.refresh_engine.running else "Finished"
+        if self.refresh_engine.running and not self.overwatch_api.breaker.ready:
+            state = "Paused"
+        await interaction.send(
+            f"Batch {state.lower()}, {self.refresh_engine.worker_count} workers\n```\n{progress.format()}\n"
+            f"Fingerprint hits: {progress.unchanged}, misses: {progress.done}\n```\n"
+            f"Scheduled accounts: {len(self.refresh_scheduler)}, "
+            f"moved up for activity: {self.refresh_scheduler.activity_bumps}",
+            ephemeral=True,
+        )
+
+    @nextcord.slash_command(
+        "link-queue",
+        description="Shows how many account links wait for their roles and how long they take",
+        guild_ids=CONFIG["GENERAL"]["OWNER_COG_GUILD_IDS"],
+    )
+    @application_checks.is_owner()
+    async def link_queue_stats(self, interaction: nextcord.Interaction):
+        await interaction.send(
+            f"```\n{self.link_queue.format_stats()}\n```", ephemeral=True
+        )
+
+    @nextcord.slash_command(
+        "refresh-coverage",
+        description="Shows how many linked accounts were refreshed and how long ago",
+        guild_ids=CONFIG["GENERAL"]["OWNER_COG_GUILD_IDS"],
+    )
+    @application_checks.is_owner()
+    async def refresh_coverage(self, interaction: nextcord.Interaction):
+        report = self.refresh_scheduler.coverage_report(len(self.accounts))
+
+        await interaction.send(f"```\n{report}\n```", ephemeral=True)
+
+    @nextcord.slash_command(
+        "recompute-roles",
+        description="Gives everyone the roles for their saved playtime, without fetching any Career Profiles",
+        guild_ids=CONFIG["GENERAL"]["OWNER_COG_GUILD_IDS"],
+    )
+    @application_checks.is_owner()
+    async def recompute_roles(self, interaction: nextcord.Interaction):
+        def status(state: str) -> str:
+            return (
+                f"Role recompute {state}\n```\n{self.recompute_engine.progress.format()}\n```\n"  # type: ignore
+                "Done: roles changed, Unchanged: already right, Skipped: not linked or not on the server"
+            )
+
+        if self.recompute_engine.running:
+            await interaction.send(status("already running"), ephemeral=True)
+            return
+
+        home_guild = await GetOrFetch.guild(
+            self.bot, CONFIG["GENERAL"]["HOME_SERVER_ID"]
+        )
+        if not home_guild:
+            await interaction.send("The home server isnt available.", ephemeral=True)
+            return
+
+        await interaction.response.defer(ephemeral=True)
+
+        # Otherwise someone whose main is a new hero would lose their Main role
+        created = await self.create_missing_roles(home_guild)
+
+        # A copy, refreshes can add or remove rows while this runs
+        user_ids = list(self.playtimes.ids)
+        start_text = f"Recomputing the roles of {len(user_ids)} accounts."
+        if created:
+            start_text = f"Created the roles {', '.join(created)}.\n{start_text}"
+        await interaction.edit_original_message(content=start_text)
+
+        recompute = asyncio.create_task(
+            self.recompute_engine.run(
+                ((home_guild, user_id) for user_id in user_ids), total=len(user_ids)
+            )
+        )
+        while not recompute.done():
+            await asyncio.wait([recompute], timeout=10)
+
+            try:
+                await interaction.edit_original_message(
+                    content=status("finished" if recompute.done() else "running")
+                )
+            except (
+                nextcord.HTTPException
+            ):  # The interaction expired, /recompute-roles shows it while it runs
+                pass
+
+    @nextcord.slash_command(
+        "playtime-stats",
+        description="Shows the most played heroes and classes of everyone with a linked account",
+        guild_ids=CONFIG["GENERAL"]["OWNER_COG_GUILD_IDS"],
+    )
+    @application_checks.is_owner()
+    async def playtime_stats(
+        self,
+        interaction: nextcord.Interaction,
+        days: int = nextcord.SlashOption(
+            name="days",
+            description="Also show what was played in about this many days, from the snapshots",
+            required=False,
+            default=30,
+            min_value=1,
+        ),
+    ):
+        await interaction.response.defer(ephemeral=True)
+
+        # The newest snapshot that is at least that old, or the oldest there is
+        snapshots = self.playtimes.snapshots()
+        oldest_allowed = time.time() - days * 24 * 60 * 60
+        older = [s for s in snapshots if s.taken_at <= oldest_allowed]
+        since = older[-1] if older else (snapshots[0] if snapshots else None)
+
+        report = playtime_report(
+            self.playtimes, SNAPSHOTS.account_linker.heroes_by_api_name, since
+        )
+
+        await interaction.send(
+            file=nextcord.File(io.BytesIO(report.encode()), filename="playtime.txt"),
+            ephemeral=True,
+        )
+
+    @nextcord.slash_command(
+        "api-stats",
+        description="Shows how often the Career Profile cache could answer instead of ow-api.com",
+        guild_ids=CONFIG["GENERAL"]["OWNER_COG_GUILD_IDS"],
+    )
+    @application_checks.is_owner()
+    async def api_stats(self, interaction: nextcord.Interaction):
+        stats = self.overwatch_api.format_stats()
+        stats += (
+            f"\nPrivacy pre-checks: {self.private_prechecks}"
+            f" ({self.private_prechecks_still_private} without fetching the complete profile)"
+        )
+        stats += f"\nWaits for a role update of the same member: {self.member_locks.contended}"
+
+        await interaction.send(f"```\n{stats}\n```", ephemeral=True)
+
 
 async def setup(bot):
-    bot.add_cog(AccountLinker(bot))
+    cog = AccountLinker(bot, HTTP_CLIENT)
+    bot.add_cog(cog)
+
+    # After a reload on_ready doesnt come again, but the loops have to be started again and the menu
+    # has to use this instance, the stores of the old one are closed
+    if bot.is_ready():
+        await cog.on_ready()
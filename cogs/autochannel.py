@@ -5,7 +5,7 @@ import nextcord
 from nextcord import PermissionOverwrite
 from nextcord.ext import commands, tasks
 
-from internal_tools.configuration import CONFIG
+from internal_tools.config_snapshots import SNAPSHOTS
 from internal_tools.discord import *
 
 
@@ -112,19 +112,18 @@ class AutoChannel(commands.Cog):
         """
         You need to be connected to a voicechannel you own, and use the Autochannel commands in the text chat of that Voicechannel.
         """
-        if interaction.guild_id not in CONFIG["AUTOCHANNEL"]["GUILD_CONFIGS"]:
+        guild_config = SNAPSHOTS.autochannel.guilds.get(interaction.guild_id)  # type: ignore
+        if guild_config is None:
             return False
 
         if isinstance(interaction.user, nextcord.Member):
             if interaction.user.voice:
                 if interaction.user.voice.channel:
                     if interaction.channel == interaction.user.voice.channel:
-                        user_role_ids = [r.id for r in interaction.user.roles]
-                        for admin_role_id in CONFIG["AUTOCHANNEL"]["GUILD_CONFIGS"][
-                            interaction.guild_id
-                        ]["ADMIN_ROLE_IDS"]:
-                            if admin_role_id in user_role_ids:
-                                return True
+                        if not guild_config.admin_role_ids.isdisjoint(
+                            [r.id for r in interaction.user.roles]
+                        ):
+                            return True
 
                         if interaction.user.voice.channel.id in self.open_channels:
                             return self.open_channels[
@@ -135,22 +134,14 @@ class AutoChannel(commands.Cog):
 
     @commands.Cog.listener()
     async def on_ready(self):
-        for guild_id in CONFIG["AUTOCHANNEL"]["GUILD_CONFIGS"]:
+        for guild_config in SNAPSHOTS.autochannel.guilds.values():
             create_channel = await GetOrFetch.channel(
-                self.bot,
-                CONFIG["AUTOCHANNEL"]["GUILD_CONFIGS"][guild_id][
-                    "CREATE_VOICECHANNEL_ID"
-                ],
+                self.bot, guild_config.create_voicechannel_id
             )
             if isinstance(create_channel, nextcord.VoiceChannel):
                 if create_channel.category:
                     for sub_channel in create_channel.category.voice_channels:
-                        if (
-                            sub_channel.id
-                            == CONFIG["AUTOCHANNEL"]["GUILD_CONFIGS"][guild_id][
-                                "CREATE_VOICECHANNEL_ID"
-                            ]
-                        ):
+                        if sub_channel.id == guild_config.create_voicechannel_id:
                             continue
 
                         await sub_channel.delete()
@@ -162,8 +153,10 @@ class AutoChannel(commands.Cog):
         before: nextcord.VoiceState,
         after: nextcord.VoiceState,
     ):
+        autochannel_config = SNAPSHOTS.autochannel
+
         # If guild was setup
-        if member.guild.id in CONFIG["AUTOCHANNEL"]["GUILD_CONFIGS"]:
+        if member.guild.id in autochannel_config.guilds:
             if before.channel == after.channel:
                 return
 
@@ -171,10 +164,9 @@ class AutoChannel(commands.Cog):
             if before.channel:
                 if before.channel.id in self.open_channels:
                     if len(before.channel.members) == 0:
-                        time = datetime.datetime.now() + datetime.timedelta(
-                            minutes=CONFIG["AUTOCHANNEL"][
-                                "DELETE_EMPTY_CHANNELS_AFTER_X_MINS"
-                            ]
+                        time = (
+                            datetime.datetime.now()
+                            + autochannel_config.delete_empty_channels_after
                         )
                         self.channels_to_delete[
                             self.open_channels[before.channel.id]
@@ -183,12 +175,7 @@ class AutoChannel(commands.Cog):
             # If user joined a voicechannel
             if after.channel:
                 # If that channel is the create channel, make a new channel and move user to it
-                if (
-                    after.channel.id
-                    == CONFIG["AUTOCHANNEL"]["GUILD_CONFIGS"][after.channel.guild.id][
-                        "CREATE_VOICECHANNEL_ID"
-                    ]
-                ):
+                if after.channel.id in autochannel_config.guilds_by_create_channel_id:
                     voice_channel = await after.channel.guild.create_voice_channel(
                         member.display_name, category=after.channel.category
                     )
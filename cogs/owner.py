@@ -5,11 +5,13 @@ from nextcord.ext import commands
 
 from internal_tools.configuration import CONFIG
 from internal_tools.discord import *
+from internal_tools.http import HTTP_CLIENT, HttpClient
 
 
 class Owner(commands.Cog):
-    def __init__(self, bot: commands.Bot):
+    def __init__(self, bot: commands.Bot, http: HttpClient):
         self.bot = bot
+        self.http = http
 
     async def cog_application_command_check(self, interaction: nextcord.Interaction):
         """
@@ -175,6 +177,19 @@ class Owner(commands.Cog):
         else:
             await interaction.send("Done", ephemeral=True)
 
+    @nextcord.slash_command(
+        name="http-stats",
+        description="Shows how the shared HTTP connection pool is used",
+        guild_ids=CONFIG["GENERAL"]["OWNER_COG_GUILD_IDS"],
+    )
+    async def http_stats(self, interaction: nextcord.Interaction):
+        """
+        Shows how the shared HTTP connection pool is used.
+        """
+        await interaction.send(
+            f"```\n{self.http.stats().format()}\n```", ephemeral=True
+        )
+
 
 async def setup(bot):
-    bot.add_cog(Owner(bot))
+    bot.add_cog(Owner(bot, HTTP_CLIENT))
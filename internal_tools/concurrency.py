@@ -0,0 +1,569 @@
+import asyncio
+import collections
+import statistics
+import time
+import weakref
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Coroutine,
+    Deque,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    TypeVar,
+)
+
+from internal_tools.configuration import print_error
+
+T = TypeVar("T")
+
+__all__ = [
+    "CircuitBreaker",
+    "JobQueue",
+    "KeyedLocks",
+    "RefreshEngine",
+    "RefreshProgress",
+    "RefreshResult",
+    "SingleFlight",
+    "TokenBucket",
+]
+
+
+class TokenBucket:
+    """
+    Rate limit shared by everything that calls `acquire()`: `rate` tokens per second,
+    with up to `capacity` of them saved up for bursts. Waiters are served in order.
+    """
+
+    def __init__(self, rate: float, capacity: int = 1):
+        self.rate = rate
+        self.capacity = capacity
+
+        self._tokens = float(capacity)
+        self._last_refill = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._last_refill) * self.rate
+        )
+        self._last_refill = now
+
+    async def acquire(self):
+        async with self._lock:
+            self._refill()
+
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+
+            self._tokens -= 1
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time. Whoever asks for a key that is already running
+    waits for that call and gets its result, instead of starting the same work again.
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    def start(
+        self, key: Hashable, func: Callable[[], Coroutine[Any, Any, T]]
+    ) -> "asyncio.Task[T]":
+        """
+        Starts `func()` for `key`, or returns the call that already runs for it.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.create_task(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.coalesced += 1
+
+        return task
+
+    async def run(self, key: Hashable, func: Callable[[], Coroutine[Any, Any, T]]) -> T:
+        # Shielded, so one caller being cancelled doesnt cancel it for the others
+        return await asyncio.shield(self.start(key, func))
+
+
+class KeyedLocks:
+    """
+    One `asyncio.Lock` per key, which only exists while someone uses it.
+    """
+
+    def __init__(self):
+        self.contended = 0
+        self._locks: "weakref.WeakValueDictionary[Hashable, asyncio.Lock]" = (
+            weakref.WeakValueDictionary()
+        )
+
+    def __call__(self, key: Hashable) -> asyncio.Lock:
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        elif lock.locked():
+            self.contended += 1
+
+        return lock
+
+
+class CircuitBreaker:
+    """
+    Stops requests to an upstream that keeps failing.
+
+    Closed, everything goes through. It opens after `failure_threshold` failures in a row, or once
+    at least `error_rate_threshold` of the last `window` requests failed. Open, everything is rejected
+    for `open_seconds`. After that it is half-open and lets a single request through as a probe:
+    if it works the breaker closes again, if not it opens for twice as long as before, up to `max_open_seconds`.
+
+    Callers ask `allow()` before a request and report how it went with `record_success()` / `record_failure()`.
+    `on_state_change(old_state, new_state, summary)` is called when it opens and when it closes again,
+    `summary` says why and counts the failure reasons since the last time, so an outage is 2 messages.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(
+        self,
+        failure_threshold: int,
+        error_rate_threshold: float,
+        window: int,
+        open_seconds: float,
+        max_open_seconds: float,
+        on_state_change: Optional[
+            Callable[[str, str, str], Coroutine[Any, Any, Any]]
+        ] = None,
+    ):
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.on_state_change = on_state_change
+
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.failure_reasons: "collections.Counter[str]" = collections.Counter()
+        self.rejected = 0
+        self.times_opened = 0
+        self.state_changed_at = time.monotonic()
+
+        self._outcomes: Deque[bool] = collections.deque(maxlen=window)
+        self._current_open_seconds = open_seconds
+        self._open_until = 0.0
+        self._probe_out = False
+        self._changed = asyncio.Event()
+        self._rejected_at_change = 0
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    @property
+    def retry_after(self) -> float:
+        """
+        Seconds until the next probe is let through, 0 if it isnt open.
+        """
+        if self.state != self.OPEN:
+            return 0.0
+
+        return max(self._open_until - time.monotonic(), 0.0)
+
+    @property
+    def ready(self) -> bool:
+        """
+        If a request right now could go through.
+        """
+        if self.state == self.OPEN:
+            return time.monotonic() >= self._open_until
+        if self.state == self.HALF_OPEN:
+            return not self._probe_out
+
+        return True
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN and time.monotonic() >= self._open_until:
+            self._change_state(self.HALF_OPEN)
+
+        if self.state == self.HALF_OPEN and not self._probe_out:
+            self._probe_out = True
+            return True
+
+        if self.state == self.CLOSED:
+            return True
+
+        self.rejected += 1
+        return False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self._outcomes.append(True)
+
+        if self.state == self.HALF_OPEN:
+            self._probe_out = False
+            self._current_open_seconds = self.open_seconds
+            self._outcomes.clear()
+            self._change_state(self.CLOSED)
+
+    def record_failure(self, reason: str):
+        self.consecutive_failures += 1
+        self._outcomes.append(False)
+        self.failure_reasons[reason] += 1
+
+        if self.state == self.HALF_OPEN:
+            self._probe_out = False
+            self._current_open_seconds = min(
+                self._current_open_seconds * 2, self.max_open_seconds
+            )
+            self._open()
+        elif self.state == self.CLOSED and (
+            self.consecutive_failures >= self.failure_threshold
+            or (
+                len(self._outcomes) == self._outcomes.maxlen
+                and self.error_rate >= self.error_rate_threshold
+            )
+        ):
+            self._open()
+
+    async def wait_ready(self):
+        """
+        Waits while requests would be rejected, so callers can pause instead of failing.
+        """
+        while not self.ready:
+            try:
+                await asyncio.wait_for(
+                    self._changed.wait(), timeout=self.retry_after or None
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    def format_summary(self) -> str:
+        lines = [
+            f"State: {self.state}, last opened or closed {(time.monotonic() - self.state_changed_at) / 60:.1f} min ago",
+            f"Failures in a row: {self.consecutive_failures}",
+            f"Error rate: {self.error_rate:.0%} of the last {len(self._outcomes)} requests",
+            f"Times opened: {self.times_opened}",
+            f"Rejected requests: {self.rejected}",
+        ]
+        if self.state == self.OPEN:
+            lines.append(f"Next probe in: {self.retry_after:.0f} s")
+        if self.failure_reasons:
+            lines.append("Failures since it last opened or closed:")
+            lines.extend(
+                f"  {count}x {reason}"
+                for reason, count in self.failure_reasons.most_common(5)
+            )
+
+        return "\n".join(lines)
+
+    def _open(self):
+        self._open_until = time.monotonic() + self._current_open_seconds
+        self.times_opened += 1
+        self._change_state(self.OPEN)
+
+    def _change_state(self, state: str):
+        old_state = self.state
+        self.state = state
+
+        # Wakes everyone in wait_ready
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+        # Probes going back and forth between open and half-open are all part of the same outage,
+        # only its start and its end are reported
+        if (
+            state == self.HALF_OPEN
+            or old_state == self.HALF_OPEN
+            and state == self.OPEN
+        ):
+            return
+
+        now = time.monotonic()
+        if state == self.OPEN:
+            summary = (
+                f"Opened after {self.consecutive_failures} failures in a row, "
+                f"error rate {self.error_rate:.0%}. Next probe in {self.retry_after:.0f} s."
+            )
+        else:
+            summary = (
+                f"Closed again after {(now - self.state_changed_at) / 60:.1f} min, "
+                f"{self.rejected - self._rejected_at_change} requests were rejected."
+            )
+        if self.failure_reasons:
+            summary += "\n" + "\n".join(
+                f"{count}x {reason}"
+                for reason, count in self.failure_reasons.most_common(5)
+            )
+
+        self.failure_reasons = collections.Counter()
+        self.state_changed_at = now
+        self._rejected_at_change = self.rejected
+
+        if self.on_state_change is not None:
+            task = asyncio.create_task(self.on_state_change(old_state, state, summary))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+
+class JobQueue:
+    """
+    Bounded queue of jobs with `worker_count` workers that stay around, each running `handle(job)`.
+    `submit` never waits, if `max_size` jobs are waiting already the job is refused,
+    so whoever submits can answer right away either way.
+    An exception in `handle` is given to `on_error`.
+    """
+
+    def __init__(
+        self,
+        handle: Callable[[Any], Awaitable[Any]],
+        worker_count: int,
+        max_size: int,
+        on_error: Optional[Callable[[Exception], Awaitable[Any]]] = None,
+    ):
+        self.handle = handle
+        self.worker_count = worker_count
+        self.max_size = max_size
+        self.on_error = on_error
+
+        self.submitted = 0
+        self.refused = 0
+        self.completed = 0
+        self.max_depth = 0
+        self.times_to_result: Deque[float] = collections.deque(maxlen=1000)
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def submit(self, job: Any) -> bool:
+        """
+        Queues `job`, False if the queue is full. Workers get started with the first job.
+        """
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_size)
+            self._workers = [
+                asyncio.create_task(self._work()) for _ in range(self.worker_count)
+            ]
+
+        try:
+            self._queue.put_nowait((time.monotonic(), job))
+        except asyncio.QueueFull:
+            self.refused += 1
+            return False
+
+        self.submitted += 1
+        self.max_depth = max(self.max_depth, self.depth)
+
+        return True
+
+    def stop(self):
+        for task in self._workers:
+            task.cancel()
+
+        self._workers = []
+        self._queue = None
+
+    async def _work(self):
+        queue = self._queue
+        assert queue is not None
+
+        while True:
+            queued_at, job = await queue.get()
+            try:
+                await self.handle(job)
+            except Exception as e:
+                await self._report(e)
+            finally:
+                self.completed += 1
+                self.times_to_result.append(time.monotonic() - queued_at)
+                queue.task_done()
+
+    async def _report(self, e: Exception):
+        if not self.on_error:
+            return
+
+        # A worker that dies here wouldnt take jobs anymore, and the queue would stay full
+        try:
+            await self.on_error(e)
+        except Exception as report_error:  # Its traceback includes `e`
+            print_error(report_error)
+
+    def format_stats(self) -> str:
+        lines = [
+            f"Waiting: {self.depth}/{self.max_size} (most so far: {self.max_depth})",
+            f"Workers: {self.worker_count}",
+            f"Submitted: {self.submitted}",
+            f"Completed: {self.completed}",
+            f"Refused (queue full): {self.refused}",
+        ]
+        if len(self.times_to_result) >= 2:
+            percentiles = statistics.quantiles(self.times_to_result, n=100)
+            lines.append(
+                f"Time to result, last {len(self.times_to_result)}: "
+                f"p50 {percentiles[49]:.1f} s, p99 {percentiles[98]:.1f} s"
+            )
+        elif self.times_to_result:
+            lines.append(f"Time to result: {self.times_to_result[0]:.1f} s")
+
+        return "\n".join(lines)
+
+
+class RefreshResult:
+    DONE = "done"
+    FAILED = "failed"
+    PRIVATE = "private"
+    SKIPPED = "skipped"
+    UNCHANGED = "unchanged"
+
+
+@dataclass
+class RefreshProgress:
+    total: int
+    done: int = 0
+    failed: int = 0
+    private: int = 0
+    skipped: int = 0
+    unchanged: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+    finished_at: Optional[float] = None
+
+    @property
+    def processed(self) -> int:
+        return self.done + self.failed + self.private + self.skipped + self.unchanged
+
+    @property
+    def elapsed_seconds(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def per_second(self) -> float:
+        elapsed = self.elapsed_seconds
+        return self.processed / elapsed if elapsed else 0.0
+
+    @property
+    def eta_seconds(self) -> Optional[float]:
+        if self.finished_at is not None:
+            return 0.0
+        if not self.per_second:
+            return None
+
+        return max(self.total - self.processed, 0) / self.per_second
+
+    def add(self, result: str):
+        setattr(self, result, getattr(self, result) + 1)
+
+    def format(self) -> str:
+        eta = self.eta_seconds
+        lines = [
+            f"Processed: {self.processed}/{self.total}",
+            f"Done: {self.done}",
+            f"Failed: {self.failed}",
+            f"Private: {self.private}",
+            f"Skipped: {self.skipped}",
+            f"Unchanged: {self.unchanged}",
+            f"Speed: {self.per_second * 60:.1f} per minute",
+            f"Elapsed: {self.elapsed_seconds / 60:.1f} min",
+        ]
+        if self.finished_at is None:
+            lines.append(
+                f"Remaining: {eta / 60:.1f} min" if eta is not None else "Remaining: ?"
+            )
+
+        return "\n".join(lines)
+
+
+class RefreshEngine:
+    """
+    Runs `handle(item)` for every item of a pass with `worker_count` concurrent workers.
+    `handle` returns one of the `RefreshResult` values, which get counted in `progress`.
+    An exception counts as failed and is given to `on_error`.
+    With a `gate`, workers wait for it to be ready before every item, so an open breaker pauses the pass.
+
+    How fast a pass is depends on `worker_count` and on the rate limits `handle` waits for,
+    so for N items in a window of W seconds the rate limit needs to allow N / W per second,
+    and `worker_count` needs to be at least that rate times the seconds one item takes.
+    """
+
+    def __init__(
+        self,
+        handle: Callable[[Any], Awaitable[str]],
+        worker_count: int,
+        on_error: Optional[Callable[[Exception], Awaitable[Any]]] = None,
+        gate: Optional[CircuitBreaker] = None,
+    ):
+        self.handle = handle
+        self.worker_count = worker_count
+        self.on_error = on_error
+        self.gate = gate
+
+        self.progress: Optional[RefreshProgress] = None
+
+    @property
+    def running(self) -> bool:
+        return self.progress is not None and self.progress.finished_at is None
+
+    async def run(self, items: Iterable[Any], total: int) -> RefreshProgress:
+        progress = self.progress = RefreshProgress(total=total)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.worker_count * 2)
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                try:
+                    if self.gate is not None:
+                        await self.gate.wait_ready()
+
+                    progress.add(await self.handle(item))
+                except Exception as e:
+                    progress.add(RefreshResult.FAILED)
+                    await self._report(e)
+                finally:
+                    queue.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.worker_count)]
+        try:
+            # The queue is bounded, so items are only read as fast as they get handled
+            for item in items:
+                await queue.put(item)
+
+            await queue.join()
+        finally:
+            for task in workers:
+                task.cancel()
+
+            progress.finished_at = time.monotonic()
+
+        return progress
+
+    async def _report(self, e: Exception):
+        if not self.on_error:
+            return
+
+        # A worker that dies here would leave `run()` waiting for the queue forever
+        try:
+            await self.on_error(e)
+        except Exception as report_error:  # Its traceback includes `e`
+            print_error(report_error)
@@ -0,0 +1,260 @@
+import datetime
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import FrozenSet, List, Mapping, Optional, Tuple
+
+from internal_tools.configuration import CONFIG
+
+__all__ = [
+    "SNAPSHOTS",
+    "AccountLinkerSnapshot",
+    "AutoChannelSnapshot",
+    "GeneralSnapshot",
+    "GuildAutoChannelSnapshot",
+    "HeroSnapshot",
+]
+
+
+def _color(hex_color: str):
+    return int(hex_color.replace("#", ""), 16)
+
+
+@dataclass(frozen=True, slots=True)
+class GeneralSnapshot:
+    home_server_id: int
+    owner_cog_guild_ids: Tuple[int, ...]
+    embed_color: int
+    error_webhook_url: str
+    data_write_behind_seconds: float
+
+    @classmethod
+    def from_config(cls):
+        conf = CONFIG["GENERAL"]
+
+        return cls(
+            home_server_id=conf["HOME_SERVER_ID"],
+            owner_cog_guild_ids=tuple(conf["OWNER_COG_GUILD_IDS"]),
+            embed_color=_color(conf["EMBED_COLOR"]),
+            error_webhook_url=conf["ERROR_WEBHOOK_URL"],
+            data_write_behind_seconds=conf["DATA_WRITE_BEHIND_SECONDS"],
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class GuildAutoChannelSnapshot:
+    guild_id: int
+    standard_role_id: int
+    create_voicechannel_id: int
+    admin_role_ids: FrozenSet[int]
+
+
+@dataclass(frozen=True, slots=True)
+class AutoChannelSnapshot:
+    delete_empty_channels_after: datetime.timedelta
+    guilds: Mapping[int, GuildAutoChannelSnapshot]
+    guilds_by_create_channel_id: Mapping[int, GuildAutoChannelSnapshot]
+
+    @classmethod
+    def from_config(cls):
+        conf = CONFIG["AUTOCHANNEL"]
+
+        guilds = {
+            int(guild_id): GuildAutoChannelSnapshot(
+                guild_id=int(guild_id),
+                standard_role_id=vals["STANDARD_ROLE_ID"],
+                create_voicechannel_id=vals["CREATE_VOICECHANNEL_ID"],
+                admin_role_ids=frozenset(vals["ADMIN_ROLE_IDS"]),
+            )
+            for guild_id, vals in conf["GUILD_CONFIGS"].items()
+        }
+
+        return cls(
+            delete_empty_channels_after=datetime.timedelta(
+                minutes=conf["DELETE_EMPTY_CHANNELS_AFTER_X_MINS"]
+            ),
+            guilds=MappingProxyType(guilds),
+            guilds_by_create_channel_id=MappingProxyType(
+                {guild.create_voicechannel_id: guild for guild in guilds.values()}
+            ),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class HeroSnapshot:
+    name: str
+    api_name: str
+    hero_class: str
+    color: int
+
+
+@dataclass(frozen=True, slots=True)
+class AccountLinkerSnapshot:
+    menu_channel_id: int
+    refresh_workers: int
+    refresh_batch_size: int
+    link_workers: int
+    recompute_workers: int
+    link_queue_size: int
+    refresh_interval: datetime.timedelta
+    refresh_max_interval: datetime.timedelta
+    refresh_backoff_factor: float
+    private_backoff_factor: float
+    active_player_refresh_after: datetime.timedelta
+    api_base_url: str
+    api_requests_per_second: float
+    api_request_burst: int
+    api_breaker_failures: int
+    api_breaker_error_rate: float
+    api_breaker_window: int
+    api_breaker_open_seconds: float
+    api_breaker_max_open_seconds: float
+    role_edits_per_second: float
+    role_edit_burst: int
+    profile_cache_ttl_seconds: float
+    profile_cache_stale_seconds: float
+    private_profile_cache_ttl_seconds: float
+    profile_cache_max_bytes: int
+    reminder_batch_size: int
+    reminder_dm_concurrency: int
+    playtime_snapshot_interval: datetime.timedelta
+    playtime_snapshots_kept: int
+    seperator_role_color: int
+    top_3_seperator_role_name: str
+    other_seperator_role_name: str
+    class_role_colors: Mapping[str, int]
+    heroes: Tuple[HeroSnapshot, ...]
+    heroes_by_api_name: Mapping[str, HeroSnapshot]
+    managed_role_names: FrozenSet[str]
+
+    @classmethod
+    def from_config(cls):
+        conf = CONFIG["ACCOUNT_LINKER"]
+
+        heroes = tuple(
+            HeroSnapshot(
+                name=hero,
+                api_name=vals["API_NAME"],
+                hero_class=vals["CLASS"],
+                color=_color(vals["COLOR"]),
+            )
+            for hero, vals in conf["HEROES"].items()
+        )
+
+        return cls(
+            menu_channel_id=conf["MENU_CHANNEL_ID"],
+            refresh_workers=conf["REFRESH_WORKERS"],
+            refresh_batch_size=conf["REFRESH_BATCH_SIZE"],
+            link_workers=conf["LINK_WORKERS"],
+            recompute_workers=conf["RECOMPUTE_WORKERS"],
+            link_queue_size=conf["LINK_QUEUE_SIZE"],
+            refresh_interval=datetime.timedelta(hours=conf["REFRESH_INTERVAL_HOURS"]),
+            refresh_max_interval=datetime.timedelta(
+                hours=conf["REFRESH_MAX_INTERVAL_HOURS"]
+            ),
+            refresh_backoff_factor=conf["REFRESH_BACKOFF_FACTOR"],
+            private_backoff_factor=conf["PRIVATE_BACKOFF_FACTOR"],
+            active_player_refresh_after=datetime.timedelta(
+                hours=conf["ACTIVE_PLAYER_REFRESH_AFTER_HOURS"]
+            ),
+            api_base_url=conf["API_BASE_URL"],
+            api_requests_per_second=conf["API_REQUESTS_PER_SECOND"],
+            api_request_burst=conf["API_REQUEST_BURST"],
+            api_breaker_failures=conf["API_BREAKER_FAILURES"],
+            api_breaker_error_rate=conf["API_BREAKER_ERROR_RATE"],
+            api_breaker_window=conf["API_BREAKER_WINDOW"],
+            api_breaker_open_seconds=conf["API_BREAKER_OPEN_SECONDS"],
+            api_breaker_max_open_seconds=conf["API_BREAKER_MAX_OPEN_SECONDS"],
+            role_edits_per_second=conf["ROLE_EDITS_PER_SECOND"],
+            role_edit_burst=conf["ROLE_EDIT_BURST"],
+            profile_cache_ttl_seconds=conf["PROFILE_CACHE_TTL_SECONDS"],
+            profile_cache_stale_seconds=conf["PROFILE_CACHE_STALE_SECONDS"],
+            private_profile_cache_ttl_seconds=conf["PRIVATE_PROFILE_CACHE_TTL_SECONDS"],
+            profile_cache_max_bytes=conf["PROFILE_CACHE_MAX_BYTES"],
+            reminder_batch_size=conf["REMINDER_BATCH_SIZE"],
+            reminder_dm_concurrency=conf["REMINDER_DM_CONCURRENCY"],
+            playtime_snapshot_interval=datetime.timedelta(
+                hours=conf["PLAYTIME_SNAPSHOT_INTERVAL_HOURS"]
+            ),
+            playtime_snapshots_kept=conf["PLAYTIME_SNAPSHOTS_KEPT"],
+            seperator_role_color=_color(conf["SEPERATOR_ROLE_COLOR"]),
+            top_3_seperator_role_name=conf["SEPERATOR_ROLE_NAMES"]["TOP_3_USED_HEROES"],
+            other_seperator_role_name=conf["SEPERATOR_ROLE_NAMES"]["OTHER_INFOS"],
+            class_role_colors=MappingProxyType(
+                {
+                    hero_class: _color(color)
+                    for hero_class, color in conf["CLASS_ROLES"].items()
+                }
+            ),
+            heroes=heroes,
+            heroes_by_api_name=MappingProxyType(
+                {hero.api_name: hero for hero in heroes}
+            ),
+            managed_role_names=frozenset(
+                [
+                    *[hero.name for hero in heroes],
+                    *conf["CLASS_ROLES"],
+                    *conf["SEPERATOR_ROLE_NAMES"].values(),
+                ]
+            ),
+        )
+
+
+class ConfigSnapshots:
+    """
+    Frozen, typed copies of the config categories with derived values already computed, for hot paths.
+
+    Every snapshot gets built on first access and replaced as a whole when `CONFIG.reload()` is called,
+    so keep a local reference if you need consistent values across an `await`.
+    """
+
+    __slots__ = ("_general", "_autochannel", "_account_linker")
+
+    def __init__(self):
+        self._general: Optional[GeneralSnapshot] = None
+        self._autochannel: Optional[AutoChannelSnapshot] = None
+        self._account_linker: Optional[AccountLinkerSnapshot] = None
+
+        CONFIG.add_reload_callback(self._rebuild)
+
+    @property
+    def general(self) -> GeneralSnapshot:
+        if self._general is None:
+            self._general = GeneralSnapshot.from_config()
+
+        return self._general
+
+    @property
+    def autochannel(self) -> AutoChannelSnapshot:
+        if self._autochannel is None:
+            self._autochannel = AutoChannelSnapshot.from_config()
+
+        return self._autochannel
+
+    @property
+    def account_linker(self) -> AccountLinkerSnapshot:
+        if self._account_linker is None:
+            self._account_linker = AccountLinkerSnapshot.from_config()
+
+        return self._account_linker
+
+    def _rebuild(self, categories: List[str]):
+        # Build first, swap after, so a failing category doesnt leave a half new state
+        general = GeneralSnapshot.from_config() if "GENERAL" in categories else None
+        autochannel = (
+            AutoChannelSnapshot.from_config() if "AUTOCHANNEL" in categories else None
+        )
+        account_linker = (
+            AccountLinkerSnapshot.from_config()
+            if "ACCOUNT_LINKER" in categories
+            else None
+        )
+
+        if general:
+            self._general = general
+        if autochannel:
+            self._autochannel = autochannel
+        if account_linker:
+            self._account_linker = account_linker
+
+
+SNAPSHOTS = ConfigSnapshots()
@@ -1,23 +1,362 @@
+import asyncio
 import datetime
 import os
 import re
+import time
+import traceback
 import uuid
+import weakref
+import zlib
 from collections import UserDict
 from functools import reduce
-from typing import Any, Callable, Dict, List, Literal, Optional
+from typing import Any, Callable, Dict, List, Literal, Optional, Set, Union
 
 import orjson
 
-__all__ = ["CONFIG", "JsonDictSaver"]
+_import_started = time.perf_counter()
+
+__all__ = [
+    "CONFIG",
+    "IMPORT_SECONDS",
+    "DictDecoder",
+    "JsonDictSaver",
+    "Schema",
+    "TrackedDict",
+    "TrackedList",
+    "compile_schema",
+    "flush_all_savers",
+    "print_error",
+    "print_task_error",
+    "register_saver",
+    "track_changes",
+    "unregister_saver",
+]
+
+_WRITE_BEHIND_SAVERS: "weakref.WeakValueDictionary[int, Any]" = (
+    weakref.WeakValueDictionary()
+)  # Keyed by id(), since UserDicts arent hashable
+
+
+def register_saver(saver: Any):
+    """
+    Makes `flush_all_savers()` include `saver`, which needs to have an async `flush_async()` method.
+    """
+    _WRITE_BEHIND_SAVERS[id(saver)] = saver
+
+
+def unregister_saver(saver: Any):
+    """
+    Removes `saver` from `flush_all_savers()` again, for when it gets closed.
+    """
+    _WRITE_BEHIND_SAVERS.pop(id(saver), None)
+
+
+async def flush_all_savers():
+    """
+    Writes every pending write-behind save to disk. Call this before shutting down.
+    A saver that fails to write doesnt stop the others.
+    """
+    for saver in list(_WRITE_BEHIND_SAVERS.values()):
+        try:
+            await saver.flush_async()
+        except Exception as e:
+            print_error(e)
+
+
+def print_error(e: BaseException):
+    """
+    Prints `e` with its traceback, for errors that have nowhere else to go.
+    """
+    traceback.print_exception(type(e), e, e.__traceback__)
+
+
+def print_task_error(task: asyncio.Task):
+    """
+    Done callback for background tasks nobody awaits, so their errors dont go unnoticed.
+    """
+    if task.cancelled():
+        return
+
+    e = task.exception()
+    if e is not None:
+        print_error(e)
+
+
+Schema = Union[type, Dict[Any, "Schema"], List["Schema"]]
+"""
+Describes the types inside a stored dict, so loading doesnt have to guess them.
+
+- A type (`int`, `str`, `datetime.datetime`, `uuid.UUID`, ...) converts a single value.
+- A dict maps keys to the schema of their value. A type as key (like `{int: ...}`) stands for
+  every other key, which gets converted to that type.
+- A list with one schema in it is a list of such values.
+
+Example for linked accounts: `{int: {"platform": str, "account_name": str}}`
+"""
+
+
+def _keep(val):
+    return val
+
+
+def _parse_iso(parser: Callable):
+    def convert(val):
+        return parser(val) if isinstance(val, str) else val
+
+    return convert
+
+
+def _convert_bool(val):
+    return val if isinstance(val, bool) else val == "true"
+
+
+_SCHEMA_CONVERTERS: Dict[Any, Callable[[Any], Any]] = {
+    str: _keep,
+    object: _keep,
+    Any: _keep,
+    int: int,
+    float: float,
+    bool: _convert_bool,
+    datetime.datetime: _parse_iso(datetime.datetime.fromisoformat),
+    datetime.date: _parse_iso(datetime.date.fromisoformat),
+    datetime.time: _parse_iso(datetime.time.fromisoformat),
+    uuid.UUID: _parse_iso(uuid.UUID),
+}
+
+
+class DictDecoder:
+    """
+    Compiled form of a dict `Schema`.
+    """
+
+    def __init__(self, schema: Dict[Any, Schema]):
+        self.fields: Dict[Any, Callable[[Any], Any]] = {}
+        self.other_keys: Optional[Callable[[Any], Any]] = None
+        self.other_values: Callable[[Any], Any] = _keep
+
+        for key, sub_schema in schema.items():
+            if isinstance(key, type) or key is Any:
+                self.other_keys = _SCHEMA_CONVERTERS[key]
+                self.other_values = compile_schema(sub_schema)
+            else:
+                self.fields[key] = compile_schema(sub_schema)
+
+        self.changes_nothing = self.other_keys is None and all(
+            [convert is _keep for convert in self.fields.values()]
+        )
+
+    def value_decoder(self, key: Any) -> Callable[[Any], Any]:
+        """
+        Decoder for the value that is stored under `key`.
+        """
+        if key in self.fields:
+            return self.fields[key]
+        if self.other_keys is not None:
+            return self.other_values
+
+        return _keep
+
+    def __call__(self, data: dict) -> dict:
+        if self.changes_nothing:
+            return data
+
+        fields = self.fields
+        convert_key = self.other_keys
+        convert_value = self.other_values
 
-if not os.path.isdir("data"):
-    os.mkdir("data")
+        if not fields and convert_key is not None:
+            return {convert_key(k): convert_value(v) for k, v in data.items()}
+
+        new_data = {}
+        for key, val in data.items():
+            if key in fields:
+                new_data[key] = fields[key](val)
+            elif convert_key is not None:
+                new_data[convert_key(key)] = convert_value(val)
+            else:
+                new_data[key] = val
+
+        return new_data
+
+
+def compile_schema(schema: Schema) -> Callable[[Any], Any]:
+    """
+    Turns a `Schema` into a function that decodes freshly loaded JSON data in a single pass.
+    """
+    if isinstance(schema, dict):
+        return DictDecoder(schema)
+
+    if isinstance(schema, list):
+        convert_item = compile_schema(schema[0])
+        return lambda val: [convert_item(x) for x in val]
+
+    if schema in _SCHEMA_CONVERTERS:
+        return _SCHEMA_CONVERTERS[schema]
+
+    raise TypeError(f"Type '{schema}' is not supported in a schema")
+
+
+def track_changes(item: Any, on_change: Callable[[], None]) -> Any:
+    """
+    Returns `item` with every dict / list in it replaced by a `TrackedDict` / `TrackedList`
+    that calls `on_change` when it gets changed. Other values are returned as they are.
+    """
+    if isinstance(item, dict):
+        if isinstance(item, TrackedDict) and item.on_change is on_change:
+            return item
+
+        return TrackedDict(item, on_change)
+
+    if isinstance(item, list):
+        if isinstance(item, TrackedList) and item.on_change is on_change:
+            return item
+
+        return TrackedList(item, on_change)
+
+    return item
+
+
+class TrackedDict(dict):
+    """
+    dict that calls `on_change` whenever it or one of the containers inside it changes.
+    orjson serializes it like a normal dict.
+    """
+
+    __slots__ = ("on_change",)
+
+    def __init__(self, data: dict, on_change: Callable[[], None]):
+        super().__init__(
+            {key: track_changes(item, on_change) for key, item in data.items()}
+        )
+        self.on_change = on_change
+
+    def __setitem__(self, key: Any, item: Any) -> None:
+        super().__setitem__(key, track_changes(item, self.on_change))
+        self.on_change()
+
+    def __delitem__(self, key: Any) -> None:
+        super().__delitem__(key)
+        self.on_change()
+
+    def __ior__(self, other: Any):
+        self.update(other)
+        return self
+
+    def pop(self, *args):
+        item = super().pop(*args)
+        self.on_change()
+        return item
+
+    def popitem(self):
+        item = super().popitem()
+        self.on_change()
+        return item
+
+    def clear(self) -> None:
+        super().clear()
+        self.on_change()
+
+    def update(self, *args, **kwargs) -> None:
+        for key, item in dict(*args, **kwargs).items():
+            super().__setitem__(key, track_changes(item, self.on_change))
+        self.on_change()
+
+    def setdefault(self, key: Any, default: Any = None):
+        if key not in self:
+            self[key] = default
+
+        return self[key]
+
+
+class TrackedList(list):
+    """
+    list that calls `on_change` whenever it or one of the containers inside it changes.
+    orjson serializes it like a normal list.
+    """
+
+    __slots__ = ("on_change",)
+
+    def __init__(self, data: list, on_change: Callable[[], None]):
+        super().__init__([track_changes(item, on_change) for item in data])
+        self.on_change = on_change
+
+    def __setitem__(self, index: Any, item: Any) -> None:
+        if isinstance(index, slice):
+            item = [track_changes(i, self.on_change) for i in item]
+        else:
+            item = track_changes(item, self.on_change)
+
+        super().__setitem__(index, item)
+        self.on_change()
+
+    def __delitem__(self, index: Any) -> None:
+        super().__delitem__(index)
+        self.on_change()
+
+    def __iadd__(self, other: Any):
+        self.extend(other)
+        return self
+
+    def __imul__(self, other: Any):
+        super().__imul__(other)
+        self.on_change()
+        return self
+
+    def append(self, item: Any) -> None:
+        super().append(track_changes(item, self.on_change))
+        self.on_change()
+
+    def extend(self, other: Any) -> None:
+        super().extend([track_changes(item, self.on_change) for item in other])
+        self.on_change()
+
+    def insert(self, index: Any, item: Any) -> None:
+        super().insert(index, track_changes(item, self.on_change))
+        self.on_change()
+
+    def pop(self, *args):
+        item = super().pop(*args)
+        self.on_change()
+        return item
+
+    def remove(self, item: Any) -> None:
+        super().remove(item)
+        self.on_change()
+
+    def clear(self) -> None:
+        super().clear()
+        self.on_change()
+
+    def sort(self, *args, **kwargs) -> None:
+        super().sort(*args, **kwargs)
+        self.on_change()
+
+    def reverse(self) -> None:
+        super().reverse()
+        self.on_change()
 
 
 class Config(UserDict):
-    def __init__(self, categories: Dict[str, "JsonDictSaver"] = {}):
+    """
+    All config categories, one for every file in `config/default/`.
+
+    A category only gets loaded and merged with its defaults the first time it is used.
+    Its file is only written if the defaults added something to it.
+    `load_timings` has the seconds that loading each category took.
+    """
+
+    def __init__(
+        self,
+        categories: Dict[str, "JsonDictSaver"] = {},
+        default_folder: str = "config/default/",
+    ):
         super().__init__()
 
+        self.default_folder = default_folder
+        self.load_timings: Dict[str, float] = {}
+        self._category_names: Optional[List[str]] = None
+        self._reload_callbacks: List[Callable[[List[str]], Any]] = []
+
         for k, v in categories.items():
             if not isinstance(k, str) or not isinstance(v, JsonDictSaver):
                 raise TypeError(
@@ -26,30 +365,125 @@ class Config(UserDict):
 
             self[k] = v
 
-        self.save()
-
     def __setitem__(self, key: str, item: "JsonDictSaver") -> None:
         if not isinstance(key, str) or not isinstance(item, JsonDictSaver):
             raise TypeError("Key needs to be str and item needs to be JsonDictSaver")
 
         return super().__setitem__(key, item)
 
+    def __missing__(self, key: str) -> "JsonDictSaver":
+        if key not in self.category_names:
+            raise KeyError(key)
+
+        conf = self._load_category(key)
+        self[key] = conf
+
+        return conf
+
+    def _load_category(self, key: str) -> "JsonDictSaver":
+        started = time.perf_counter()
+
+        default = JsonDictSaver(key, data_type="config/default")
+        conf = JsonDictSaver(key, data_type="config")
+
+        added_keys = False
+        for k, v in default.items():
+            if k not in conf:
+                conf[k] = v
+                added_keys = True
+
+        if added_keys:
+            conf.save()
+
+        self.load_timings[key] = time.perf_counter() - started
+
+        return conf
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.data or key in self.category_names
+
+    def __iter__(self):
+        return iter(dict.fromkeys([*self.category_names, *self.data]))
+
+    def __len__(self) -> int:
+        return len(dict.fromkeys([*self.category_names, *self.data]))
+
     def __enter__(self):
         return self
 
     def __exit__(self, type, value, traceback):
         self.save()
 
+    @property
+    def category_names(self) -> List[str]:
+        if self._category_names is None:
+            self._category_names = [
+                entry.name.replace(".json", "")
+                for entry in os.scandir(self.default_folder)
+                if entry.is_file()
+            ]
+
+        return self._category_names
+
+    def reload(self, category: Optional[str] = None):
+        """
+        Reads the config files of `category` (or of every loaded one) again
+        and tells everything registered with `add_reload_callback()`.
+        """
+        self._category_names = None
+        names = [category] if category else list(self.data)
+
+        # Load everything first, so nothing ever sees half of the new config
+        reloaded = {name: self._load_category(name) for name in names}
+        self.data.update(reloaded)
+
+        for callback in self._reload_callbacks:
+            callback(names)
+
+    def add_reload_callback(self, callback: Callable[[List[str]], Any]):
+        """
+        `callback` gets called with the names of the reloaded categories after every `reload()`.
+        """
+        self._reload_callbacks.append(callback)
+
     def save(self):
-        for jds in self.values():
+        # Categories that were never loaded cant have changed
+        for jds in self.data.values():
             jds.save()
 
 
 class JsonDictSaver(UserDict):
     """
     Note: If you enter a dataclass, you manually have to convert it from type dict after loading.
+
+    With `write_behind` set to a number of seconds, `save()` only marks the data as dirty.
+    All saves within that window get coalesced into one write, which is serialized and written
+    in a worker thread so the event loop doesnt block. Use `flush()` / `flush_async()` or
+    `flush_all_savers()` to force pending data to disk.
+
+    Nested dicts and lists are stored as `TrackedDict` / `TrackedList`, so changes inside them
+    mark their top-level key as changed too. A `save()` without any changed key does no I/O at all.
+    Note that setting a dict or list stores a tracked copy, keep using it through the store.
+
+    With `storage="journal"`, a save appends one record per changed top-level key to
+    `<name>.journal` next to the normal JSON snapshot, so a save costs the size of the changed keys
+    and not the size of the whole dict. A record holds the whole value of its key, so this only helps
+    with many top-level keys, not with one big nested dict. Loading replays snapshot + journal. Once the
+    journal is bigger than `journal_compact_bytes`, it gets folded into a new snapshot in the background.
+
+    Without a `schema`, loaded values that look like numbers, dates or UUIDs are converted by guessing.
+    A `schema` (see `Schema`) declares the types instead, which is faster and never converts by accident.
+
+    `file_format="binary"` stores the snapshot as `<name>.bin`: a versioned header followed by
+    unindented JSON, which saves the time and space of the indentation. Meant for big data only the Bot
+    reads, small files that get edited by hand should stay JSON. `export_json()` and `import_json()`
+    give a human readable way in and out. Switching the format of an existing store converts its file
+    on the next start.
     """
 
+    BINARY_HEADER = b"OWBOT-DATA"
+    BINARY_VERSION = 2  # 1 was zlib compressed, which made saving and loading slower
+
     _supported_key_types = [
         str,
         int,
@@ -84,35 +518,79 @@ class JsonDictSaver(UserDict):
         data_type: Literal["data", "config", "config/default"] = "data",
         orjson_flags: List[int] = [orjson.OPT_INDENT_2],
         auto_convert_data: bool = True,
+        write_behind: Optional[float] = None,
+        storage: Literal["json", "journal"] = "json",
+        journal_compact_bytes: int = 1024 * 1024,
+        schema: Optional[Schema] = None,
+        file_format: Literal["json", "binary"] = "json",
         **kwargs,
     ) -> None:
-        super().__init__(**kwargs)
+        self.storage = storage
+        self.journal_compact_bytes = journal_compact_bytes
+        self._dirty_keys: Set[Any] = set()
+        self._change_callbacks: Dict[Any, Callable[[], None]] = {}
 
-        self.filename = f"{data_type}/{name}.json"
+        super().__init__(**kwargs)
 
-        orjson_flags.extend(
-            [
-                orjson.OPT_NON_STR_KEYS,
-            ]
+        self.file_format = file_format
+        self.filename = (
+            f"{data_type}/{name}.{'bin' if file_format == 'binary' else 'json'}"
         )
+        other_filename = (
+            f"{data_type}/{name}.{'json' if file_format == 'binary' else 'bin'}"
+        )
+        os.makedirs(data_type, exist_ok=True)
+        self.journal_filename = f"{data_type}/{name}.journal"
+        self.old_journal_filename = f"{data_type}/{name}.journal.old"
+
+        self._compacting = False
+        self._compaction_task: Optional[asyncio.Task] = None
+
+        self.write_behind = write_behind
+        self.save_requests = 0
+        self.physical_writes = 0
+        self.skipped_saves = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
         self.orjson_option = reduce(
-            lambda x, y: x | y, orjson_flags
+            lambda x, y: x | y, [*orjson_flags, orjson.OPT_NON_STR_KEYS]
         )  # Bitwise OR for every flag
 
+        if not os.path.exists(self.filename) and os.path.exists(other_filename):
+            # The format of this store was changed, convert the old file
+            self._write_file(self._encode(self._read_file(other_filename)))
+            os.replace(other_filename, f"{other_filename}.migrated")
+
         if not os.path.exists(self.filename):
-            with open(self.filename, "w+", encoding="utf-8") as f:
-                f.write(orjson.dumps(default, option=self.orjson_option).decode())
+            self._write_file(self._encode(default))
 
             if func_if_default:
                 func_if_default()
 
-        with open(self.filename, "r", encoding="utf-8") as f:
-            data = orjson.loads(f.read())
+        data = self._read_file(self.filename)
 
-        if auto_convert_data:
-            self.data = self._convert_data_to_correct_types(data)
+        if self.storage == "journal":
+            # A leftover old journal means a compaction got interrupted, it comes before the current one
+            for journal_filename in [self.old_journal_filename, self.journal_filename]:
+                self._replay_journal(journal_filename, data)
+
+        self._decode: Callable[[dict], dict]
+        if schema is not None:
+            self._decode = compile_schema(schema)
+        elif auto_convert_data:
+            self._decode = self._convert_data_to_correct_types
         else:
-            self.data = data
+            self._decode = lambda data: data
+
+        self.data = {
+            key: self._track(key, item) for key, item in self._decode(data).items()
+        }
+        self._dirty_keys.clear()
+
+        if self.write_behind is not None:
+            register_saver(self)
 
     def __enter__(self):
         return self
@@ -127,13 +605,286 @@ class JsonDictSaver(UserDict):
         if not any([isinstance(item, c) for c in self._supported_value_types]):
             raise TypeError(f"Item value '{item}' ({type(item)}) is not supported")
 
-        return super().__setitem__(key, item)
+        self.data[key] = self._track(key, item)
+        self._dirty_keys.add(key)
+
+    def __delitem__(self, key: Any) -> None:
+        del self.data[key]
+        self._dirty_keys.add(key)
+        self._change_callbacks.pop(key, None)
+
+    def mark_dirty(self, key: Any):
+        """
+        Tells the store that `self[key]` changed in a way it cant see, like an object changed in place.
+        Changes inside dicts and lists are noticed without this.
+        """
+        self._dirty_keys.add(key)
+
+    @property
+    def dirty(self) -> bool:
+        """
+        If there are changes that arent written yet.
+        """
+        return bool(self._dirty_keys)
+
+    @property
+    def coalesced_saves(self):
+        """
+        Amount of `save()` calls that didnt need their own write, because they got merged into another one.
+        """
+        return self.save_requests - self.physical_writes - self.skipped_saves
 
     def save(self):
-        with open(self.filename, "w", encoding="utf-8") as f:
-            f.write(orjson.dumps(self.data, option=self.orjson_option).decode())
+        self.save_requests += 1
+
+        if not self._dirty_keys:
+            self.skipped_saves += 1
+            return
+
+        if self.write_behind is None:
+            self._write_changes()
+            self._maybe_start_compaction()
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:  # No event loop (yet), so there is nothing to schedule on
+            self.flush()
+            return
+
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(
+                self.write_behind, self._start_scheduled_flush
+            )
+
+    def flush(self):
+        """
+        Writes pending changes right now, blocking. Meant for places without a running event loop.
+        """
+        self._cancel_scheduled_flush()
+
+        if self._dirty_keys:
+            self._write_changes()
+            self._maybe_start_compaction()
+
+    async def flush_async(self):
+        """
+        Writes pending changes without blocking the event loop.
+        """
+        self._cancel_scheduled_flush()
+
+        async with self._flush_lock:
+            if not self._dirty_keys:
+                return
+
+            dirty_keys = self._take_dirty_keys()
+            try:
+                # orjson holds the GIL while dumping, so the data cant change halfway through
+                await asyncio.to_thread(
+                    self._write_to_disk, self._journal_records(dirty_keys)
+                )
+            except BaseException:
+                # Still not on disk, so the next save writes them again
+                self._dirty_keys |= dirty_keys
+                raise
+
+        self._maybe_start_compaction()
+
+    def _start_scheduled_flush(self):
+        self._flush_handle = None
+        self._flush_task = asyncio.create_task(self.flush_async())
+        self._flush_task.add_done_callback(print_task_error)
+
+    def _cancel_scheduled_flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+    def _write_to_disk(self, journal_records: List[bytes]):
+        if self.storage == "journal":
+            if journal_records:
+                with open(self.journal_filename, "ab") as f:
+                    f.write(b"".join(journal_records))
+        else:
+            self._write_snapshot()
+
+        self.physical_writes += 1
+
+    def export_json(self) -> bytes:
+        """
+        All data as indented JSON, no matter which format the store uses.
+        """
+        return orjson.dumps(
+            self.data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+        )
+
+    def import_json(self, content: bytes):
+        """
+        Replaces all data with the JSON in `content` (like from `export_json()`) and saves.
+        """
+        data = self._decode(orjson.loads(content))
+
+        self.clear()
+        self.update(data)
+        self.save()
+
+    def _encode(self, data: dict) -> bytes:
+        if self.file_format == "binary":
+            content = orjson.dumps(
+                data, option=self.orjson_option & ~orjson.OPT_INDENT_2
+            )
+            return self.BINARY_HEADER + self.BINARY_VERSION.to_bytes(1, "big") + content
+
+        return orjson.dumps(data, option=self.orjson_option)
+
+    def _read_file(self, filename: str) -> dict:
+        with open(filename, "rb") as f:
+            content = f.read()
+
+        if content.startswith(self.BINARY_HEADER):
+            version = content[len(self.BINARY_HEADER)]
+            if version not in (1, self.BINARY_VERSION):
+                raise ValueError(f"{filename} uses unknown binary format {version}")
+
+            content = content[len(self.BINARY_HEADER) + 1 :]
+            if version == 1:  # Written again without compression on the next save
+                content = zlib.decompress(content)
+
+        return orjson.loads(content)
+
+    def _write_file(self, content: bytes):
+        tmp_filename = f"{self.filename}.tmp"
+        with open(tmp_filename, "wb") as f:
+            f.write(content)
+        os.replace(tmp_filename, self.filename)
+
+    def _write_snapshot(self):
+        self._write_file(self._encode(self.data))
+
+    def _track(self, key: Any, item: Any) -> Any:
+        if not isinstance(item, (dict, list)):
+            return item
+
+        # One callback per key, shared by every container below it
+        on_change = self._change_callbacks.get(key)
+        if on_change is None:
+            on_change = self._change_callbacks[key] = lambda: self._dirty_keys.add(key)
+
+        return track_changes(item, on_change)
+
+    def _write_changes(self):
+        dirty_keys = self._take_dirty_keys()
+        try:
+            self._write_to_disk(self._journal_records(dirty_keys))
+        except BaseException:
+            # Still not on disk, so the next save writes them again
+            self._dirty_keys |= dirty_keys
+            raise
+
+    def _take_dirty_keys(self) -> Set[Any]:
+        """
+        Marks everything as written and returns the keys that were changed.
+        If writing them fails, they have to be added back.
+        """
+        dirty_keys = self._dirty_keys
+        self._dirty_keys = set()
+        return dirty_keys
+
+    def _journal_records(self, dirty_keys: Set[Any]) -> List[bytes]:
+        """
+        The journal records for the changed keys.
+        Without journal there is nothing to return, the whole snapshot gets written anyway.
+        """
+        if self.storage != "journal":
+            return []
+
+        journal_records = []
+        for key in dirty_keys:
+            if key in self.data:
+                record = ["s", {key: self.data[key]}]
+            else:
+                record = ["d", {key: None}]
+
+            # Wrapping the key in a dict makes orjson turn it into a string exactly like in the snapshot
+            journal_records.append(
+                orjson.dumps(record, option=orjson.OPT_NON_STR_KEYS) + b"\n"
+            )
+
+        return journal_records
+
+    def _replay_journal(self, journal_filename: str, data: dict):
+        if not os.path.exists(journal_filename):
+            return
+
+        with open(journal_filename, "rb") as f:
+            content = f.read()
+
+        valid_length = 0
+        for line in content.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                break  # Torn write at the end of the file
+
+            try:
+                operation, entry = orjson.loads(line)
+                ((key, item),) = entry.items()
+            except (orjson.JSONDecodeError, ValueError, TypeError, AttributeError):
+                break
+
+            if operation == "s":
+                data[key] = item
+            elif operation == "d":
+                data.pop(key, None)
+            else:
+                break
+
+            valid_length += len(line)
+
+        if valid_length != len(content):
+            with open(journal_filename, "r+b") as f:
+                f.truncate(valid_length)
+
+    def _maybe_start_compaction(self):
+        if self.storage != "journal" or self._compacting:
+            return
+
+        if (
+            not os.path.exists(self.journal_filename)
+            or os.path.getsize(self.journal_filename) < self.journal_compact_bytes
+        ):
+            return
+
+        # New records go to a fresh journal, the old one stays until the new snapshot is in place
+        if os.path.exists(self.old_journal_filename):
+            # An earlier compaction didnt finish, its records have to stay in front of these
+            with open(self.journal_filename, "rb") as f:
+                content = f.read()
+            with open(self.old_journal_filename, "ab") as f:
+                f.write(content)
+            os.remove(self.journal_filename)
+        else:
+            os.replace(self.journal_filename, self.old_journal_filename)
+
+        self._compacting = True
 
-    def _convert_single_value_to_correct_type(self, val):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self._compact()
+        else:
+            self._compaction_task = asyncio.create_task(
+                asyncio.to_thread(self._compact)
+            )
+            self._compaction_task.add_done_callback(print_task_error)
+
+    def _compact(self):
+        try:
+            self._write_snapshot()
+            os.remove(self.old_journal_filename)
+        finally:
+            self._compacting = False
+
+    @classmethod
+    def _convert_single_value_to_correct_type(cls, val):
         if isinstance(val, str):
             if val.isnumeric():
                 val = int(val)
@@ -167,37 +918,21 @@ class JsonDictSaver(UserDict):
 
         return val
 
-    def _convert_data_to_correct_types(self, data: dict):
+    @classmethod
+    def _convert_data_to_correct_types(cls, data: dict):
         new_data = {}
 
         for key, sub_data in data.items():
             if isinstance(sub_data, dict):
-                sub_data = self._convert_data_to_correct_types(sub_data)
+                sub_data = cls._convert_data_to_correct_types(sub_data)
             else:
-                sub_data = self._convert_single_value_to_correct_type(sub_data)
+                sub_data = cls._convert_single_value_to_correct_type(sub_data)
 
-            new_data[self._convert_single_value_to_correct_type(key)] = sub_data
+            new_data[cls._convert_single_value_to_correct_type(key)] = sub_data
 
         return new_data
 
 
-categories = {}
-for entry in os.scandir("config/default/"):
-    if entry.is_file():
-        category_name = entry.name.replace(".json", "")
-
-        default = JsonDictSaver(category_name, data_type="config/default")
-        conf = JsonDictSaver(category_name, data_type="config")
-
-        for k, v in default.items():
-            if k not in conf:
-                conf[k] = v
-
-        conf.save()
-        categories[category_name] = conf
-
-        del default
-
-CONFIG = Config(categories)
+CONFIG = Config()
 
-del categories
+IMPORT_SECONDS = time.perf_counter() - _import_started
@@ -0,0 +1,581 @@
+import asyncio
+import datetime
+import os
+import sqlite3
+import time
+from collections.abc import MutableMapping
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import orjson
+
+from internal_tools.configuration import (
+    DictDecoder,
+    JsonDictSaver,
+    Schema,
+    compile_schema,
+    register_saver,
+    track_changes,
+    unregister_saver,
+)
+
+__all__ = [
+    "CachedResponse",
+    "ResponseCache",
+    "SqliteDictSaver",
+    "SqliteNamespace",
+    "migrate_json_to_sqlite",
+]
+
+_PAGE_SIZE = 500
+
+
+def _encode(item: Any):
+    return orjson.dumps(item, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _guess_types(item: Any):
+    if isinstance(item, dict):
+        return JsonDictSaver._convert_data_to_correct_types(item)
+
+    return JsonDictSaver._convert_single_value_to_correct_type(item)
+
+
+def _value_decoders(schema: Optional[Schema]):
+    if schema is None:
+        return None
+
+    decoder = compile_schema(schema)
+    if not isinstance(decoder, DictDecoder):
+        raise TypeError("Schema for a SqliteDictSaver or namespace needs to be a dict")
+
+    return decoder.value_decoder
+
+
+def _to_epoch(item: Any) -> Optional[int]:
+    if isinstance(item, datetime.datetime):
+        if item.tzinfo is None:  # The Bot saves naive UTC times
+            item = item.replace(tzinfo=datetime.timezone.utc)
+
+        return int(item.timestamp())
+
+    return None
+
+
+class SqliteNamespace(MutableMapping):
+    """
+    Dict-like view on all entries of one namespace inside a `SqliteDictSaver`.
+    Nothing is kept in memory, every access is a (indexed) query.
+
+    Dicts and lists are handed out as `TrackedDict` / `TrackedList`. Once one gets changed, it is kept
+    (and returned by later lookups) until the next commit writes it back.
+    """
+
+    _supported_key_types = [str, int]
+
+    def __init__(
+        self,
+        saver: "SqliteDictSaver",
+        namespace: str,
+        value_decoder: Optional[Callable[[Any], Callable[[Any], Any]]] = None,
+    ):
+        self.saver = saver
+        self.namespace = namespace
+        self.value_decoder = value_decoder
+        self._changed_items: Dict[Any, Any] = {}
+
+    def _decode(self, key: Any, raw: bytes):
+        if self.value_decoder is None:
+            item = _guess_types(orjson.loads(raw))
+        else:
+            item = self.value_decoder(key)(orjson.loads(raw))
+
+        if not isinstance(item, (dict, list)):
+            return item
+
+        tracked = None
+
+        def on_change():
+            self._changed_items[key] = tracked
+
+        tracked = track_changes(item, on_change)
+        return tracked
+
+    def __getitem__(self, key: Any) -> Any:
+        if key in self._changed_items:
+            return self._changed_items[key]
+
+        row = self.saver.connection.execute(
+            "SELECT value FROM entries WHERE namespace = ? AND key = ?",
+            (self.namespace, key),
+        ).fetchone()
+        if row is None:
+            raise KeyError(key)
+
+        return self._decode(key, row[0])
+
+    def __setitem__(self, key: Any, item: Any) -> None:
+        if not any([isinstance(key, c) for c in self._supported_key_types]):
+            raise TypeError(f"Key value '{key}' ({type(key)}) is not supported")
+
+        if not any([isinstance(item, c) for c in JsonDictSaver._supported_value_types]):
+            raise TypeError(f"Item value '{item}' ({type(item)}) is not supported")
+
+        self._changed_items.pop(key, None)
+        self.saver.connection.execute(
+            "INSERT OR REPLACE INTO entries (namespace, key, value, due) VALUES (?, ?, ?, ?)",
+            (self.namespace, key, _encode(item), _to_epoch(item)),
+        )
+
+    def __delitem__(self, key: Any) -> None:
+        self._changed_items.pop(key, None)
+        cursor = self.saver.connection.execute(
+            "DELETE FROM entries WHERE namespace = ? AND key = ?",
+            (self.namespace, key),
+        )
+        if cursor.rowcount == 0:
+            raise KeyError(key)
+
+    def __contains__(self, key: object) -> bool:
+        return (
+            self.saver.connection.execute(
+                "SELECT 1 FROM entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+            is not None
+        )
+
+    def __len__(self) -> int:
+        return self.saver.connection.execute(
+            "SELECT COUNT(*) FROM entries WHERE namespace = ?", (self.namespace,)
+        ).fetchone()[0]
+
+    def __iter__(self) -> Iterator[Any]:
+        for (key,) in self._iter_rows("key"):
+            yield key
+
+    def items(self) -> Iterator[Tuple[Any, Any]]:  # type: ignore
+        for key, raw in self._iter_rows("key, value"):
+            if key in self._changed_items:
+                yield key, self._changed_items[key]
+            else:
+                yield key, self._decode(key, raw)
+
+    def clear(self) -> None:
+        self._changed_items.clear()
+        self.saver.connection.execute(
+            "DELETE FROM entries WHERE namespace = ?", (self.namespace,)
+        )
+
+    def keys_with_time_before(
+        self, moment: datetime.datetime, limit: int = -1
+    ) -> List[Any]:
+        """
+        Keys of all entries whose value is a datetime before `moment`, oldest first.
+        At most `limit` of them, if it is given.
+        """
+        return [
+            row[0]
+            for row in self.saver.connection.execute(
+                "SELECT key FROM entries WHERE namespace = ? AND due < ? ORDER BY due LIMIT ?",
+                (self.namespace, _to_epoch(moment), limit),
+            )
+        ]
+
+    def write_changed_items(self):
+        """
+        Writes every handed out dict / list that got changed since into the current transaction.
+        """
+        changed_items = self._changed_items
+        self._changed_items = {}
+
+        self.saver.connection.executemany(
+            "UPDATE entries SET value = ? WHERE namespace = ? AND key = ?",
+            [
+                (_encode(item), self.namespace, key)
+                for key, item in changed_items.items()
+            ],
+        )
+
+    def count_with_time_before(self, moment: datetime.datetime) -> int:
+        """
+        Amount of entries whose value is a datetime before `moment`.
+        """
+        return self.saver.connection.execute(
+            "SELECT COUNT(*) FROM entries WHERE namespace = ? AND due < ?",
+            (self.namespace, _to_epoch(moment)),
+        ).fetchone()[0]
+
+    def _iter_rows(self, columns: str):
+        """
+        Pages through the namespace by key, so changes made while iterating dont break anything
+        and only one page is in memory at a time.
+        """
+        rows = self.saver.connection.execute(
+            f"SELECT {columns} FROM entries WHERE namespace = ? ORDER BY key LIMIT ?",
+            (self.namespace, _PAGE_SIZE),
+        ).fetchall()
+
+        while rows:
+            yield from rows
+
+            if len(rows) < _PAGE_SIZE:
+                return
+
+            rows = self.saver.connection.execute(
+                f"SELECT {columns} FROM entries WHERE namespace = ? AND key > ? ORDER BY key LIMIT ?",
+                (self.namespace, rows[-1][0], _PAGE_SIZE),
+            ).fetchall()
+
+
+class SqliteDictSaver(SqliteNamespace):
+    """
+    Drop in replacement for `JsonDictSaver` that keeps its data in `data/<name>.sqlite3` instead of memory.
+
+    Changes are collected in a transaction and committed by `save()`, so many changes followed by one
+    `save()` are one batched write. `write_behind` coalesces commits like it does for `JsonDictSaver`.
+    A `save()` without changes doesnt touch the database.
+
+    Keys listed in `namespaces` are not single entries, but return a `SqliteNamespace`, which allows
+    things like `saver["AUTOMATIC_ROLES"][user_id] = datetime` without loading the rest of that dict.
+
+    If the database doesnt exist yet, but `data/<name>.json` does, that file gets migrated once.
+
+    Keys keep their type in SQLite. Values are decoded with `schema` (see `Schema`) if there is one,
+    otherwise their types are guessed like `JsonDictSaver` does it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        default: dict = {},
+        namespaces: List[str] = [],
+        write_behind: Optional[float] = None,
+        schema: Optional[Dict[Any, Schema]] = None,
+    ) -> None:
+        super().__init__(self, "", _value_decoders(schema))
+
+        self.filename = f"data/{name}.sqlite3"
+        self.schema = schema
+        self.namespaces = {
+            namespace: SqliteNamespace(
+                self,
+                namespace,
+                _value_decoders(schema.get(namespace) if schema is not None else None),
+            )
+            for namespace in namespaces
+        }
+
+        self.write_behind = write_behind
+        self.save_requests = 0
+        self.physical_writes = 0
+        self.skipped_saves = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+        os.makedirs("data", exist_ok=True)
+        is_new = not os.path.exists(self.filename)
+
+        self.connection = sqlite3.connect(self.filename)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "namespace TEXT NOT NULL, key NOT NULL, value BLOB NOT NULL, due INTEGER, "
+            "PRIMARY KEY (namespace, key))"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS entries_due ON entries (namespace, due)"
+        )
+        self.connection.commit()
+
+        if is_new:
+            if os.path.exists(f"data/{name}.json"):
+                migrate_json_to_sqlite(self, name)
+            else:
+                self.update(default)
+                self._commit()
+
+        register_saver(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.save()
+
+    def __getitem__(self, key: Any) -> Any:
+        if key in self.namespaces:
+            return self.namespaces[key]
+
+        return super().__getitem__(key)
+
+    def __setitem__(self, key: Any, item: Any) -> None:
+        if key in self.namespaces:
+            if not isinstance(item, dict):
+                raise TypeError(f"Namespace '{key}' can only be set to a dict")
+
+            self.namespaces[key].clear()
+            self.namespaces[key].update(item)
+            return
+
+        super().__setitem__(key, item)
+
+    def __delitem__(self, key: Any) -> None:
+        if key in self.namespaces:
+            self.namespaces[key].clear()
+            return
+
+        super().__delitem__(key)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.namespaces or super().__contains__(key)
+
+    @property
+    def dirty(self) -> bool:
+        """
+        If there are changes that arent committed yet.
+        """
+        return self.connection.in_transaction or any(
+            [namespace._changed_items for namespace in self._all_namespaces()]
+        )
+
+    @property
+    def coalesced_saves(self):
+        """
+        Amount of `save()` calls that didnt need their own commit, because they got merged into another one.
+        """
+        return self.save_requests - self.physical_writes - self.skipped_saves
+
+    def save(self):
+        self.save_requests += 1
+
+        if not self.dirty:
+            self.skipped_saves += 1
+            return
+
+        if self.write_behind is None:
+            self._commit()
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:  # No event loop (yet), so there is nothing to schedule on
+            self.flush()
+            return
+
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.write_behind, self.flush)
+
+    def flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        self._commit()
+
+    async def flush_async(self):
+        self.flush()
+
+    def export_json(self) -> bytes:
+        """
+        All data as indented JSON, with every namespace as a nested dict.
+        """
+        data = dict(self.items())
+        for name, namespace in self.namespaces.items():
+            data[name] = dict(namespace.items())
+
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+
+    def import_json(self, content: bytes):
+        """
+        Replaces all data with the JSON in `content` (like from `export_json()`) and saves.
+        """
+        data = orjson.loads(content)
+        if self.schema is not None:
+            data = compile_schema(self.schema)(data)
+        else:
+            data = JsonDictSaver._convert_data_to_correct_types(data)
+
+        for namespace in self._all_namespaces():
+            namespace._changed_items.clear()
+        self.connection.execute("DELETE FROM entries")
+        self.update(data)
+        self.save()
+
+    def close(self):
+        self.flush()
+        unregister_saver(self)
+        self.connection.close()
+
+    def _all_namespaces(self) -> List[SqliteNamespace]:
+        return [self, *self.namespaces.values()]
+
+    def _commit(self):
+        for namespace in self._all_namespaces():
+            if namespace._changed_items:
+                namespace.write_changed_items()
+
+        if self.connection.in_transaction:
+            self.connection.commit()
+            self.physical_writes += 1
+
+
+def migrate_json_to_sqlite(saver: SqliteDictSaver, name: str):
+    """
+    One shot import of `data/<name>.json` (including a journal, if there is one) into `saver`.
+    The old files get renamed to `*.migrated` afterwards, so this never runs twice.
+    """
+    json_saver = JsonDictSaver(name, storage="journal", schema=saver.schema)
+
+    rows = []
+    for key, item in json_saver.items():
+        if key in saver.namespaces and isinstance(item, dict):
+            for sub_key, sub_item in item.items():
+                rows.append((key, sub_key, _encode(sub_item), _to_epoch(sub_item)))
+        else:
+            rows.append(("", key, _encode(item), _to_epoch(item)))
+
+    saver.connection.executemany(
+        "INSERT OR REPLACE INTO entries (namespace, key, value, due) VALUES (?, ?, ?, ?)",
+        rows,
+    )
+    saver.connection.commit()
+
+    for filename in [
+        json_saver.filename,
+        json_saver.journal_filename,
+        json_saver.old_journal_filename,
+    ]:
+        if os.path.exists(filename):
+            os.replace(filename, f"{filename}.migrated")
+
+
+@dataclass(frozen=True, slots=True)
+class CachedResponse:
+    body: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+
+    @property
+    def age_seconds(self) -> float:
+        return time.time() - self.fetched_at
+
+
+class ResponseCache:
+    """
+    HTTP responses kept in `data/<name>.sqlite3`, so they survive restarts.
+
+    Which responses are fresh enough is up to the caller, this only stores them with their
+    validators (ETag / Last-Modified) and the time they were fetched. Once all bodies together
+    are bigger than `max_bytes`, the least recently used ones get removed.
+    """
+
+    def __init__(self, name: str, max_bytes: int):
+        self.filename = f"data/{name}.sqlite3"
+        self.max_bytes = max_bytes
+        self.evictions = 0
+
+        os.makedirs("data", exist_ok=True)
+
+        # Autocommit, every change is a single small statement anyway
+        self.connection = sqlite3.connect(self.filename, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, body BLOB NOT NULL, etag TEXT, last_modified TEXT, "
+            "fetched_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)"
+        )
+
+        self.total_bytes: int = self.connection.execute(
+            "SELECT COALESCE(SUM(LENGTH(body)), 0) FROM responses"
+        ).fetchone()[0]
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        row = self.connection.execute(
+            "SELECT body, etag, last_modified, fetched_at FROM responses WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None
+
+        self.connection.execute(
+            "UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key)
+        )
+
+        return CachedResponse(*row)
+
+    def put(
+        self,
+        key: str,
+        body: bytes,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ) -> CachedResponse:
+        now = time.time()
+
+        old_row = self.connection.execute(
+            "SELECT LENGTH(body) FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if old_row is not None:
+            self.total_bytes -= old_row[0]
+
+        self.connection.execute(
+            "INSERT OR REPLACE INTO responses (key, body, etag, last_modified, fetched_at, last_used) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, body, etag, last_modified, now, now),
+        )
+        self.total_bytes += len(body)
+
+        self._evict()
+
+        return CachedResponse(body, etag, last_modified, now)
+
+    def mark_fresh(self, key: str):
+        """
+        For when the server confirmed that the cached response is still up to date (304).
+        """
+        now = time.time()
+        self.connection.execute(
+            "UPDATE responses SET fetched_at = ?, last_used = ? WHERE key = ?",
+            (now, now, key),
+        )
+
+    def remove(self, key: str):
+        row = self.connection.execute(
+            "SELECT LENGTH(body) FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is not None:
+            self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.total_bytes -= row[0]
+
+    def close(self):
+        self.connection.close()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes:
+            rows = self.connection.execute(
+                "SELECT key, LENGTH(body) FROM responses ORDER BY last_used LIMIT ?",
+                (_PAGE_SIZE,),
+            ).fetchall()
+            if not rows:
+                self.total_bytes = 0
+                return
+
+            keys = []
+            for key, size in rows:
+                if self.total_bytes <= self.max_bytes:
+                    break
+
+                keys.append((key,))
+                self.total_bytes -= size
+
+            self.connection.executemany("DELETE FROM responses WHERE key = ?", keys)
+            self.evictions += len(keys)
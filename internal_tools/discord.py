@@ -3,7 +3,7 @@ from typing import List, Optional, Union
 
 import nextcord
 
-from internal_tools.configuration import CONFIG
+from internal_tools.config_snapshots import SNAPSHOTS
 
 __all__ = ["fancy_embed", "GetOrFetch", "CatalogView"]
 
@@ -12,7 +12,7 @@ def CONFIG_EMBED_COLOR():
     """
     Function to give color from the config back
     """
-    return nextcord.Colour(int(CONFIG["GENERAL"]["EMBED_COLOR"].replace("#", ""), 16))
+    return nextcord.Colour(SNAPSHOTS.general.embed_color)
 
 
 class CatalogView(nextcord.ui.View):
@@ -1,10 +1,10 @@
 import traceback
 from typing import Union
 
-import aiohttp
 import nextcord
 
 from internal_tools.configuration import CONFIG
+from internal_tools.http import HTTP_CLIENT
 
 
 async def error_webhook_send(txt_or_error: Union[str, Exception]):
@@ -13,9 +13,8 @@ async def error_webhook_send(txt_or_error: Union[str, Exception]):
         txt_or_error = f"Unpredicted Error:\n```\n{error_text}\n```"
 
     if CONFIG["GENERAL"]["ERROR_WEBHOOK_URL"]:
-        async with aiohttp.ClientSession() as session:
-            webhook = nextcord.Webhook.from_url(
-                CONFIG["GENERAL"]["ERROR_WEBHOOK_URL"], session=session
-            )
+        webhook = nextcord.Webhook.from_url(
+            CONFIG["GENERAL"]["ERROR_WEBHOOK_URL"], session=HTTP_CLIENT.session
+        )
 
-            await webhook.send(txt_or_error)
\ No newline at end of file
+        await webhook.send(txt_or_error)
\ No newline at end of file
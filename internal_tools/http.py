@@ -0,0 +1,164 @@
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Optional
+
+import aiohttp
+
+from internal_tools.configuration import CONFIG
+
+__all__ = ["HTTP_CLIENT", "HttpClient", "HttpPoolStats"]
+
+
+@dataclass(frozen=True, slots=True)
+class HttpPoolStats:
+    open_connections: int
+    idle_connections: int
+    requests: int
+    new_connections: int
+    reused_connections: int
+    waits_for_free_connection: int
+    total_wait_seconds: float
+    max_wait_seconds: float
+
+    @property
+    def reuse_ratio(self) -> float:
+        """
+        Share of connections that came out of the pool instead of being opened.
+        """
+        connections = self.new_connections + self.reused_connections
+        return self.reused_connections / connections if connections else 0.0
+
+    @property
+    def average_wait_seconds(self) -> float:
+        if not self.waits_for_free_connection:
+            return 0.0
+
+        return self.total_wait_seconds / self.waits_for_free_connection
+
+    def format(self) -> str:
+        return "\n".join(
+            [
+                f"Open connections: {self.open_connections} ({self.idle_connections} idle)",
+                f"Requests: {self.requests}",
+                f"New connections: {self.new_connections}",
+                f"Reused connections: {self.reused_connections} ({self.reuse_ratio:.0%})",
+                f"Waits for a free connection: {self.waits_for_free_connection}",
+                f"Average wait: {self.average_wait_seconds * 1000:.1f} ms",
+                f"Longest wait: {self.max_wait_seconds * 1000:.1f} ms",
+            ]
+        )
+
+
+class HttpClient:
+    """
+    The one `aiohttp.ClientSession` the whole Bot uses for outgoing HTTP, so keep-alive connections
+    (to ow-api.com, webhooks, ...) get reused instead of paying TCP + TLS setup for every request.
+
+    Pool size, DNS cache and timeouts come from the GENERAL config. `start()` is called on startup
+    and `close()` on shutdown by `bot.py`, if `session` is used before that, it starts on its own.
+    """
+
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+
+        self._requests = 0
+        self._new_connections = 0
+        self._reused_connections = 0
+        self._waits = 0
+        self._total_wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self.start()
+
+        return self._session  # type: ignore
+
+    def start(self):
+        """
+        Creates the session. Needs a running event loop.
+        """
+        if self._session is not None and not self._session.closed:
+            return
+
+        conf = CONFIG["GENERAL"]
+
+        connector = aiohttp.TCPConnector(
+            limit=conf["HTTP_MAX_CONNECTIONS"],
+            limit_per_host=conf["HTTP_MAX_CONNECTIONS_PER_HOST"],
+            ttl_dns_cache=conf["HTTP_DNS_CACHE_SECONDS"],
+            keepalive_timeout=conf["HTTP_KEEPALIVE_SECONDS"],
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=conf["HTTP_TIMEOUT_SECONDS"],
+            connect=conf["HTTP_CONNECT_TIMEOUT_SECONDS"],
+        )
+
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            trace_configs=[self._trace_config()],
+        )
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def stats(self) -> HttpPoolStats:
+        open_connections = 0
+        idle_connections = 0
+
+        if self._session is not None and not self._session.closed:
+            # aiohttp has no public API for this
+            connector = self._session.connector
+            idle_connections = sum(
+                [len(conns) for conns in connector._conns.values()]  # type: ignore
+            )
+            open_connections = len(connector._acquired) + idle_connections  # type: ignore
+
+        return HttpPoolStats(
+            open_connections=open_connections,
+            idle_connections=idle_connections,
+            requests=self._requests,
+            new_connections=self._new_connections,
+            reused_connections=self._reused_connections,
+            waits_for_free_connection=self._waits,
+            total_wait_seconds=self._total_wait_seconds,
+            max_wait_seconds=self._max_wait_seconds,
+        )
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, context: SimpleNamespace, params):
+            self._requests += 1
+
+        async def on_connection_queued_start(session, context: SimpleNamespace, params):
+            context.queued_at = time.perf_counter()
+
+        async def on_connection_queued_end(session, context: SimpleNamespace, params):
+            wait_seconds = time.perf_counter() - context.queued_at
+
+            self._waits += 1
+            self._total_wait_seconds += wait_seconds
+            self._max_wait_seconds = max(self._max_wait_seconds, wait_seconds)
+
+        async def on_connection_create_end(session, context: SimpleNamespace, params):
+            self._new_connections += 1
+
+        async def on_connection_reuseconn(session, context: SimpleNamespace, params):
+            self._reused_connections += 1
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_queued_start.append(on_connection_queued_start)
+        trace_config.on_connection_queued_end.append(on_connection_queued_end)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+
+        return trace_config
+
+
+HTTP_CLIENT = HttpClient()
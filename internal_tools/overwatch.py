@@ -0,0 +1,214 @@
+import asyncio
+import time
+from typing import Any, Optional
+
+import aiohttp
+import orjson
+
+from internal_tools.concurrency import CircuitBreaker, SingleFlight, TokenBucket
+from internal_tools.database import CachedResponse, ResponseCache
+from internal_tools.http import HttpClient
+
+__all__ = ["OverwatchApi", "profile_url"]
+
+API_BASE_URL = "https://ow-api.com/v3"
+
+
+def profile_url(
+    platform: str,
+    account_name: str,
+    document: str = "complete",
+    base_url: str = API_BASE_URL,
+) -> str:
+    """
+    `document` is "complete" for the whole Career Profile, or "profile" for just the summary.
+    """
+    return f"{base_url}/stats/{platform}/{account_name.replace('#', '-')}/{document}"
+
+
+class OverwatchApi:
+    """
+    Client for the ow-api.com Career Profiles, with a persistent cache in front of it.
+
+    A cached profile younger than `ttl_seconds` is returned without asking the API.
+    Up to `stale_seconds` after that it is still returned right away, but refreshed in the background.
+    Older ones are fetched again, as a conditional request if the API gave an ETag or Last-Modified.
+    A private profile is only kept for `private_ttl_seconds` and never returned stale, so someone who
+    just made theirs public doesnt have to wait for the cache.
+    All requests wait for `rate_limit`, and there is never more than one request for the same
+    profile at a time, others asking for it wait for that one.
+    While `breaker` is open no requests are made, only cached profiles are returned.
+
+    The summary (`summary` / `is_private`) is a small fraction of the complete profile, so it is
+    the cheap way to find out if a profile is private before asking for all of it.
+    """
+
+    def __init__(
+        self,
+        http: HttpClient,
+        cache: ResponseCache,
+        rate_limit: TokenBucket,
+        breaker: CircuitBreaker,
+        ttl_seconds: float,
+        stale_seconds: float,
+        private_ttl_seconds: float,
+        base_url: str = API_BASE_URL,
+    ):
+        self.http = http
+        self.cache = cache
+        self.rate_limit = rate_limit
+        self.breaker = breaker
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.private_ttl_seconds = private_ttl_seconds
+        self.base_url = base_url
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.requests = 0
+        self.summary_requests = 0
+
+        self.in_flight = SingleFlight()
+
+    async def profile(self, platform: str, account_name: str) -> Optional[dict]:
+        """
+        The complete Career Profile as returned by the API, or None if it couldnt be fetched.
+        """
+        return await self._document(platform, account_name, "complete")
+
+    async def summary(self, platform: str, account_name: str) -> Optional[dict]:
+        """
+        Only the summary of the Career Profile (name, level, ratings, "private"), or None.
+        """
+        return await self._document(platform, account_name, "profile")
+
+    async def is_private(self, platform: str, account_name: str) -> Optional[bool]:
+        """
+        If the Career Profile is private according to its summary, None if that isnt known.
+        """
+        data = await self.summary(platform, account_name)
+        if data is None or data.get("error") is not None or "private" not in data:
+            return None
+
+        return bool(data["private"])
+
+    async def _document(
+        self, platform: str, account_name: str, document: str
+    ) -> Optional[dict]:
+        key = (platform, account_name, document)
+        url = profile_url(platform, account_name, document, self.base_url)
+        cached = self.cache.get(url)
+
+        if cached is not None:
+            age = cached.age_seconds
+            data = orjson.loads(cached.body)
+
+            if data.get("private"):
+                ttl_seconds, stale_seconds = self.private_ttl_seconds, 0.0
+            else:
+                ttl_seconds, stale_seconds = self.ttl_seconds, self.stale_seconds
+
+            if age < ttl_seconds:
+                self.hits += 1
+                return data
+
+            if age < ttl_seconds + stale_seconds:
+                self.stale_hits += 1
+                if key not in self.in_flight:
+                    self.in_flight.start(key, lambda: self._fetch(url, cached))
+
+                return data
+
+        self.misses += 1
+        response = await self.in_flight.run(key, lambda: self._fetch(url, cached))
+        if response is None:
+            return None
+
+        return orjson.loads(response.body)
+
+    async def _fetch(
+        self, url: str, cached: Optional[CachedResponse]
+    ) -> Optional[CachedResponse]:
+        headers = {}
+        if cached is not None:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+
+        # The token first, so waiting for it cant hold the only probe of a half-open breaker
+        await self.rate_limit.acquire()
+        if not self.breaker.allow():
+            return None
+
+        self.requests += 1
+        if not url.endswith("/complete"):
+            self.summary_requests += 1
+
+        # Every way out records one outcome, a probe without one would keep the breaker half-open forever
+        failure: Optional[str] = None
+        try:
+            async with self.http.session.get(url, headers=headers) as resp:
+                if resp.status == 304 and cached is not None:
+                    self.not_modified += 1
+                    self.cache.mark_fresh(url)
+                    return cached
+
+                # Anything else that isnt ok is about this one profile, the API itself works
+                if resp.status >= 500 or resp.status == 429:
+                    failure = f"HTTP {resp.status}"
+                    return None
+                if not resp.ok:
+                    return None
+
+                body = await resp.read()
+                etag = resp.headers.get("ETag")
+                last_modified = resp.headers.get("Last-Modified")
+
+            try:
+                data: Any = orjson.loads(body)
+            except orjson.JSONDecodeError:
+                failure = "Invalid JSON"
+                return None
+
+            # Errors are given to the caller, but not worth keeping
+            if not isinstance(data, dict) or data.get("error") is not None:
+                error = data.get("error") if isinstance(data, dict) else "Not an object"
+                failure = f"API Error: {error}"
+                return CachedResponse(body, etag, last_modified, time.time())
+
+            return self.cache.put(url, body, etag, last_modified)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            failure = type(e).__name__
+            return None
+        except BaseException as e:  # Cancelled, or a bug
+            failure = type(e).__name__
+            raise
+        finally:
+            if failure is None:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure(failure)
+
+    def format_stats(self) -> str:
+        lookups = self.hits + self.stale_hits + self.misses
+        hit_ratio = (self.hits + self.stale_hits) / lookups if lookups else 0.0
+
+        return "\n".join(
+            [
+                f"Cached profiles: {len(self.cache)} ({self.cache.total_bytes / 1024 / 1024:.1f} MiB)",
+                f"Fresh hits: {self.hits}",
+                f"Stale hits: {self.stale_hits}",
+                f"Misses: {self.misses}",
+                f"Hit ratio: {hit_ratio:.0%}",
+                f"Requests to the API: {self.requests} ({self.summary_requests} for summaries)",
+                f"Not modified (304): {self.not_modified}",
+                f"Coalesced requests: {self.in_flight.coalesced}",
+                f"Evictions: {self.cache.evictions}",
+                "",
+                "Circuit breaker:",
+                self.breaker.format_summary(),
+            ]
+        )
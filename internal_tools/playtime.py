@@ -0,0 +1,114 @@
+import heapq
+from dataclasses import dataclass, field
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from internal_tools.config_snapshots import HeroSnapshot
+
+__all__ = [
+    "GAMEMODES",
+    "Playtime",
+    "RoleOutcome",
+    "aggregate_playtime",
+    "parse_time_played",
+    "pick_roles",
+    "playtime_from_seconds",
+]
+
+GAMEMODES = ("competitiveStats", "quickPlayStats")
+
+
+@dataclass(slots=True)
+class Playtime:
+    api_hero_seconds: Dict[str, int] = field(default_factory=dict)
+    hero_seconds: Dict[str, int] = field(default_factory=dict)
+    class_seconds: Dict[str, int] = field(default_factory=dict)
+    unknown_api_heroes: List[str] = field(default_factory=list)
+
+
+@dataclass(frozen=True, slots=True)
+class RoleOutcome:
+    main_hero: str
+    top_3_heroes: Tuple[str, ...]
+    most_played_class: str
+
+
+def parse_time_played(raw_time: str) -> Optional[int]:
+    """
+    "MM:SS" or "HH:MM:SS" from the API in seconds, None if it is neither.
+    """
+    parts = raw_time.split(":")
+    if len(parts) == 2:
+        return int(parts[0]) * 60 + int(parts[1])
+    if len(parts) == 3:
+        return int(parts[0]) * 3600 + int(parts[1]) * 60 + int(parts[2])
+
+    return None
+
+
+def aggregate_playtime(
+    data: dict, heroes_by_api_name: Mapping[str, HeroSnapshot]
+) -> Optional[Playtime]:
+    """
+    Sums up the playtime per hero and per class over all gamemodes of a Career Profile.
+    Heroes the config doesnt know are listed in `unknown_api_heroes` and only kept in `api_hero_seconds`.
+    Returns None if a playtime cant be read.
+    """
+    api_hero_seconds: Dict[str, int] = {}
+
+    for gamemode in GAMEMODES:
+        for api_hero, stats in data[gamemode]["careerStats"].items():
+            if api_hero == "allHeroes":
+                continue
+
+            seconds = parse_time_played(stats["game"]["timePlayed"])
+            if seconds is None:
+                if api_hero not in heroes_by_api_name:
+                    continue
+                return None
+
+            api_hero_seconds[api_hero] = api_hero_seconds.get(api_hero, 0) + seconds
+
+    return playtime_from_seconds(api_hero_seconds, heroes_by_api_name)
+
+
+def playtime_from_seconds(
+    api_hero_seconds: Mapping[str, int], heroes_by_api_name: Mapping[str, HeroSnapshot]
+) -> Playtime:
+    """
+    The playtime per hero and per class from the seconds per API hero name, like a `PlaytimeStore` keeps them.
+    """
+    playtime = Playtime(api_hero_seconds=dict(api_hero_seconds))
+    hero_seconds = playtime.hero_seconds
+    class_seconds = playtime.class_seconds
+
+    for api_hero, seconds in api_hero_seconds.items():
+        hero = heroes_by_api_name.get(api_hero)
+        if hero is None:
+            playtime.unknown_api_heroes.append(api_hero)
+            continue
+
+        hero_seconds[hero.name] = hero_seconds.get(hero.name, 0) + seconds
+        class_seconds[hero.hero_class] = class_seconds.get(hero.hero_class, 0) + seconds
+
+    return playtime
+
+
+def pick_roles(playtime: Playtime) -> Optional[RoleOutcome]:
+    """
+    Most played hero, the 3 after it and the most played class. None without any playtime.
+    On equal playtime, the hero / class that came first in the API data (or store row) wins.
+    """
+    if not playtime.hero_seconds or not playtime.class_seconds:
+        return None
+
+    hero_seconds = playtime.hero_seconds
+    class_seconds = playtime.class_seconds
+
+    # nlargest is stable, so ties are decided like with max()
+    top_heroes = heapq.nlargest(4, hero_seconds, key=hero_seconds.__getitem__)
+
+    return RoleOutcome(
+        main_hero=top_heroes[0],
+        top_3_heroes=tuple(top_heroes[1:]),
+        most_played_class=max(class_seconds, key=class_seconds.__getitem__),
+    )
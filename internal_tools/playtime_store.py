@@ -0,0 +1,525 @@
+import asyncio
+import bisect
+import datetime
+import mmap
+import os
+import struct
+import time
+from array import array
+from typing import Dict, Iterator, List, Literal, Mapping, Optional, Sequence, Tuple
+
+import orjson
+
+from internal_tools.config_snapshots import HeroSnapshot
+from internal_tools.configuration import (
+    print_task_error,
+    register_saver,
+    unregister_saver,
+)
+from internal_tools.timestamps import from_epoch
+
+__all__ = ["PlaytimeSnapshot", "PlaytimeStore", "playtime_report"]
+
+_MAGIC = b"PTv1"
+_HEADER_LENGTH = struct.Struct("<I")
+_ALIGNMENT = 8
+
+
+class PlaytimeColumns:
+    """
+    Seconds played per hero for every user, one `array` column per API hero name and one row per user,
+    with the user ids sorted in `ids`.
+
+    The sum and the number of players of every column are kept in `column_seconds` / `column_players`,
+    so server-wide questions dont have to go over the users at all.
+    """
+
+    def __init__(self):
+        self.ids = array("q")
+        self.columns: Dict[str, array] = {}
+        self.column_seconds: Dict[str, int] = {}
+        self.column_players: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, user_id: object) -> bool:
+        return isinstance(user_id, int) and self._index(user_id) != -1
+
+    def _index(self, user_id: int) -> int:
+        index = bisect.bisect_left(self.ids, user_id)
+        if index < len(self.ids) and self.ids[index] == user_id:
+            return index
+
+        return -1
+
+    def get(self, user_id: int) -> Optional[Dict[str, int]]:
+        """
+        Seconds per API hero name of one user, in column order and without the heroes they never played.
+        """
+        index = self._index(user_id)
+        if index == -1:
+            return None
+
+        return {
+            api_name: column[index]
+            for api_name, column in self.columns.items()
+            if column[index]
+        }
+
+    def rows(self) -> Iterator[Tuple[int, Tuple[int, ...]]]:
+        """
+        (user id, seconds in column order) for every user.
+        """
+        return zip(self.ids, zip(*self.columns.values()))
+
+    def gained_since(self, snapshot: "PlaytimeColumns") -> Dict[str, int]:
+        """
+        Seconds played per hero since `snapshot`, by the users that are in both.
+        The difference of the column sums, minus the rows of the few users that were only in one of them.
+        """
+        if len(self.ids) == len(snapshot.ids) and memoryview(self.ids) == snapshot.ids:
+            only_now = only_before = []
+        else:
+            ids = set(self.ids)
+            snapshot_ids = set(snapshot.ids)
+            only_now = [self._index(user_id) for user_id in ids - snapshot_ids]
+            only_before = [snapshot._index(user_id) for user_id in snapshot_ids - ids]
+
+        gained = {}
+        for api_name, column in self.columns.items():
+            seconds = self.column_seconds[api_name]
+            seconds -= sum([column[i] for i in only_now])
+
+            before = snapshot.columns.get(api_name)
+            if before is not None:
+                seconds -= snapshot.column_seconds[api_name]
+                seconds += sum([before[i] for i in only_before])
+
+            gained[api_name] = seconds
+
+        return gained
+
+
+class PlaytimeSnapshot(PlaytimeColumns):
+    """
+    Read only copy of a `PlaytimeStore` from `taken_at` (epoch seconds), memory mapped from its file,
+    so only the rows that are looked at are read, and the history doesnt take memory.
+    """
+
+    def __init__(self, filename: str):
+        super().__init__()
+        self.filename = filename
+
+        with open(filename, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header = _read_header(self._mmap)
+        self.taken_at: int = header["taken_at"]
+
+        # Every view has to be released before the mmap can be closed
+        self._buffer = memoryview(self._mmap)
+        self._views: List[memoryview] = []
+        offset = self._mmap.tell()
+        count = header["rows"]
+
+        self.ids = self._view(offset, count, "q")  # type: ignore
+        offset += count * 8
+        for api_name, seconds, players in header["columns"]:
+            self.columns[api_name] = self._view(offset, count, "I")  # type: ignore
+            self.column_seconds[api_name] = seconds
+            self.column_players[api_name] = players
+            offset += count * 4
+
+    def _view(self, offset: int, count: int, typecode: Literal["q", "I"]) -> memoryview:
+        part = self._buffer[offset : offset + count * array(typecode).itemsize]
+        view = part.cast(typecode)
+        self._views += [part, view]
+
+        return view
+
+    def close(self):
+        self.ids = array("q")
+        self.columns = {}
+        for view in self._views:
+            view.release()
+        self._views.clear()
+        self._buffer.release()
+        self._mmap.close()
+
+
+class PlaytimeStore(PlaytimeColumns):
+    """
+    The playtime of every linked account, saved in `data/<name>.playtime`, with the columns
+    of `api_names` (the heroes of the config, in its order) first and heroes the config doesnt know
+    (yet) after them, so they dont have to be fetched again once they are added.
+
+    `snapshot_if_due()` keeps a copy every `snapshot_every` in `data/<name>_history/`,
+    the last `keep_snapshots` of them are kept for trends.
+    With `write_behind`, `save()` only schedules a write that many seconds later, like the other savers.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        api_names: Sequence[str],
+        snapshot_every: datetime.timedelta,
+        keep_snapshots: int,
+        write_behind: Optional[float] = None,
+    ):
+        super().__init__()
+        self.filename = f"data/{name}.playtime"
+        self.history_folder = f"data/{name}_history"
+        self.snapshot_every = int(snapshot_every.total_seconds())
+        self.keep_snapshots = keep_snapshots
+        self.write_behind = write_behind
+
+        self.physical_writes = 0
+        self._dirty = False
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._snapshots: Dict[str, PlaytimeSnapshot] = {}
+
+        for api_name in api_names:
+            self._add_column(api_name)
+
+        os.makedirs(self.history_folder, exist_ok=True)
+        if os.path.exists(self.filename):
+            self._load()
+
+        register_saver(self)
+
+    def __setitem__(self, user_id: int, api_hero_seconds: Mapping[str, int]):
+        """
+        Replaces the row of `user_id`, new heroes get a new column.
+        """
+        for api_name in api_hero_seconds:
+            if api_name not in self.columns:
+                self._add_column(api_name)
+
+        index = bisect.bisect_left(self.ids, user_id)
+        if index == len(self.ids) or self.ids[index] != user_id:
+            self.ids.insert(index, user_id)
+            for column in self.columns.values():
+                column.insert(index, 0)
+
+        for api_name, column in self.columns.items():
+            old_seconds = column[index]
+            seconds = api_hero_seconds.get(api_name, 0)
+            if seconds != old_seconds:
+                column[index] = seconds
+                self.column_seconds[api_name] += seconds - old_seconds
+                self.column_players[api_name] += bool(seconds) - bool(old_seconds)
+
+        self._dirty = True
+
+    def pop(self, user_id: int) -> Optional[Dict[str, int]]:
+        row = self.get(user_id)
+        if row is None:
+            return None
+
+        index = self._index(user_id)
+        del self.ids[index]
+        for column in self.columns.values():
+            del column[index]
+
+        for api_name, seconds in row.items():
+            self.column_seconds[api_name] -= seconds
+            self.column_players[api_name] -= 1
+
+        self._dirty = True
+        return row
+
+    def _add_column(self, api_name: str):
+        self.columns[api_name] = array("I", bytes(len(self.ids) * 4))
+        self.column_seconds[api_name] = 0
+        self.column_players[api_name] = 0
+
+    @property
+    def dirty(self) -> bool:
+        return self._dirty
+
+    def save(self):
+        if not self._dirty:
+            return
+
+        if self.write_behind is None:
+            self.flush()
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:  # No event loop (yet), so there is nothing to schedule on
+            self.flush()
+            return
+
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(
+                self.write_behind, self._start_scheduled_flush
+            )
+
+    def flush(self):
+        """
+        Writes pending changes right now, blocking. Meant for places without a running event loop.
+        """
+        self._cancel_scheduled_flush()
+
+        if not self._dirty:
+            return
+
+        _write_file(self.filename, self._encode(int(time.time())))
+        self._dirty = False
+        self.physical_writes += 1
+
+    async def flush_async(self):
+        """
+        Writes pending changes without blocking the event loop,
+        only copying the arrays happens on it, writing them in a thread.
+        """
+        self._cancel_scheduled_flush()
+
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+
+            chunks = self._encode(int(time.time()))
+            # Changes while writing make it dirty again, they arent in `chunks`
+            self._dirty = False
+            try:
+                await asyncio.to_thread(_write_file, self.filename, chunks)
+            except BaseException:
+                self._dirty = True
+                raise
+
+            self.physical_writes += 1
+
+    def _start_scheduled_flush(self):
+        self._flush_handle = None
+        self._flush_task = asyncio.create_task(self.flush_async())
+        self._flush_task.add_done_callback(print_task_error)
+
+    def _cancel_scheduled_flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+    def close(self):
+        self.flush()
+        unregister_saver(self)
+        for snapshot in self._snapshots.values():
+            snapshot.close()
+        self._snapshots.clear()
+
+    def snapshots(self) -> List[PlaytimeSnapshot]:
+        """
+        The kept snapshots, the oldest first.
+        """
+        filenames = sorted(
+            entry.name
+            for entry in os.scandir(self.history_folder)
+            if entry.name.endswith(".playtime")
+        )
+        for filename in list(self._snapshots):
+            if filename not in filenames:
+                self._snapshots.pop(filename).close()
+
+        for filename in filenames:
+            if filename not in self._snapshots:
+                self._snapshots[filename] = PlaytimeSnapshot(
+                    os.path.join(self.history_folder, filename)
+                )
+
+        return [self._snapshots[filename] for filename in filenames]
+
+    def snapshot_if_due(self) -> bool:
+        """
+        Takes a snapshot if the last one is `snapshot_every` old, and removes the ones that arent kept anymore.
+        Returns if one was taken.
+        """
+        now = int(time.time())
+        if not self._snapshot_due(now):
+            return False
+
+        _write_file(self._snapshot_filename(now), self._encode(now))
+        self._remove_old_snapshots()
+        return True
+
+    async def snapshot_if_due_async(self) -> bool:
+        """
+        Like `snapshot_if_due()`, with the file written in a thread.
+        """
+        now = int(time.time())
+        if not self._snapshot_due(now):
+            return False
+
+        await asyncio.to_thread(
+            _write_file, self._snapshot_filename(now), self._encode(now)
+        )
+        self._remove_old_snapshots()
+        return True
+
+    def _snapshot_due(self, now: int) -> bool:
+        snapshots = self.snapshots()
+        return not snapshots or now - snapshots[-1].taken_at >= self.snapshot_every
+
+    def _snapshot_filename(self, taken_at: int) -> str:
+        # Named after the time, padded, so they sort in order
+        return os.path.join(self.history_folder, f"{taken_at:012}.playtime")
+
+    def _remove_old_snapshots(self):
+        snapshots = self.snapshots()
+        for snapshot in snapshots[: max(len(snapshots) - self.keep_snapshots, 0)]:
+            snapshot.close()
+            os.remove(snapshot.filename)
+        self.snapshots()
+
+    def export_json(self) -> bytes:
+        """
+        Seconds per API hero name of every user as indented JSON.
+        """
+        data = {user_id: self.get(user_id) for user_id in self.ids}
+
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+
+    def import_json(self, content: bytes):
+        """
+        Replaces all data with the JSON in `content` (like from `export_json()`) and saves.
+        """
+        data = {
+            int(user_id): api_hero_seconds
+            for user_id, api_hero_seconds in orjson.loads(content).items()
+        }
+
+        self.ids = array("q")
+        for api_name in list(self.columns):
+            self._add_column(api_name)
+        for user_id in sorted(data):
+            self[user_id] = data[user_id]
+
+        self._dirty = True
+        self.save()
+
+    def _encode(self, taken_at: int) -> List[bytes]:
+        """
+        The file content in pieces, copied from the arrays, so it can be written while they change.
+        """
+        header = orjson.dumps(
+            {
+                "rows": len(self.ids),
+                "taken_at": taken_at,
+                "columns": [
+                    [
+                        api_name,
+                        self.column_seconds[api_name],
+                        self.column_players[api_name],
+                    ]
+                    for api_name in self.columns
+                ],
+            }
+        )
+        # The arrays start at a multiple of 8, so the snapshots can map them as they are
+        padding = -(len(_MAGIC) + _HEADER_LENGTH.size + len(header)) % _ALIGNMENT
+
+        return [
+            _MAGIC,
+            _HEADER_LENGTH.pack(len(header) + padding),
+            header + b" " * padding,
+            self.ids.tobytes(),
+            *[column.tobytes() for column in self.columns.values()],
+        ]
+
+    def _load(self):
+        with open(self.filename, "rb") as f:
+            header = _read_header(f)
+
+            count = header["rows"]
+            self.ids.fromfile(f, count)
+
+            # Columns are found by name, so changes to the order of the heroes in the config dont matter
+            for api_name, seconds, players in header["columns"]:
+                self.columns[api_name] = array("I")
+                self.columns[api_name].fromfile(f, count)
+                self.column_seconds[api_name] = seconds
+                self.column_players[api_name] = players
+
+        for api_name, column in self.columns.items():
+            if len(column) != count:  # A hero that is new in the config
+                self.columns[api_name] = array("I", bytes(count * 4))
+
+
+def _write_file(filename: str, chunks: List[bytes]):
+    tmp_filename = f"{filename}.tmp"
+    with open(tmp_filename, "wb") as f:
+        f.writelines(chunks)
+
+    os.replace(tmp_filename, filename)
+
+
+def _read_header(f) -> dict:
+    """
+    Reads the header from a file or mmap, which is left at the start of the arrays.
+    """
+    if f.read(len(_MAGIC)) != _MAGIC:
+        raise ValueError("Not a playtime file")
+
+    (length,) = _HEADER_LENGTH.unpack(f.read(_HEADER_LENGTH.size))
+    return orjson.loads(f.read(length))
+
+
+def playtime_report(
+    store: PlaytimeStore,
+    heroes_by_api_name: Mapping[str, HeroSnapshot],
+    since: Optional[PlaytimeSnapshot] = None,
+) -> str:
+    """
+    Most played heroes and classes over everyone in `store`, and what was played since the snapshot `since`.
+    """
+    totals = store.column_seconds
+    players = store.column_players
+    all_seconds = sum(totals.values()) or 1
+
+    def hero_name(api_name: str) -> str:
+        hero = heroes_by_api_name.get(api_name)
+        return hero.name if hero is not None else f"{api_name} (unknown)"
+
+    lines = [f"Accounts with playtime: {len(store)}", "", "Heroes by playtime:"]
+    for api_name in sorted(totals, key=totals.__getitem__, reverse=True):
+        lines.append(
+            f"  {hero_name(api_name):<30} {totals[api_name] // 3600:>9} h"
+            f" {totals[api_name] / all_seconds:6.1%}, played by {players[api_name]}"
+        )
+
+    class_seconds: Dict[str, int] = {}
+    for api_name, seconds in totals.items():
+        hero = heroes_by_api_name.get(api_name)
+        hero_class = hero.hero_class if hero is not None else "Unknown"
+        class_seconds[hero_class] = class_seconds.get(hero_class, 0) + seconds
+
+    lines += ["", "Classes by playtime:"]
+    for hero_class in sorted(
+        class_seconds, key=class_seconds.__getitem__, reverse=True
+    ):
+        lines.append(
+            f"  {hero_class:<30} {class_seconds[hero_class] // 3600:>9} h"
+            f" {class_seconds[hero_class] / all_seconds:6.1%}"
+        )
+
+    if since is not None:
+        gained = store.gained_since(since)
+        gained_seconds = sum(gained.values())
+
+        lines += ["", f"Played since {from_epoch(since.taken_at):%Y-%m-%d}:"]
+        if gained_seconds <= 0:
+            lines.append("  nothing")
+            gained = {}
+
+        for api_name in sorted(gained, key=gained.__getitem__, reverse=True):
+            share_now = gained[api_name] / gained_seconds
+            share_before = totals[api_name] / all_seconds
+            lines.append(
+                f"  {hero_name(api_name):<30} {gained[api_name] // 3600:>9} h"
+                f" {share_now:6.1%} ({share_now - share_before:+.1%} against all time)"
+            )
+
+    return "\n".join(lines)
@@ -0,0 +1,304 @@
+import datetime
+import time
+from typing import Dict, Iterable, List, Optional
+
+from internal_tools.concurrency import RefreshResult
+from internal_tools.database import SqliteDictSaver
+from internal_tools.timestamps import TimestampStore, to_epoch
+
+__all__ = [
+    "SCHEDULE_NAMESPACES",
+    "SCHEDULE_SCHEMA",
+    "RefreshScheduler",
+    "ReminderSchedule",
+]
+
+SCHEDULE_NAMESPACES = ["NEXT_DUE", "INTERVALS", "LAST_REFRESHED", "PRIVATE_SINCE"]
+SCHEDULE_SCHEMA = {
+    "NEXT_DUE": {int: datetime.datetime},
+    "INTERVALS": {int: int},
+    "LAST_REFRESHED": {int: datetime.datetime},
+    "PRIVATE_SINCE": {int: datetime.datetime},
+}
+
+_ACTIVITY_COOLDOWN_SECONDS = 300
+
+_AGE_BUCKETS = [
+    ("< 1 hour", datetime.timedelta(hours=1)),
+    ("< 12 hours", datetime.timedelta(hours=12)),
+    ("< 1 day", datetime.timedelta(days=1)),
+    ("< 3 days", datetime.timedelta(days=3)),
+    ("< 7 days", datetime.timedelta(days=7)),
+    ("< 30 days", datetime.timedelta(days=30)),
+]
+
+
+def _due_limit() -> datetime.datetime:
+    # Times are stored in whole seconds, so something due this second would otherwise have to wait for the next run
+    return datetime.datetime.utcnow() + datetime.timedelta(seconds=1)
+
+
+class RefreshScheduler:
+    """
+    Persistent priority queue of linked accounts, ordered by the time they are due for a refresh.
+    Lives in a `SqliteDictSaver` with `SCHEDULE_NAMESPACES`, so it continues where it was after a restart.
+
+    The queue itself is the cursor of the sweep over all accounts: a refreshed account moves to the back,
+    so after a restart or an error the accounts that werent reached yet are still the first ones due.
+
+    Every account has its own interval. It is reset to `interval` when its roles changed and grows by
+    `backoff_factor` (up to `max_interval`) every time they didnt, so players whose stats stay the same
+    get checked less and less. Newly linked accounts are due right away, and players who are active on
+    the server are moved up once their last refresh is older than `active_after`, but never to sooner
+    than `interval` after it, so activity undoes the backoff instead of refreshing them more often.
+
+    Accounts with a private Career Profile back off faster, by `private_backoff_factor` per pass,
+    and are remembered in PRIVATE_SINCE until a refresh sees the profile public again,
+    which starts them over at `interval`.
+    """
+
+    def __init__(
+        self,
+        store: SqliteDictSaver,
+        interval: datetime.timedelta,
+        max_interval: datetime.timedelta,
+        backoff_factor: float,
+        private_backoff_factor: float,
+        active_after: datetime.timedelta,
+    ):
+        self.store = store
+        self.interval = interval
+        self.max_interval = max_interval
+        self.backoff_factor = backoff_factor
+        self.private_backoff_factor = private_backoff_factor
+        self.active_after = active_after
+
+        self.next_due = store["NEXT_DUE"]
+        self.intervals = store["INTERVALS"]
+        self.last_refreshed = store["LAST_REFRESHED"]
+        self.private_since = store["PRIVATE_SINCE"]
+
+        self.activity_bumps = 0
+        self._activity_checked: Dict[int, float] = {}
+
+    def __len__(self) -> int:
+        return len(self.next_due)
+
+    def add(self, user_id: int):
+        """
+        Puts a (newly linked) account at the front of the queue.
+        """
+        self.next_due[user_id] = datetime.datetime.utcnow()
+        self.intervals[user_id] = int(self.interval.total_seconds())
+        self.private_since.pop(user_id, None)
+        self.store.save()
+
+    def remove(self, user_id: int):
+        for namespace in [
+            self.next_due,
+            self.intervals,
+            self.last_refreshed,
+            self.private_since,
+        ]:
+            namespace.pop(user_id, None)
+        self.store.save()
+
+    def sync(self, user_ids: Iterable[int]):
+        """
+        Adds every account in `user_ids` that isnt in the queue yet.
+        """
+        now = datetime.datetime.utcnow()
+        for user_id in user_ids:
+            if user_id not in self.next_due:
+                self.next_due[user_id] = now
+                self.intervals[user_id] = int(self.interval.total_seconds())
+
+        self.store.save()
+
+    def due(self, limit: int) -> List[int]:
+        """
+        Up to `limit` accounts whose refresh is due, the most overdue first.
+        """
+        return self.next_due.keys_with_time_before(_due_limit(), limit)
+
+    def record(self, user_id: int, result: str):
+        """
+        Schedules the next refresh of an account after one finished with `result` (a `RefreshResult`).
+        """
+        now = datetime.datetime.utcnow()
+        interval = datetime.timedelta(
+            seconds=self.intervals.get(user_id, self.interval.total_seconds())
+        )
+
+        # A profile that turns public again belongs to someone who cares about it again
+        if result == RefreshResult.DONE or (
+            result == RefreshResult.UNCHANGED and user_id in self.private_since
+        ):
+            interval = self.interval
+        elif result == RefreshResult.PRIVATE:
+            interval = min(interval * self.private_backoff_factor, self.max_interval)
+        elif result != RefreshResult.FAILED:
+            interval = min(interval * self.backoff_factor, self.max_interval)
+
+        if result == RefreshResult.PRIVATE:
+            if user_id not in self.private_since:
+                self.private_since[user_id] = now
+        elif result in (RefreshResult.DONE, RefreshResult.UNCHANGED):
+            self.private_since.pop(user_id, None)
+
+        if result != RefreshResult.FAILED:
+            self.last_refreshed[user_id] = now
+
+        self.intervals[user_id] = int(interval.total_seconds())
+        self.next_due[user_id] = now + interval
+        self.store.save()
+
+    def seen_private(self, user_id: int) -> bool:
+        """
+        If the last refresh of this account found its Career Profile private.
+        """
+        return user_id in self.private_since
+
+    def coverage_report(self, linked_accounts: int) -> str:
+        """
+        How many of the `linked_accounts` were ever refreshed, how long ago and how many are overdue.
+        """
+        now = datetime.datetime.utcnow()
+        refreshed = len(self.last_refreshed)
+        coverage = refreshed / linked_accounts if linked_accounts else 0.0
+
+        lines = [
+            f"Linked accounts: {linked_accounts}",
+            f"Refreshed at least once: {refreshed} ({coverage:.0%})",
+            f"Due now: {self.next_due.count_with_time_before(_due_limit())}",
+            f"Scheduled: {len(self.next_due)}",
+            f"Private: {len(self.private_since)}",
+            "",
+            "Time since the last refresh:",
+        ]
+
+        # Counting everything older than each bucket gives the bucket sizes as differences
+        older_than = [
+            self.last_refreshed.count_with_time_before(now - age)
+            for _, age in _AGE_BUCKETS
+        ]
+        previous = refreshed
+        for (label, _), older in zip(_AGE_BUCKETS, older_than):
+            lines.append(f"  {label}: {previous - older}")
+            previous = older
+        lines.append(f"  older: {previous}")
+        lines.append(f"  never: {max(linked_accounts - refreshed, 0)}")
+
+        return "\n".join(lines)
+
+    def mark_active(self, user_id: int) -> bool:
+        """
+        Moves an account up if it wasnt refreshed for `active_after` (and at least `interval`).
+        Cheap to call for every message, the database is only asked once every few minutes per user.
+        Returns if the account was moved.
+        """
+        now = time.monotonic()
+        checked_at = self._activity_checked.get(user_id)
+        if checked_at is not None and now - checked_at < _ACTIVITY_COOLDOWN_SECONDS:
+            return False
+
+        if len(self._activity_checked) > 10_000:
+            self._activity_checked.clear()
+        self._activity_checked[user_id] = now
+
+        next_due: Optional[datetime.datetime] = self.next_due.get(user_id)
+        if next_due is None:
+            return False
+
+        utcnow = datetime.datetime.utcnow()
+        last_refreshed = self.last_refreshed.get(user_id)
+        if last_refreshed is not None:
+            due = max(last_refreshed + max(self.active_after, self.interval), utcnow)
+        else:
+            due = utcnow
+
+        if due >= next_due:
+            return False
+
+        self.next_due[user_id] = due
+        self.store.save()
+        self.activity_bumps += 1
+
+        return True
+
+
+class ReminderSchedule:
+    """
+    When every member without a linked account gets reminded next, as an index on the due time,
+    so a run only looks at the members that are due instead of all of them.
+
+    Lives in the REMIND_AT table next to AUTOMATIC_ROLES (when someone was reminded last) of a
+    `TimestampStore`, and has to be kept up to date with `add` / `remove` when members join, leave,
+    link or unlink. `sync` fixes whatever was missed while the bot was offline.
+    """
+
+    def __init__(
+        self,
+        store: TimestampStore,
+        remind_every: datetime.timedelta,
+        retry_after: datetime.timedelta,
+    ):
+        self.store = store
+        self.remind_every = int(remind_every.total_seconds())
+        self.retry_after = int(retry_after.total_seconds())
+
+        self.remind_at = store["REMIND_AT"]
+        self.last_reminded = store["AUTOMATIC_ROLES"]
+
+    def __len__(self) -> int:
+        return len(self.remind_at)
+
+    def _first_reminder(self, user_id: int, now: int) -> int:
+        last_reminded = self.last_reminded.get(user_id)
+        if last_reminded is None:
+            return now
+
+        return max(last_reminded + self.remind_every, now)
+
+    def add(self, user_id: int, not_before: Optional[datetime.datetime] = None):
+        if user_id not in self.remind_at:
+            due = self._first_reminder(user_id, int(time.time()))
+            if not_before is not None:
+                due = max(due, to_epoch(not_before))
+
+            self.remind_at[user_id] = due
+            self.store.save()
+
+    def remove(self, user_id: int, save: bool = True):
+        if self.remind_at.pop(user_id) is not None and save:
+            self.store.save()
+
+    def sync(self, user_ids: Iterable[int]):
+        """
+        Makes `user_ids` the members that get reminded, keeping the due times of those already in.
+        """
+        now = int(time.time())
+        self.remind_at.update_all(
+            {
+                user_id: self.remind_at.get(user_id)
+                or self._first_reminder(user_id, now)
+                for user_id in set(user_ids)
+            }
+        )
+        self.store.save()
+
+    def due(self, limit: int) -> List[int]:
+        # <= now, like `_due_limit` does it for the refresh
+        return self.remind_at.keys_before(int(time.time()) + 1, limit)
+
+    def reminded(self, user_id: int, sent: bool):
+        """
+        Schedules the next reminder, `remind_every` after a sent one, `retry_after` if it couldnt be sent.
+        Doesnt save, so a whole batch can be saved at once.
+        """
+        now = int(time.time())
+        if sent:
+            self.last_reminded[user_id] = now
+            self.remind_at[user_id] = now + self.remind_every
+        else:
+            self.remind_at[user_id] = now + self.retry_after
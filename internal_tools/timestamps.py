@@ -0,0 +1,360 @@
+import asyncio
+import bisect
+import datetime
+import os
+import sqlite3
+import struct
+from array import array
+from typing import Dict, Iterator, List, Optional
+
+import orjson
+
+from internal_tools.configuration import (
+    JsonDictSaver,
+    register_saver,
+    unregister_saver,
+)
+
+__all__ = ["TimestampStore", "TimestampTable", "to_epoch", "from_epoch"]
+
+_MAGIC = b"TSv1"
+_HEADER = struct.Struct("<H")  # Length of the table name
+_COUNT = struct.Struct("<q")
+
+
+def to_epoch(moment: datetime.datetime) -> int:
+    if moment.tzinfo is None:  # The Bot uses naive UTC times
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+
+    return int(moment.timestamp())
+
+
+def from_epoch(epoch: int) -> datetime.datetime:
+    """
+    Naive UTC, like `datetime.datetime.utcnow()`.
+    """
+    return datetime.datetime.fromtimestamp(epoch, datetime.timezone.utc).replace(
+        tzinfo=None
+    )
+
+
+class TimestampTable:
+    """
+    Dict-like table of user id -> epoch seconds, kept in `array`s instead of Python objects:
+    `ids` / `epochs` sorted by user id for lookups, and `due_epochs` / `due_ids` sorted by time,
+    as an index for the "who is due" questions, which then are a binary search and a slice.
+    That is 32 bytes per entry, where a dict of `datetime`s takes around 90.
+    """
+
+    __slots__ = ("store", "ids", "epochs", "due_epochs", "due_ids")
+
+    def __init__(self, store: Optional["TimestampStore"] = None):
+        self.store = store
+        self.ids = array("q")
+        self.epochs = array("q")
+        self.due_epochs = array("q")
+        self.due_ids = array("q")
+
+    def _index(self, user_id: int) -> int:
+        index = bisect.bisect_left(self.ids, user_id)
+        if index < len(self.ids) and self.ids[index] == user_id:
+            return index
+
+        return -1
+
+    def _unindex(self, user_id: int, epoch: int):
+        start = bisect.bisect_left(self.due_epochs, epoch)
+        end = bisect.bisect_right(self.due_epochs, epoch, start)
+        due_index = self.due_ids.index(user_id, start, end)
+        del self.due_epochs[due_index]
+        del self.due_ids[due_index]
+
+    def _reindex(self):
+        order = sorted(range(len(self.ids)), key=self.epochs.__getitem__)
+        self.due_epochs = array("q", [self.epochs[i] for i in order])
+        self.due_ids = array("q", [self.ids[i] for i in order])
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.ids)
+
+    def __contains__(self, user_id: object) -> bool:
+        return isinstance(user_id, int) and self._index(user_id) != -1
+
+    def __getitem__(self, user_id: int) -> int:
+        index = self._index(user_id)
+        if index == -1:
+            raise KeyError(user_id)
+
+        return self.epochs[index]
+
+    def get(self, user_id: int, default: Optional[int] = None) -> Optional[int]:
+        index = self._index(user_id)
+        return self.epochs[index] if index != -1 else default
+
+    def __setitem__(self, user_id: int, epoch: int) -> None:
+        index = bisect.bisect_left(self.ids, user_id)
+        if index < len(self.ids) and self.ids[index] == user_id:
+            if self.epochs[index] == epoch:
+                return
+
+            self._unindex(user_id, self.epochs[index])
+            self.epochs[index] = epoch
+        else:
+            self.ids.insert(index, user_id)
+            self.epochs.insert(index, epoch)
+
+        due_index = bisect.bisect_right(self.due_epochs, epoch)
+        self.due_epochs.insert(due_index, epoch)
+        self.due_ids.insert(due_index, user_id)
+        self._changed()
+
+    def __delitem__(self, user_id: int) -> None:
+        if self.pop(user_id) is None:
+            raise KeyError(user_id)
+
+    def pop(self, user_id: int, default: Optional[int] = None) -> Optional[int]:
+        index = self._index(user_id)
+        if index == -1:
+            return default
+
+        epoch = self.epochs[index]
+        del self.ids[index]
+        del self.epochs[index]
+        self._unindex(user_id, epoch)
+        self._changed()
+
+        return epoch
+
+    def columns(self) -> List[array]:
+        return [self.ids, self.epochs, self.due_epochs, self.due_ids]
+
+    def items(self) -> Iterator:
+        return zip(self.ids, self.epochs)
+
+    def clear(self) -> None:
+        self.update_all({})
+
+    def update_all(self, entries: Dict[int, int]) -> None:
+        """
+        Replaces everything with `entries` in one go, instead of one sorted insert per entry.
+        """
+        ordered = sorted(entries.items())
+        self.ids = array("q", [user_id for user_id, _ in ordered])
+        self.epochs = array("q", [epoch for _, epoch in ordered])
+        self._reindex()
+        self._changed()
+
+    def keys_before(self, epoch: int, limit: int = -1) -> List[int]:
+        """
+        Every user id with a time before `epoch`, the earliest first. Up to `limit`, if it isnt -1.
+        """
+        end = bisect.bisect_left(self.due_epochs, epoch)
+        if limit != -1:
+            end = min(end, limit)
+
+        return self.due_ids[:end].tolist()
+
+    def count_before(self, epoch: int) -> int:
+        return bisect.bisect_left(self.due_epochs, epoch)
+
+    def _changed(self):
+        if self.store is not None:
+            self.store.mark_dirty()
+
+
+class TimestampStore:
+    """
+    A few `TimestampTable`s saved together in `data/<name>.timestamps`, as raw arrays,
+    so loading and saving are a single read / write of 32 bytes per entry, time index included.
+
+    With `write_behind`, `save()` only schedules a write that many seconds later, like the other savers.
+    If the file doesnt exist yet but `data/<name>.sqlite3` or `data/<name>.json` (from before SQLite) does,
+    its namespaces get migrated once.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        tables: List[str],
+        write_behind: Optional[float] = None,
+    ):
+        self.filename = f"data/{name}.timestamps"
+        self.write_behind = write_behind
+        self.tables = {table: TimestampTable(self) for table in tables}
+
+        self.physical_writes = 0
+        self._dirty = False
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+        os.makedirs("data", exist_ok=True)
+        if os.path.exists(self.filename):
+            self._load()
+        elif os.path.exists(f"data/{name}.sqlite3"):
+            self._migrate_from_sqlite(name)
+        elif os.path.exists(f"data/{name}.json"):
+            self._migrate_from_json(name)
+
+        register_saver(self)
+
+    def __getitem__(self, table: str) -> TimestampTable:
+        return self.tables[table]
+
+    def __contains__(self, table: object) -> bool:
+        return table in self.tables
+
+    @property
+    def dirty(self) -> bool:
+        return self._dirty
+
+    def mark_dirty(self):
+        self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+
+        if self.write_behind is None:
+            self.flush()
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:  # No event loop (yet), so there is nothing to schedule on
+            self.flush()
+            return
+
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.write_behind, self.flush)
+
+    def flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        if not self._dirty:
+            return
+
+        tmp_filename = f"{self.filename}.tmp"
+        with open(tmp_filename, "wb") as f:
+            f.write(_MAGIC)
+            for name, table in self.tables.items():
+                encoded_name = name.encode()
+                f.write(_HEADER.pack(len(encoded_name)))
+                f.write(encoded_name)
+                f.write(_COUNT.pack(len(table)))
+                for column in table.columns():
+                    column.tofile(f)
+
+        os.replace(tmp_filename, self.filename)
+        self._dirty = False
+        self.physical_writes += 1
+
+    async def flush_async(self):
+        self.flush()
+
+    def close(self):
+        self.flush()
+        unregister_saver(self)
+
+    def export_json(self) -> bytes:
+        """
+        All tables as indented JSON with ISO times, in the format the notifications always had.
+        """
+        data = {
+            name: {
+                user_id: from_epoch(epoch).isoformat()
+                for user_id, epoch in table.items()
+            }
+            for name, table in self.tables.items()
+        }
+
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+
+    def import_json(self, content: bytes):
+        """
+        Replaces all data with the JSON in `content` (like from `export_json()`) and saves.
+        """
+        data = orjson.loads(content)
+        for name, table in self.tables.items():
+            table.update_all(
+                {
+                    int(user_id): to_epoch(datetime.datetime.fromisoformat(moment))
+                    for user_id, moment in data.get(name, {}).items()
+                }
+            )
+
+        self.save()
+
+    def _load(self):
+        with open(self.filename, "rb") as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(f"{self.filename} is not a timestamp file")
+
+            while header := f.read(_HEADER.size):
+                name = f.read(_HEADER.unpack(header)[0]).decode()
+                (count,) = _COUNT.unpack(f.read(_COUNT.size))
+
+                table = self.tables.get(name)
+                if table is None:  # A table that isnt used anymore
+                    f.seek(count * 32, os.SEEK_CUR)
+                    continue
+
+                for column in table.columns():
+                    column.fromfile(f, count)
+
+    def _migrate_from_sqlite(self, name: str):
+        # The due column of the SqliteDictSaver entries already has the times as epoch seconds
+        connection = sqlite3.connect(f"data/{name}.sqlite3")
+        try:
+            for table_name, table in self.tables.items():
+                table.update_all(
+                    dict(
+                        connection.execute(
+                            "SELECT key, due FROM entries WHERE namespace = ? AND due IS NOT NULL",
+                            (table_name,),
+                        )
+                    )
+                )
+        finally:
+            connection.close()
+
+        self.flush()
+        self._rename_migrated(
+            [
+                f"data/{name}.{suffix}"
+                for suffix in ["sqlite3", "sqlite3-wal", "sqlite3-shm"]
+            ]
+        )
+
+    def _migrate_from_json(self, name: str):
+        # Journal included, like `migrate_json_to_sqlite` does it
+        json_saver = JsonDictSaver(
+            name,
+            storage="journal",
+            schema={table_name: {int: datetime.datetime} for table_name in self.tables},
+        )
+        for table_name, table in self.tables.items():
+            table.update_all(
+                {
+                    user_id: to_epoch(moment)
+                    for user_id, moment in json_saver.get(table_name, {}).items()
+                }
+            )
+
+        self.mark_dirty()
+        self.flush()
+        self._rename_migrated(
+            [
+                json_saver.filename,
+                json_saver.journal_filename,
+                json_saver.old_journal_filename,
+            ]
+        )
+
+    def _rename_migrated(self, filenames: List[str]):
+        for filename in filenames:
+            if os.path.exists(filename):
+                os.replace(filename, f"{filename}.migrated")